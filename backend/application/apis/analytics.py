@@ -1,8 +1,14 @@
 from flask import jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..models import Users, Subjects, Chapters, Quizzes, Questions, Scores
+from ..models import (Users, Subjects, Chapters, Quizzes, Questions, Scores, DailyQuizActivity,
+                      DailyActivity, DailyRegistrations, UserStats, UserSubjectStats)
 from ..database import db
-from ..cache import cache_with_expiry
+from ..cache import cache_response, caller_tags
+from ..rollups import active_users, get_platform_averages
+from ..user_stats import get_user_stats
+from ..leaderboards import SCOPES as LEADERBOARD_SCOPES, get_leaderboard
+from ..sketches import HyperLogLog
+from ..timeseries import platform_series, user_series
 from sqlalchemy import func, and_, or_
 from datetime import datetime, timedelta, date
 import logging
@@ -13,7 +19,7 @@ def create_analytics_routes(app):
     
     @app.route('/api/analytics/summary-charts', methods=['GET'])
     @jwt_required()
-    @cache_with_expiry(expiry_seconds=600, key_prefix="summary_charts")
+    @cache_response("summary_charts", expiry_seconds=600, policy='admin_shared', tags=caller_tags)
     def get_summary_charts():
         """
         Get comprehensive summary charts data for dashboard
@@ -98,56 +104,43 @@ def create_analytics_routes(app):
                     'error': 'USER_NOT_FOUND'
                 }), 404
             
-            # Get top performers data (exclude admin users)
-            performers = db.session.query(
-                Users.id,
-                Users.username,
-                func.count(Scores.id).label('total_quizzes'),
-                func.avg(Scores.percentage).label('avg_score'),
-                func.count(func.nullif(Scores.passed, False)).label('passed_quizzes')
-            ).join(Scores, Users.id == Scores.user_id, isouter=True)\
-             .filter(Users.is_admin == False)\
-             .group_by(Users.id, Users.username)\
-             .order_by(func.avg(Scores.percentage).desc().nulls_last())\
-             .all()
+            limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            
+            # Ranked page of the global leaderboard (non-admin users by average score)
+            board = get_leaderboard('global', offset=offset, limit=limit, user_id=current_user.id, neighbours=0)
+            details = get_leaderboard_details([entry['user_id'] for entry in board['entries']] + [current_user.id])
             
-            # Process data for frontend
             leaderboard_data = []
-            for idx, perf in enumerate(performers):
-                # Calculate pass rate
-                total_quizzes = perf.total_quizzes or 0
-                pass_rate = (perf.passed_quizzes / total_quizzes * 100) if total_quizzes > 0 else 0
-                
-                # Check if this is the current user
-                is_current_user = (perf.id == current_user.id)
-                
-                # Add to leaderboard data
+            for entry in board['entries']:
+                username, total_quizzes, passed_quizzes = details.get(entry['user_id'], (None, 0, 0))
                 leaderboard_data.append({
-                    'id': perf.id,
-                    'username': perf.username,
+                    'id': entry['user_id'],
+                    'username': username,
                     'total_quizzes': total_quizzes,
-                    'avg_score': round(float(perf.avg_score), 2) if perf.avg_score else 0,
-                    'pass_rate': round(pass_rate, 2),
-                    'rank': idx + 1,  # Add rank (1-based)
-                    'isCurrentUser': is_current_user
+                    'avg_score': entry['score'],
+                    'pass_rate': round(passed_quizzes / total_quizzes * 100, 2) if total_quizzes else 0,
+                    'rank': entry['rank'],
+                    'isCurrentUser': entry['user_id'] == current_user.id
                 })
             
-            # If user hasn't taken any quizzes, they might not be in the results
-            # Check and add current user if missing
-            if not any(entry['id'] == current_user.id for entry in leaderboard_data):
+            # Always include the current user, with their real rank if they are ranked
+            if not any(entry['isCurrentUser'] for entry in leaderboard_data):
+                _, total_quizzes, passed_quizzes = details.get(current_user.id, (None, 0, 0))
+                me = board['me']
                 leaderboard_data.append({
                     'id': current_user.id,
                     'username': current_user.username,
-                    'total_quizzes': 0,
-                    'avg_score': 0,
-                    'pass_rate': 0,
-                    'rank': len(leaderboard_data) + 1,
+                    'total_quizzes': total_quizzes,
+                    'avg_score': me['score'] if me else 0,
+                    'pass_rate': round(passed_quizzes / total_quizzes * 100, 2) if total_quizzes else 0,
+                    'rank': me['rank'] if me else board['total'] + 1,
                     'isCurrentUser': True
                 })
             
             logger.info(f"Leaderboard data retrieved for user: {current_user.email}")
             
-            return jsonify(leaderboard_data), 200
+            return jsonify(leaderboard_data), 200, {'X-Total-Count': str(board['total'])}
             
         except Exception as e:
             logger.error(f"Leaderboard data error: {str(e)}")
@@ -156,9 +149,56 @@ def create_analytics_routes(app):
                 'error': str(e)
             }), 500
     
+    @app.route('/api/analytics/leaderboard', methods=['GET'])
+    @jwt_required()
+    def get_leaderboard_api():
+        """
+        Page of the global, subject or quiz leaderboard with the caller's rank
+        Query params: scope (global|subject|quiz), id, offset, limit, neighbours
+        """
+        try:
+            current_user = Users.query.filter_by(email=get_jwt_identity()).first()
+            if not current_user:
+                return jsonify({
+                    'message': 'User not found',
+                    'error': 'USER_NOT_FOUND'
+                }), 404
+            
+            scope = request.args.get('scope', 'global')
+            scope_id = request.args.get('id', type=int)
+            if scope not in LEADERBOARD_SCOPES or (scope != 'global' and scope_id is None):
+                return jsonify({
+                    'message': 'scope must be global, subject or quiz; subject and quiz need an id',
+                    'error': 'INVALID_SCOPE'
+                }), 400
+            
+            board = get_leaderboard(
+                scope, scope_id,
+                offset=max(request.args.get('offset', 0, type=int), 0),
+                limit=min(max(request.args.get('limit', 20, type=int), 1), 100),
+                user_id=current_user.id,
+                neighbours=min(max(request.args.get('neighbours', 2, type=int), 0), 10)
+            )
+            
+            details = get_leaderboard_details(
+                [entry['user_id'] for entry in board['entries'] + board['neighbours']]
+            )
+            for entry in board['entries'] + board['neighbours']:
+                entry['username'] = details.get(entry['user_id'], (None,))[0]
+                entry['isCurrentUser'] = entry['user_id'] == current_user.id
+            
+            return jsonify({'scope': scope, 'id': scope_id, **board}), 200
+            
+        except Exception as e:
+            logger.error(f"Leaderboard error: {str(e)}")
+            return jsonify({
+                'message': 'Failed to retrieve leaderboard',
+                'error': str(e)
+            }), 500
+    
     @app.route('/api/analytics/performance-metrics', methods=['GET'])
     @jwt_required()
-    @cache_with_expiry(expiry_seconds=300, key_prefix="performance_metrics")
+    @cache_response("performance_metrics", expiry_seconds=300, policy='admin_shared', tags=caller_tags)
     def get_performance_metrics():
         """
         Get detailed performance metrics for analysis
@@ -211,24 +251,25 @@ def create_analytics_routes(app):
 
     return app
 
+def get_leaderboard_details(user_ids):
+    """{user_id: (username, attempts, passed)} for the users shown on a leaderboard page"""
+    rows = db.session.query(Users.id, Users.username, UserStats.attempts, UserStats.passed)\
+        .outerjoin(UserStats, Users.id == UserStats.user_id)\
+        .filter(Users.id.in_(set(user_ids))).all()
+    return {row.id: (row.username, row.attempts or 0, row.passed or 0) for row in rows}
+
 # Helper functions for chart data generation
 def get_user_registration_trends(start_date):
     """Get user registration trends over time"""
     try:
-        registrations = db.session.query(
-            func.date(Users.registration_date).label('date'),
-            func.count(Users.id).label('count')
-        ).filter(
-            and_(
-                Users.registration_date >= start_date,
-                Users.is_admin == False
-            )
-        ).group_by(func.date(Users.registration_date)).all()
+        registrations = DailyRegistrations.query.filter(
+            DailyRegistrations.registration_date >= start_date
+        ).order_by(DailyRegistrations.registration_date).all()
         
         return {
             'type': 'line',
             'title': 'User Registration Trends',
-            'data': [{'date': reg.date.isoformat(), 'count': reg.count} for reg in registrations]
+            'data': [{'date': reg.registration_date.isoformat(), 'count': reg.count} for reg in registrations]
         }
     except Exception as e:
         logger.error(f"User registration trends error: {str(e)}")
@@ -239,12 +280,10 @@ def get_quiz_performance_overview():
     try:
         performance = db.session.query(
             Subjects.name.label('subject'),
-            func.count(Scores.id).label('total_attempts'),
-            func.avg(Scores.percentage).label('avg_score'),
-            func.count(func.nullif(Scores.passed, False)).label('passed_count')
-        ).join(Chapters, Subjects.id == Chapters.subject_id)\
-         .join(Quizzes, Chapters.id == Quizzes.chapter_id)\
-         .join(Scores, Quizzes.id == Scores.quiz_id)\
+            func.sum(DailyQuizActivity.attempts).label('total_attempts'),
+            (func.sum(DailyQuizActivity.total_percentage) / func.sum(DailyQuizActivity.attempts)).label('avg_score'),
+            func.sum(DailyQuizActivity.passed).label('passed_count')
+        ).join(DailyQuizActivity, Subjects.id == DailyQuizActivity.subject_id)\
          .group_by(Subjects.id, Subjects.name).all()
         
         data = []
@@ -271,12 +310,10 @@ def get_subject_popularity():
     try:
         popularity = db.session.query(
             Subjects.name.label('subject'),
-            func.count(Scores.id).label('attempts')
-        ).join(Chapters, Subjects.id == Chapters.subject_id)\
-         .join(Quizzes, Chapters.id == Quizzes.chapter_id)\
-         .join(Scores, Quizzes.id == Scores.quiz_id)\
+            func.sum(DailyQuizActivity.attempts).label('attempts')
+        ).join(DailyQuizActivity, Subjects.id == DailyQuizActivity.subject_id)\
          .group_by(Subjects.id, Subjects.name)\
-         .order_by(func.count(Scores.id).desc())\
+         .order_by(func.sum(DailyQuizActivity.attempts).desc())\
          .limit(10).all()
         
         return {
@@ -291,21 +328,17 @@ def get_subject_popularity():
 def get_daily_activity_stats(start_date):
     """Get daily platform activity statistics"""
     try:
-        activity = db.session.query(
-            func.date(Scores.time_stamp_of_attempt).label('date'),
-            func.count(Scores.id).label('quiz_attempts'),
-            func.count(func.distinct(Scores.user_id)).label('active_users')
-        ).filter(
-            Scores.time_stamp_of_attempt >= start_date
-        ).group_by(func.date(Scores.time_stamp_of_attempt)).all()
+        activity = DailyActivity.query.filter(
+            DailyActivity.activity_date >= start_date
+        ).order_by(DailyActivity.activity_date).all()
         
         return {
             'type': 'area',
             'title': 'Daily Platform Activity',
             'data': [{
-                'date': act.date.isoformat(),
-                'quiz_attempts': act.quiz_attempts,
-                'active_users': act.active_users
+                'date': act.activity_date.isoformat(),
+                'quiz_attempts': act.attempts,
+                'active_users': HyperLogLog(act.user_sketch).count()
             } for act in activity]
         }
     except Exception as e:
@@ -315,16 +348,15 @@ def get_daily_activity_stats(start_date):
 def get_top_performers():
     """Get top performing users"""
     try:
+        avg_score = UserStats.total_percentage / UserStats.attempts
         performers = db.session.query(
             Users.username,
-            func.count(Scores.id).label('total_quizzes'),
-            func.avg(Scores.percentage).label('avg_score'),
-            func.count(func.nullif(Scores.passed, False)).label('passed_quizzes')
-        ).join(Scores, Users.id == Scores.user_id)\
-         .filter(Users.is_admin == False)\
-         .group_by(Users.id, Users.username)\
-         .having(func.count(Scores.id) >= 3)\
-         .order_by(func.avg(Scores.percentage).desc())\
+            UserStats.attempts.label('total_quizzes'),
+            avg_score.label('avg_score'),
+            UserStats.passed.label('passed_quizzes')
+        ).join(UserStats, Users.id == UserStats.user_id)\
+         .filter(Users.is_admin == False, UserStats.attempts >= 3)\
+         .order_by(avg_score.desc())\
          .limit(10).all()
         
         data = []
@@ -349,15 +381,16 @@ def get_top_performers():
 def get_quiz_difficulty_analysis():
     """Analyze quiz difficulty based on performance"""
     try:
+        avg_score = func.sum(DailyQuizActivity.total_percentage) / func.sum(DailyQuizActivity.attempts)
         difficulty = db.session.query(
             Quizzes.name.label('quiz_name'),
-            func.count(Scores.id).label('attempts'),
-            func.avg(Scores.percentage).label('avg_score'),
-            func.count(func.nullif(Scores.passed, False)).label('passed_count')
-        ).join(Scores, Quizzes.id == Scores.quiz_id)\
+            func.sum(DailyQuizActivity.attempts).label('attempts'),
+            avg_score.label('avg_score'),
+            func.sum(DailyQuizActivity.passed).label('passed_count')
+        ).join(DailyQuizActivity, Quizzes.id == DailyQuizActivity.quiz_id)\
          .group_by(Quizzes.id, Quizzes.name)\
-         .having(func.count(Scores.id) >= 5)\
-         .order_by(func.avg(Scores.percentage)).all()
+         .having(func.sum(DailyQuizActivity.attempts) >= 5)\
+         .order_by(avg_score).all()
         
         data = []
         for diff in difficulty:
@@ -384,35 +417,17 @@ def get_quiz_difficulty_analysis():
 def get_monthly_stats():
     """Get monthly platform statistics"""
     try:
-        # Get stats for last 6 months
-        monthly_stats = []
-        for i in range(6):
-            month_start = (date.today().replace(day=1) - timedelta(days=i*30)).replace(day=1)
-            next_month = (month_start + timedelta(days=32)).replace(day=1)
-            
-            stats = {
-                'month': month_start.strftime('%Y-%m'),
-                'new_users': Users.query.filter(
-                    and_(
-                        Users.registration_date >= month_start,
-                        Users.registration_date < next_month,
-                        Users.is_admin == False
-                    )
-                ).count(),
-                'quiz_attempts': Scores.query.filter(
-                    and_(
-                        Scores.time_stamp_of_attempt >= month_start,
-                        Scores.time_stamp_of_attempt < next_month
-                    )
-                ).count(),
-                'avg_score': db.session.query(func.avg(Scores.percentage)).filter(
-                    and_(
-                        Scores.time_stamp_of_attempt >= month_start,
-                        Scores.time_stamp_of_attempt < next_month
-                    )
-                ).scalar() or 0
-            }
-            monthly_stats.append(stats)
+        # Last 6 calendar months, newest first
+        first_month = date.today().replace(day=1)
+        for _ in range(5):
+            first_month = (first_month - timedelta(days=1)).replace(day=1)
+        
+        monthly_stats = [{
+            'month': month['period'].strftime('%Y-%m'),
+            'new_users': month['new_users'],
+            'quiz_attempts': month['attempts'],
+            'avg_score': month['avg_score']
+        } for month in reversed(platform_series(first_month, granularity='month'))]
         
         return {
             'type': 'multi_line',
@@ -427,25 +442,16 @@ def get_monthly_stats():
 def get_personal_performance(user_id, start_date):
     """Get personal performance trends for a user"""
     try:
-        performance = db.session.query(
-            func.date(Scores.time_stamp_of_attempt).label('date'),
-            func.avg(Scores.percentage).label('avg_score'),
-            func.count(Scores.id).label('attempts')
-        ).filter(
-            and_(
-                Scores.user_id == user_id,
-                Scores.time_stamp_of_attempt >= start_date
-            )
-        ).group_by(func.date(Scores.time_stamp_of_attempt)).all()
+        performance = user_series(user_id, start_date, granularity='day')
         
         return {
             'type': 'line',
             'title': 'Your Performance Trend',
             'data': [{
-                'date': perf.date.isoformat(),
-                'avg_score': round(float(perf.avg_score), 2) if perf.avg_score else 0,
-                'attempts': perf.attempts
-            } for perf in performance]
+                'date': day['period'].isoformat(),
+                'avg_score': day['avg_score'],
+                'attempts': day['attempts']
+            } for day in performance]
         }
     except Exception as e:
         logger.error(f"Personal performance error: {str(e)}")
@@ -518,32 +524,26 @@ def get_recent_quiz_scores(user_id, start_date):
 def get_performance_comparison(user_id):
     """Compare user's performance with platform average"""
     try:
-        user_avg = db.session.query(func.avg(Scores.percentage)).filter_by(user_id=user_id).scalar() or 0
-        platform_avg = db.session.query(func.avg(Scores.percentage)).scalar() or 0
+        # Only the user's own slice is read per request; platform averages are shared
+        platform = get_platform_averages()
+        user_avg = get_user_stats(user_id).average_score
+        platform_avg = platform['overall']
         
-        # Get subject-wise comparison
         comparison = db.session.query(
+            Subjects.id,
             Subjects.name.label('subject'),
-            func.avg(Scores.percentage).label('user_avg')
-        ).join(Chapters, Subjects.id == Chapters.subject_id)\
-         .join(Quizzes, Chapters.id == Quizzes.chapter_id)\
-         .join(Scores, Quizzes.id == Scores.quiz_id)\
-         .filter(Scores.user_id == user_id)\
-         .group_by(Subjects.id, Subjects.name).all()
+            UserSubjectStats.total_percentage,
+            UserSubjectStats.attempts
+        ).join(UserSubjectStats, Subjects.id == UserSubjectStats.subject_id)\
+         .filter(UserSubjectStats.user_id == user_id).all()
         
         data = []
         for comp in comparison:
-            # Get platform average for this subject
-            subject_platform_avg = db.session.query(func.avg(Scores.percentage))\
-                .join(Quizzes, Scores.quiz_id == Quizzes.id)\
-                .join(Chapters, Quizzes.chapter_id == Chapters.id)\
-                .join(Subjects, Chapters.subject_id == Subjects.id)\
-                .filter(Subjects.name == comp.subject).scalar() or 0
-            
+            your_score = comp.total_percentage / comp.attempts if comp.attempts else 0
             data.append({
                 'subject': comp.subject,
-                'your_score': round(float(comp.user_avg), 2) if comp.user_avg else 0,
-                'platform_avg': round(float(subject_platform_avg), 2)
+                'your_score': round(your_score, 2),
+                'platform_avg': round(platform['subjects'].get(str(comp.id), 0), 2)
             })
         
         return {
@@ -562,27 +562,17 @@ def get_performance_comparison(user_id):
 def get_time_spent_analysis(user_id, start_date):
     """Analyze time spent on quizzes"""
     try:
-        time_analysis = db.session.query(
-            func.date(Scores.time_stamp_of_attempt).label('date'),
-            func.sum(Scores.time_taken).label('total_time'),
-            func.count(Scores.id).label('quiz_count')
-        ).filter(
-            and_(
-                Scores.user_id == user_id,
-                Scores.time_stamp_of_attempt >= start_date,
-                Scores.time_taken.isnot(None)
-            )
-        ).group_by(func.date(Scores.time_stamp_of_attempt)).all()
+        time_analysis = user_series(user_id, start_date, granularity='day')
         
         return {
             'type': 'area',
             'title': 'Time Spent on Quizzes',
             'data': [{
-                'date': analysis.date.isoformat(),
-                'total_minutes': analysis.total_time,
-                'quiz_count': analysis.quiz_count,
-                'avg_time_per_quiz': round(analysis.total_time / analysis.quiz_count, 2) if analysis.quiz_count > 0 else 0
-            } for analysis in time_analysis]
+                'date': day['period'].isoformat(),
+                'total_minutes': day['time_spent'],
+                'quiz_count': day['timed_attempts'],
+                'avg_time_per_quiz': round(day['time_spent'] / day['timed_attempts'], 2) if day['timed_attempts'] > 0 else 0
+            } for day in time_analysis]
         }
     except Exception as e:
         logger.error(f"Time spent analysis error: {str(e)}")
@@ -593,17 +583,18 @@ def get_platform_performance_metrics(start_date):
     """Get platform-wide performance metrics"""
     try:
         total_users = Users.query.filter_by(is_admin=False).count()
-        active_users = db.session.query(func.count(func.distinct(Scores.user_id)))\
-            .filter(Scores.time_stamp_of_attempt >= start_date).scalar() or 0
+        active_count = active_users(start_date)
         
-        total_attempts = Scores.query.filter(Scores.time_stamp_of_attempt >= start_date).count()
-        avg_platform_score = db.session.query(func.avg(Scores.percentage))\
-            .filter(Scores.time_stamp_of_attempt >= start_date).scalar() or 0
+        total_attempts, total_percentage = db.session.query(
+            func.coalesce(func.sum(DailyActivity.attempts), 0),
+            func.coalesce(func.sum(DailyActivity.total_percentage), 0.0)
+        ).filter(DailyActivity.activity_date >= start_date).one()
+        avg_platform_score = total_percentage / total_attempts if total_attempts else 0
         
         return {
             'total_users': total_users,
-            'active_users': active_users,
-            'engagement_rate': round((active_users / total_users * 100), 2) if total_users > 0 else 0,
+            'active_users': active_count,
+            'engagement_rate': round((active_count / total_users * 100), 2) if total_users > 0 else 0,
             'total_attempts': total_attempts,
             'avg_platform_score': round(float(avg_platform_score), 2)
         }
@@ -614,15 +605,15 @@ def get_platform_performance_metrics(start_date):
 def get_user_engagement_metrics(start_date):
     """Get user engagement metrics"""
     try:
-        daily_active_users = db.session.query(
-            func.date(Scores.time_stamp_of_attempt).label('date'),
-            func.count(func.distinct(Scores.user_id)).label('dau')
-        ).filter(
-            Scores.time_stamp_of_attempt >= start_date
-        ).group_by(func.date(Scores.time_stamp_of_attempt)).all()
+        days = db.session.query(DailyActivity.activity_date, DailyActivity.user_sketch).filter(
+            DailyActivity.activity_date >= start_date
+        ).order_by(DailyActivity.activity_date).all()
         
         return {
-            'daily_active_users': [{'date': dau.date.isoformat(), 'count': dau.dau} for dau in daily_active_users]
+            'daily_active_users': [
+                {'date': day.activity_date.isoformat(), 'count': HyperLogLog(day.user_sketch).count()}
+                for day in days
+            ]
         }
     except Exception as e:
         logger.error(f"User engagement metrics error: {str(e)}")
@@ -633,12 +624,10 @@ def get_content_analytics_metrics(start_date, subject_id=None):
     try:
         query = db.session.query(
             Subjects.name.label('subject'),
-            func.count(Scores.id).label('total_attempts'),
-            func.avg(Scores.percentage).label('avg_score')
-        ).join(Chapters, Subjects.id == Chapters.subject_id)\
-         .join(Quizzes, Chapters.id == Quizzes.chapter_id)\
-         .join(Scores, Quizzes.id == Scores.quiz_id)\
-         .filter(Scores.time_stamp_of_attempt >= start_date)
+            func.sum(DailyQuizActivity.attempts).label('total_attempts'),
+            (func.sum(DailyQuizActivity.total_percentage) / func.sum(DailyQuizActivity.attempts)).label('avg_score')
+        ).join(DailyQuizActivity, Subjects.id == DailyQuizActivity.subject_id)\
+         .filter(DailyQuizActivity.activity_date >= start_date)
         
         if subject_id:
             query = query.filter(Subjects.id == subject_id)
@@ -689,20 +678,16 @@ def get_personal_metrics(user_id, start_date):
 def get_improvement_trends(user_id, start_date):
     """Get improvement trends for a user"""
     try:
-        # Get scores grouped by week to show improvement over time
-        weekly_scores = db.session.query(
-            func.extract('week', Scores.time_stamp_of_attempt).label('week'),
-            func.avg(Scores.percentage).label('avg_score')
-        ).filter(
-            and_(
-                Scores.user_id == user_id,
-                Scores.time_stamp_of_attempt >= start_date
-            )
-        ).group_by(func.extract('week', Scores.time_stamp_of_attempt))\
-         .order_by(func.extract('week', Scores.time_stamp_of_attempt)).all()
+        # Scores grouped by week to show improvement over time
+        weekly_scores = user_series(user_id, start_date, granularity='week')
         
         return {
-            'weekly_progress': [{'week': int(ws.week), 'avg_score': round(float(ws.avg_score), 2)} for ws in weekly_scores]
+            'weekly_progress': [{
+                'week': week['period'].isocalendar()[1],
+                'week_start': week['period'].isoformat(),
+                'avg_score': week['avg_score'],
+                'attempts': week['attempts']
+            } for week in weekly_scores]
         }
     except Exception as e:
         logger.error(f"Improvement trends error: {str(e)}")
@@ -0,0 +1,75 @@
+from flask import jsonify, request, Response
+from flask_jwt_extended import jwt_required
+from application.auth import admin_required
+from application import cache
+from application.cache_metrics import metrics, render_prometheus
+import logging
+
+logger = logging.getLogger(__name__)
+
+def register_cache_admin_routes(app):
+    @app.route('/api/admin/cache/stats', methods=['GET'])
+    @jwt_required()
+    @admin_required
+    def get_cache_admin_stats():
+        """
+        Cache counters of this worker per key prefix and endpoint (Admin only)
+        """
+        try:
+            return jsonify({
+                'redis': cache.get_cache_stats(),
+                'prefixes': metrics.snapshot()
+            }), 200
+        except Exception as e:
+            logger.error(f"Cache stats error: {str(e)}")
+            return jsonify({
+                'message': 'Failed to get cache stats',
+                'error': str(e)
+            }), 500
+
+    @app.route('/api/admin/cache/keys', methods=['GET'])
+    @jwt_required()
+    @admin_required
+    def get_cache_admin_keys():
+        """
+        Hottest and largest cache keys per prefix (Admin only)
+        Query: prefix (default: every prefix seen by this worker), limit,
+        scan_limit (keys examined per prefix for the size ranking)
+        """
+        try:
+            limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+            scan_limit = max(1, min(request.args.get('scan_limit', 2000, type=int), 20000))
+            prefix = request.args.get('prefix')
+            prefixes = [prefix] if prefix else metrics.prefixes()
+
+            result = {}
+            for name in prefixes:
+                largest, scanned = cache.largest_keys(name, limit, scan_limit)
+                result[name] = {
+                    'hottest': [{'key': key, 'hits': hits} for key, hits in metrics.hot_keys(name, limit)],
+                    'largest': largest,
+                    'scanned': scanned
+                }
+            return jsonify({'prefixes': result}), 200
+        except Exception as e:
+            logger.error(f"Cache keys error: {str(e)}")
+            return jsonify({
+                'message': 'Failed to list cache keys',
+                'error': str(e)
+            }), 500
+
+    @app.route('/api/admin/cache/metrics', methods=['GET'])
+    @jwt_required()
+    @admin_required
+    def get_cache_admin_metrics():
+        """
+        Cache counters in the Prometheus text format (Admin only)
+        """
+        redis_info = None
+        if cache.redis_client:
+            try:
+                redis_info = cache.redis_client.info()
+            except Exception as e:
+                logger.warning(f"Could not read Redis INFO: {str(e)}")
+        return Response(render_prometheus(cache.get_tier_stats(), redis_info),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
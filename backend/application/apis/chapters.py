@@ -2,6 +2,8 @@ from flask import jsonify, request
 from application.database import db
 from application.models import Chapters, Subjects, Users
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from application.quiz_cache import invalidate_catalog, quiz_ids_in
+from application import typeahead
 from datetime import datetime
 import logging
 
@@ -106,6 +108,8 @@ def register_chapter_routes(app):
             
             db.session.add(new_chapter)
             db.session.commit()
+            invalidate_catalog()
+            typeahead.upsert('chapters', new_chapter.id, new_chapter.name)
             
             logger.info(f"Chapter created: {new_chapter.name}")
             
@@ -199,7 +203,11 @@ def register_chapter_routes(app):
                     }), 404
                 chapter.subject_id = data['subject_id']
             
+            # Quiz papers show the chapter and subject names
+            quiz_ids = quiz_ids_in(chapter_id=chapter.id)
             db.session.commit()
+            invalidate_catalog(*quiz_ids)
+            typeahead.upsert('chapters', chapter.id, chapter.name)
             
             logger.info(f"Chapter updated: {chapter.name}")
             
@@ -244,8 +252,11 @@ def register_chapter_routes(app):
                 }), 404
             
             chapter_name = chapter.name
+            quiz_ids = quiz_ids_in(chapter_id=chapter.id)
             db.session.delete(chapter)
             db.session.commit()
+            invalidate_catalog(*quiz_ids)
+            typeahead.remove('chapters', chapter_id)
             
             logger.info(f"Chapter deleted: {chapter_name}")
             
@@ -2,7 +2,8 @@ from flask import jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..models import Users, Subjects, Chapters, Quizzes, Questions, Scores
 from ..database import db
-from ..cache import cache_with_expiry
+from ..cache import cache_response, user_tag, CATALOG_TAG, SCORES_TAG
+from ..user_stats import get_user_stats
 from sqlalchemy import func, and_, desc
 from datetime import datetime, timedelta, date
 import logging
@@ -13,7 +14,7 @@ def create_dashboard_routes(app):
     
     @app.route('/api/dashboard/stats', methods=['GET'])
     @jwt_required()
-    @cache_with_expiry(expiry_seconds=300, key_prefix="dashboard_stats")
+    @cache_response("dashboard_stats", expiry_seconds=300, policy='role', tags=[CATALOG_TAG, SCORES_TAG])
     def dashboard_get_stats():
         """
         Get dashboard statistics for admin dashboard
@@ -86,7 +87,7 @@ def create_dashboard_routes(app):
     
     @app.route('/api/dashboard/activities', methods=['GET'])
     @jwt_required()
-    @cache_with_expiry(expiry_seconds=60, key_prefix="dashboard_activities")
+    @cache_response("dashboard_activities", expiry_seconds=60, policy='role')
     def dashboard_get_activities():
         """
         Get recent activities for dashboard
@@ -152,7 +153,7 @@ def create_dashboard_routes(app):
     
     @app.route('/api/dashboard/user/performance', methods=['GET'])
     @jwt_required()
-    @cache_with_expiry(expiry_seconds=300, key_prefix="user_performance")
+    @cache_response("user_performance", expiry_seconds=300, policy='user', tags=lambda: [user_tag()])
     def dashboard_get_user_performance():
         """
         Get user performance statistics for user dashboard
@@ -168,41 +169,18 @@ def create_dashboard_routes(app):
                     'error': 'USER_NOT_FOUND'
                 }), 404
             
-            # Get user's quiz scores
-            user_scores = Scores.query.filter_by(user_id=current_user.id).all()
-            
-            if not user_scores:
-                return jsonify({
-                    'message': 'Performance statistics retrieved successfully',
-                    'stats': {
-                        'quizzes_taken': 0,
-                        'average_score': 0,
-                        'pass_rate': 0,
-                        'time_spent': 0,
-                        'best_score': 0,
-                        'total_attempts': 0,
-                        'passed_quizzes': 0
-                    }
-                })
-            
-            # Calculate statistics
-            total_attempts = len(user_scores)
-            passed_quizzes = len([s for s in user_scores if s.passed])
-            average_score = sum(s.percentage for s in user_scores if s.percentage) / total_attempts
-            pass_rate = (passed_quizzes / total_attempts) * 100
-            time_spent = sum(s.time_taken for s in user_scores if s.time_taken) or 0
-            best_score = max(s.percentage for s in user_scores if s.percentage) if user_scores else 0
+            stats = get_user_stats(current_user.id)
             
             return jsonify({
                 'message': 'Performance statistics retrieved successfully',
                 'stats': {
-                    'quizzes_taken': total_attempts,
-                    'average_score': round(average_score, 2),
-                    'pass_rate': round(pass_rate, 2),
-                    'time_spent': time_spent,
-                    'best_score': round(best_score, 2),
-                    'total_attempts': total_attempts,
-                    'passed_quizzes': passed_quizzes
+                    'quizzes_taken': stats.attempts,
+                    'average_score': round(stats.average_score, 2),
+                    'pass_rate': round(stats.pass_rate, 2),
+                    'time_spent': stats.time_spent,
+                    'best_score': round(stats.best_percentage, 2),
+                    'total_attempts': stats.attempts,
+                    'passed_quizzes': stats.passed
                 }
             })
             
@@ -215,7 +193,7 @@ def create_dashboard_routes(app):
     
     @app.route('/api/dashboard/user/recent-scores', methods=['GET'])
     @jwt_required()
-    @cache_with_expiry(expiry_seconds=300, key_prefix="user_recent_scores")
+    @cache_response("user_recent_scores", expiry_seconds=300, policy='user', tags=lambda: [user_tag()])
     def dashboard_get_user_recent_scores():
         """
         Get user's recent quiz scores for dashboard
@@ -1,20 +1,179 @@
-from flask import jsonify, request, send_file
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from application.models import Users, Quizzes, Chapters, Subjects, Scores
+from flask import Response, current_app, jsonify, request, send_file, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from application.models import Users, Quizzes, Chapters, Subjects, Scores, UserPreferences, ExportFiles
 from application.database import db
+from application.auth import admin_required
+from application.export_store import touch_export_file
+from application import cache
+from application.export_writers import available_formats, DEFAULT_FORMAT
+from application.exports import export_filename, export_mimetype, user_quiz_fingerprint, claim_export,\
+    release_export, resolve_format, ExportFormatError, platform_fingerprint, platform_partitions,\
+    start_partitioned_export, EXPORT_PARTITION_ROWS, progress_event, export_events, TERMINAL_STATES, EXPORT_STREAM_SECONDS,\
+    EXPORT_STREAM_TOKEN_SECONDS, export_owner
 from datetime import datetime
+import json
 import os
+import time
+import uuid
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
+def _task_status(task_id):
+    """Status of an export task as reported by the Celery result backend"""
+    from application.celery_tasks import generate_user_quiz_export
+    task = generate_user_quiz_export.AsyncResult(task_id)
+    
+    stored = ExportFiles.query.filter_by(task_id=task_id).first() if task.state == 'PENDING' else None
+    if stored is not None:
+        # Finished longer ago than the result backend keeps results
+        response = {
+            'state': 'completed',
+            'status': 'Export completed successfully',
+            'result': {
+                'status': 'completed',
+                'message': 'Export completed successfully',
+                'filename': stored.filename,
+                'rows': stored.rows,
+                'user_id': stored.owner_id
+            }
+        }
+    elif task.state == 'PENDING':
+        response = {
+            'state': 'pending',
+            'status': 'Export is pending...'
+        }
+    elif task.state == 'SUCCESS':
+        result = task.result
+        if result.get('filename') is None:
+            response = {
+                'state': 'completed',
+                'status': result.get('message', 'Export completed successfully'),
+                'result': result,
+                'no_data': True
+            }
+        else:
+            response = {
+                'state': 'completed',
+                'status': 'Export completed successfully',
+                'result': result
+            }
+    elif task.state == 'FAILURE':
+        response = {
+            'state': 'failed',
+            'status': 'Export failed',
+            'error': str(task.result)
+        }
+    elif task.state == 'PROGRESS':
+        meta = task.info or {}
+        response = {
+            'state': 'in_progress',
+            'status': meta.get('status', 'Export is in progress...'),
+            'current': meta.get('current', 0),
+            'total': meta.get('total', 0)
+        }
+    else:
+        response = {
+            'state': 'in_progress',
+            'status': 'Export is in progress...'
+        }
+    return response
+
+# Polling interval of the progress stream when Redis is unavailable
+STREAM_POLL_SECONDS = 2
+
+def _status_event(task_id):
+    """Progress event built from the result backend, for streams without Redis"""
+    status = _task_status(task_id)
+    result = status.get('result') or {}
+    return progress_event(status['state'], None, status.get('current', 0), status.get('total', 0),
+                          result.get('filename'), status.get('error') or status['status'])
+
+def _polled_events(task_id):
+    """Progress events from polling the result backend (no Redis pub/sub)"""
+    deadline = time.monotonic() + EXPORT_STREAM_SECONDS
+    last = None
+    while time.monotonic() < deadline:
+        event = _status_event(task_id)
+        if event != last:
+            last = event
+            yield event
+            if event['state'] in TERMINAL_STATES:
+                return
+        time.sleep(STREAM_POLL_SECONDS)
+
+def _task_owner(task_id):
+    """
+    Id of the user an export task runs for: from its Redis claim, its stored
+    file, or the owner the task reports to the result backend
+    """
+    owner_id = export_owner(task_id)
+    if owner_id is not None:
+        return owner_id
+    record = ExportFiles.query.filter_by(task_id=task_id).first()
+    if record is not None:
+        return record.owner_id
+    from application.celery_tasks import generate_user_quiz_export
+    info = generate_user_quiz_export.AsyncResult(task_id).info
+    return info.get('user_id') if isinstance(info, dict) else None
+
+def _can_follow(task_id, claims):
+    """Admins follow any export, users only their own"""
+    if claims.get('is_admin', False):
+        return True
+    owner_id = _task_owner(task_id)
+    return owner_id is not None and owner_id == claims.get('user_id')
+
+def _stream_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='export-progress-stream')
+
+def _stream_token(task_id):
+    """
+    Short-lived token that only opens the progress stream of task_id.
+    EventSource cannot send headers, and the access token must not end up in URLs.
+    """
+    claims = get_jwt()
+    return _stream_serializer().dumps({
+        'task_id': task_id,
+        'user_id': claims.get('user_id'),
+        'is_admin': claims.get('is_admin', False)
+    })
+
+def _stream_claims(token, task_id):
+    """Claims of a valid stream token for task_id, or None"""
+    try:
+        claims = _stream_serializer().loads(token, max_age=EXPORT_STREAM_TOKEN_SECONDS)
+    except BadSignature:
+        return None
+    return claims if claims.get('task_id') == task_id else None
+
+def _stored_export(filename, export_dir):
+    """ExportFiles record of a finished, unexpired export whose file is still on disk"""
+    record = ExportFiles.query.filter_by(filename=filename).first()
+    if record is None or not record.task_id or not os.path.exists(os.path.join(export_dir, filename)):
+        return None
+    if record.expires_at and record.expires_at <= datetime.utcnow():
+        return None
+    return record
+
+def _sse(event):
+    """One server-sent event carrying a progress payload"""
+    payload = {key: value for key, value in event.items() if key != 'user_id'}
+    return f"event: {event['state']}\ndata: {json.dumps(payload)}\n\n"
+
 def register_export_routes(app):
     @app.route('/api/exports/user-quizzes', methods=['POST'])
     @jwt_required()
     def trigger_user_quiz_export():
         """
-        Trigger an asynchronous export of user's quiz data
+        Trigger an asynchronous export of user's quiz data.
+        Pass {"format": "csv" | "csv.gz" | "jsonl" | "jsonl.gz" | "parquet" | "arrow"}
+        (or ?format=); without it the user's default export format is used.
+        {"compress": true} selects the gzip variant of a text format.
+        A request for an export that already exists or is being written
+        returns the task producing it instead of queueing another one.
         """
         try:
             logger.info("Export request received")
@@ -34,8 +193,19 @@ def register_export_routes(app):
             logger.info(f"User ID: {user_id}")
             
             # Create export request
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            filename = f'user_quiz_export_{user_id}_{timestamp}.csv'
+            payload = request.get_json(silent=True) or {}
+            compress = payload.get('compress', request.args.get('compress', 'false'))
+            compress = str(compress).lower() in ['true', '1', 'on', 'gzip']
+            preferences = UserPreferences.query.filter_by(user_id=user_id).first()
+            try:
+                export_format = resolve_format(payload.get('format', request.args.get('format')), compress,
+                                               preferences.default_export_format if preferences else None)
+            except ExportFormatError as e:
+                return jsonify({
+                    'message': str(e)
+                }), 400
+            digest = user_quiz_fingerprint(db.session, current_user, export_format)
+            filename = export_filename(f'user_quiz_export_{user_id}', digest, export_format)
             
             # Ensure export directory exists with proper permissions
             export_dir = os.path.join(app.instance_path, 'exports')
@@ -49,16 +219,55 @@ def register_export_routes(app):
                     'message': f'Failed to create export directory: {str(e)}'
                 }), 500
             
+            # A stored copy outlives the Redis claim: answer with the task that wrote it
+            stored = _stored_export(filename, export_dir)
+            if stored is not None:
+                touch_export_file(db.session, filename)
+                logger.info(f"Reusing stored export {filename} for user {user_id}")
+                return jsonify({
+                    'message': 'Export already available',
+                    'task_id': stored.task_id,
+                    'stream_token': _stream_token(stored.task_id),
+                    'filename': filename,
+                    'format': export_format,
+                    'reused': True
+                }), 202
+            
+            # Attach to the task that produces this exact export, if there is one
+            task_id = str(uuid.uuid4())
+            producer_id = claim_export(filename, task_id, user_id)
+            if producer_id != task_id:
+                available = os.path.exists(os.path.join(export_dir, filename))
+                if available:
+                    touch_export_file(db.session, filename)
+                logger.info(f"Reusing export task {producer_id} for user {user_id}")
+                return jsonify({
+                    'message': 'Export already available' if available else 'Export already in progress',
+                    'task_id': producer_id,
+                    'stream_token': _stream_token(producer_id),
+                    'filename': filename,
+                    'format': export_format,
+                    'reused': True
+                }), 202
+            
             # Queue the export task
             logger.info(f"Queueing export task for user {user_id}")
             from application.celery_tasks import generate_user_quiz_export
-            task = generate_user_quiz_export.delay(user_id, filename)
+            try:
+                task = generate_user_quiz_export.apply_async(args=(user_id, filename, export_format),
+                                                             task_id=task_id)
+            except Exception:
+                release_export(filename, task_id)
+                raise
             logger.info(f"Task created with ID: {task.id}")
             
             return jsonify({
                 'message': 'Export started successfully',
                 'task_id': task.id,
-                'filename': filename
+                'stream_token': _stream_token(task.id),
+                'filename': filename,
+                'format': export_format,
+                'reused': False
             }), 202
             
         except Exception as e:
@@ -68,6 +277,121 @@ def register_export_routes(app):
                 'message': f'Failed to start export: {str(e)}'
             }), 500
 
+    @app.route('/api/admin/exports/platform', methods=['POST'])
+    @jwt_required()
+    @admin_required
+    def trigger_platform_export():
+        """
+        Trigger an export of every score with its user, quiz, chapter and
+        subject. The scores are split into id ranges written in parallel by
+        Celery workers and merged by a chord callback, whose task id is
+        returned for the status and stream endpoints.
+        Accepts "format" and "compress" like the user export, and
+        "partition_rows" to change the partition size.
+        """
+        try:
+            payload = request.get_json(silent=True) or {}
+            compress = payload.get('compress', request.args.get('compress', 'false'))
+            compress = str(compress).lower() in ['true', '1', 'on', 'gzip']
+            try:
+                export_format = resolve_format(payload.get('format', request.args.get('format')), compress)
+                partition_rows = int(payload.get('partition_rows', request.args.get('partition_rows',
+                                                                                     EXPORT_PARTITION_ROWS)))
+            except (ExportFormatError, ValueError) as e:
+                return jsonify({
+                    'message': str(e)
+                }), 400
+            if partition_rows < 1:
+                return jsonify({
+                    'message': 'partition_rows must be positive'
+                }), 400
+            
+            digest, total = platform_fingerprint(db.session, export_format)
+            filename = export_filename('platform_export', digest, export_format)
+            export_dir = os.path.join(app.instance_path, 'exports')
+            os.makedirs(export_dir, exist_ok=True)
+            
+            stored = _stored_export(filename, export_dir)
+            if stored is not None:
+                touch_export_file(db.session, filename)
+                return jsonify({
+                    'message': 'Export already available',
+                    'task_id': stored.task_id,
+                    'stream_token': _stream_token(stored.task_id),
+                    'filename': filename,
+                    'format': export_format,
+                    'reused': True
+                }), 202
+            
+            # Attach to the export that produces this exact file, if there is one
+            export_id = str(uuid.uuid4())
+            admin_id = get_jwt().get('user_id')
+            producer_id = claim_export(filename, export_id, admin_id)
+            if producer_id != export_id:
+                available = os.path.exists(os.path.join(export_dir, filename))
+                if available:
+                    touch_export_file(db.session, filename)
+                return jsonify({
+                    'message': 'Export already available' if available else 'Export already in progress',
+                    'task_id': producer_id,
+                    'stream_token': _stream_token(producer_id),
+                    'filename': filename,
+                    'format': export_format,
+                    'reused': True
+                }), 202
+            
+            partitions = platform_partitions(db.session, partition_rows)
+            if not partitions:
+                release_export(filename, export_id)
+                return jsonify({
+                    'message': 'No quiz attempts to export',
+                    'filename': None
+                }), 200
+            
+            from celery import chord
+            from application.celery_tasks import export_platform_partition, merge_platform_export
+            start_partitioned_export(export_id)
+            try:
+                chord(
+                    export_platform_partition.s(export_id, filename, export_format, index, first_id, last_id,
+                                                total, admin_id)
+                    for index, (first_id, last_id, _) in enumerate(partitions)
+                )(merge_platform_export.s(export_id, filename, export_format, time.time(), admin_id)
+                  .set(task_id=export_id))
+            except Exception:
+                release_export(filename, export_id)
+                raise
+            logger.info(f"Platform export {export_id} queued: {total} rows in {len(partitions)} partitions")
+            
+            return jsonify({
+                'message': 'Export started successfully',
+                'task_id': export_id,
+                'stream_token': _stream_token(export_id),
+                'filename': filename,
+                'format': export_format,
+                'total': total,
+                'partitions': len(partitions),
+                'reused': False
+            }), 202
+            
+        except Exception as e:
+            logger.error(f"Platform export error: {str(e)}")
+            logger.error(traceback.format_exc())
+            return jsonify({
+                'message': f'Failed to start export: {str(e)}'
+            }), 500
+
+    @app.route('/api/exports/formats', methods=['GET'])
+    @jwt_required()
+    def get_export_formats():
+        """
+        Export formats this server can write (columnar ones need pyarrow)
+        """
+        return jsonify({
+            'formats': available_formats(),
+            'default': DEFAULT_FORMAT
+        }), 200
+
     @app.route('/api/exports/status/<task_id>', methods=['GET'])
     @jwt_required()
     def get_export_status(task_id):
@@ -76,40 +400,11 @@ def register_export_routes(app):
         """
         try:
             logger.info(f"Status check for task: {task_id}")
-            from application.celery_tasks import generate_user_quiz_export
-            task = generate_user_quiz_export.AsyncResult(task_id)
-            
-            if task.state == 'PENDING':
-                response = {
-                    'state': 'pending',
-                    'status': 'Export is pending...'
-                }
-            elif task.state == 'SUCCESS':
-                result = task.result
-                if result.get('filename') is None:
-                    response = {
-                        'state': 'completed',
-                        'status': result.get('message', 'Export completed successfully'),
-                        'result': result,
-                        'no_data': True
-                    }
-                else:
-                    response = {
-                        'state': 'completed',
-                        'status': 'Export completed successfully',
-                        'result': result
-                    }
-            elif task.state == 'FAILURE':
-                response = {
-                    'state': 'failed',
-                    'status': 'Export failed',
-                    'error': str(task.result)
-                }
-            else:
-                response = {
-                    'state': 'in_progress',
-                    'status': 'Export is in progress...'
-                }
+            if not _can_follow(task_id, get_jwt()):
+                return jsonify({
+                    'message': 'Unauthorized to access this export'
+                }), 403
+            response = _task_status(task_id)
             
             logger.info(f"Task {task_id} status: {response['state']}")
             return jsonify(response), 200
@@ -121,6 +416,88 @@ def register_export_routes(app):
                 'message': f'Failed to check status: {str(e)}'
             }), 500
 
+    @app.route('/api/exports/stream/<task_id>', methods=['GET'])
+    @jwt_required(optional=True)
+    def stream_export_status(task_id):
+        """
+        Push the progress of an export task as server-sent events until it
+        completes or fails. EventSource cannot set headers, so besides the
+        Authorization header this accepts ?token=<stream_token>, the
+        task-scoped token returned when the export was requested.
+        """
+        claims = get_jwt()
+        if not claims:
+            claims = _stream_claims(request.args.get('token', ''), task_id)
+            if claims is None:
+                return jsonify({
+                    'message': 'A valid stream token is required'
+                }), 401
+        caller_id = claims.get('user_id')
+        is_admin = claims.get('is_admin', False)
+
+        def allowed(event):
+            return is_admin or event.get('user_id') in (None, caller_id)
+
+        if not _can_follow(task_id, claims):
+            logger.warning(f"Unauthorized progress stream for task {task_id} by user {caller_id}")
+            return jsonify({
+                'message': 'Unauthorized to access this export'
+            }), 403
+
+        if ExportFiles.query.filter_by(task_id=task_id).first() is not None:
+            # Already written: its progress events may have expired with the claim
+            events = iter([_status_event(task_id)])
+        elif cache.redis_client:
+            events = export_events(task_id)
+        else:
+            events = _polled_events(task_id)
+
+        def stream():
+            yield 'retry: 3000\n\n'
+            try:
+                for event in events:
+                    if event is None:
+                        yield ': keep-alive\n\n'
+                        continue
+                    if not allowed(event):
+                        return
+                    yield _sse(event)
+            except Exception as e:
+                logger.error(f"Progress stream error for task {task_id}: {str(e)}")
+                yield _sse(progress_event('failed', message='Progress stream interrupted'))
+
+        return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    @app.route('/api/exports/files', methods=['GET'])
+    @jwt_required()
+    def list_export_files():
+        """
+        The caller's stored exports with size and expiry, newest first.
+        Admins can pass ?all=true to list every export.
+        """
+        try:
+            current_user = Users.query.filter_by(email=get_jwt_identity()).first()
+            if not current_user:
+                return jsonify({
+                    'message': 'User not found'
+                }), 404
+            query = ExportFiles.query
+            if not (get_jwt().get('is_admin', False) and request.args.get('all', 'false').lower() == 'true'):
+                query = query.filter(ExportFiles.owner_id == current_user.id, ExportFiles.kind == 'user')
+            files = query.order_by(ExportFiles.created_at.desc()).all()
+            return jsonify({
+                'files': [export_file.serialize() for export_file in files],
+                'total_bytes': sum(export_file.size_bytes or 0 for export_file in files)
+            }), 200
+        except Exception as e:
+            logger.error(f"Export listing error: {str(e)}")
+            return jsonify({
+                'message': f'Failed to list exports: {str(e)}'
+            }), 500
+
     @app.route('/api/exports/download/<filename>', methods=['GET'])
     @jwt_required()
     def download_export(filename):
@@ -140,8 +517,16 @@ def register_export_routes(app):
                 
             user_id = current_user.id
             
-            # Security check: ensure filename contains user_id
-            if f'user_quiz_export_{user_id}_' not in filename:
+            # Security check: platform exports are for admins, user exports for their owner
+            is_admin = get_jwt().get('is_admin', False)
+            record = ExportFiles.query.filter_by(filename=filename).first()
+            if record is not None:
+                allowed = is_admin or (record.kind == 'user' and record.owner_id == user_id)
+            elif filename.startswith('platform_export_'):
+                allowed = is_admin
+            else:
+                allowed = f'user_quiz_export_{user_id}_' in filename
+            if not allowed:
                 logger.warning(f"Unauthorized download attempt for {filename} by user {user_email}")
                 return jsonify({
                     'message': 'Unauthorized to access this file'
@@ -150,7 +535,10 @@ def register_export_routes(app):
             export_dir = os.path.join(app.instance_path, 'exports')
             file_path = os.path.join(export_dir, filename)
             
-            logger.info(f"Looking for file at: {file_path}")
+            if record is not None and record.expires_at and record.expires_at <= datetime.utcnow():
+                return jsonify({
+                    'message': 'Export has expired, please request a new one'
+                }), 410
             
             if not os.path.exists(file_path):
                 logger.warning(f"File not found: {file_path}")
@@ -158,13 +546,31 @@ def register_export_routes(app):
                     'message': 'Export file not found'
                 }), 404
             
-            logger.info(f"File found, sending: {file_path}")
-            return send_file(
+            # Count a download once, not for every resumed range
+            range_header = request.headers.get('Range', '')
+            touch_export_file(db.session, filename, download=not range_header or range_header.startswith('bytes=0-'))
+            
+            accel_prefix = app.config.get('EXPORT_ACCEL_REDIRECT_PREFIX')
+            if accel_prefix:
+                # nginx serves the file from an internal location, with its own Range and ETag handling
+                response = Response(mimetype=export_mimetype(filename))
+                response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+                response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+                return response
+            
+            # Range requests (resumable downloads) and If-None-Match / If-Modified-Since
+            # revalidation; with USE_X_SENDFILE the front server sends the bytes
+            response = send_file(
                 file_path,
-                mimetype='text/csv',
+                mimetype=export_mimetype(filename),
                 as_attachment=True,
-                download_name=filename
+                download_name=filename,
+                conditional=True,
+                etag=True
             )
+            response.accept_ranges = 'bytes'
+            response.cache_control.private = True
+            return response
             
         except Exception as e:
             logger.error(f"Download error: {str(e)}")
@@ -2,6 +2,7 @@ from flask import Flask, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from ..models import Questions, Quizzes, Chapters, Subjects
 from ..database import db
+from ..quiz_cache import invalidate_catalog
 from datetime import datetime
 import re
 
@@ -120,9 +121,10 @@ def create_question_routes(app):
             db.session.add(question)
             
             # Update quiz total_questions count
-            quiz.total_questions = Questions.query.filter_by(quiz_id=quiz.id).count() + 1
+            Quizzes.adjust_question_count(quiz.id, 1)
             
             db.session.commit()
+            invalidate_catalog(quiz.id)
             
             # Return updated quiz data along with the new question
             return jsonify({
@@ -145,6 +147,7 @@ def create_question_routes(app):
         """Update a question (Admin only)"""
         try:
             question = Questions.query.get_or_404(question_id)
+            original_quiz_id = question.quiz_id
             data = request.get_json()
             
             # Validate quiz if being updated
@@ -154,10 +157,9 @@ def create_question_routes(app):
                     return jsonify({'message': 'Quiz not found'}), 404
                 
                 # Update question counts for old and new quiz
-                old_quiz = question.quiz
-                if old_quiz and old_quiz.id != data['quiz_id']:
-                    old_quiz.total_questions = Questions.query.filter_by(quiz_id=old_quiz.id).count() - 1
-                    quiz.total_questions = Questions.query.filter_by(quiz_id=data['quiz_id']).count() + 1
+                if question.quiz_id != quiz.id:
+                    Quizzes.adjust_question_count(question.quiz_id, -1)
+                    Quizzes.adjust_question_count(quiz.id, 1)
                 
                 question.quiz_id = data['quiz_id']
             
@@ -186,6 +188,7 @@ def create_question_routes(app):
                 question.marks = marks
             
             db.session.commit()
+            invalidate_catalog(original_quiz_id, question.quiz_id)
             
             return jsonify({
                 'message': 'Question updated successfully',
@@ -203,15 +206,15 @@ def create_question_routes(app):
         """Delete a question (Admin only)"""
         try:
             question = Questions.query.get_or_404(question_id)
-            quiz = question.quiz
+            quiz_id = question.quiz_id
             
             db.session.delete(question)
             
             # Update quiz total_questions count
-            if quiz:
-                quiz.total_questions = Questions.query.filter_by(quiz_id=quiz.id).count() - 1
+            Quizzes.adjust_question_count(quiz_id, -1)
             
             db.session.commit()
+            invalidate_catalog(quiz_id)
             
             return jsonify({'message': 'Question deleted successfully'}), 200
             
@@ -273,9 +276,10 @@ def create_question_routes(app):
                 created_questions.append(question)
             
             # Update quiz total_questions count
-            quiz.total_questions = Questions.query.filter_by(quiz_id=quiz_id).count() + len(created_questions)
+            Quizzes.adjust_question_count(quiz_id, len(created_questions))
             
             db.session.commit()
+            invalidate_catalog(quiz_id)
             
             return jsonify({
                 'message': f'{len(created_questions)} questions created successfully',
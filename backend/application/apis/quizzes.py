@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from ..models import Quizzes, Chapters, Subjects, Questions, Scores, Users
 from ..database import db
+from ..quiz_cache import get_quiz_paper, get_answer_key, invalidate_catalog
+from .. import typeahead
+from ..score_writer import submit_score, get_attempt_status as get_score_status
 from datetime import datetime, date
 import re
+import uuid
 
 def admin_required(f):
     """Decorator to ensure only admin users can access certain endpoints"""
@@ -18,40 +22,88 @@ def admin_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# Upper bound for a single keyset page of the quiz catalog
+MAX_CATALOG_PAGE_SIZE = 500
+
+def get_quiz_catalog(chapter_id=None, active_only=False, after_id=None, limit=None, exclude_quiz_ids=None,
+                     with_questions_count=True):
+    """
+    Build the quiz catalog payload with one query.
+    with_questions_count=False leaves out the `questions_count` key.
+
+    Chapter and subject names come from outer joins and the question count
+    from the stored Quizzes.total_questions counter, so the number of SELECTs
+    does not grow with the number of quizzes. Results are ordered by quiz id
+    so that `after_id` can be used as a keyset cursor.
+    """
+    query = db.session.query(
+        Quizzes,
+        Chapters.name.label('chapter_name'),
+        Subjects.name.label('subject_name')
+    ).outerjoin(Chapters, Quizzes.chapter_id == Chapters.id)\
+     .outerjoin(Subjects, Chapters.subject_id == Subjects.id)
+    
+    if chapter_id:
+        query = query.filter(Quizzes.chapter_id == chapter_id)
+    if active_only:
+        query = query.filter(Quizzes.is_active == True)
+    if exclude_quiz_ids is not None:
+        query = query.filter(Quizzes.id.notin_(exclude_quiz_ids))
+    if after_id is not None:
+        query = query.filter(Quizzes.id > after_id)
+    
+    query = query.order_by(Quizzes.id)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    quiz_list = []
+    for quiz, chapter_name, subject_name in query.all():
+        quiz_data = quiz.serialize()
+        # Add chapter and subject information
+        if chapter_name is not None:
+            quiz_data['chapter_name'] = chapter_name
+            if subject_name is not None:
+                quiz_data['subject_name'] = subject_name
+        # Add questions count
+        if with_questions_count:
+            quiz_data['questions_count'] = quiz_data['total_questions']
+        quiz_list.append(quiz_data)
+    
+    return quiz_list
+
 def create_quiz_routes(app):
     
     @app.route('/api/quizzes', methods=['GET'])
     @jwt_required()
     def get_quizzes():
-        """Get all quizzes or filter by chapter"""
+        """Get all quizzes or filter by chapter
+
+        Optional keyset pagination: pass `limit` (and `after_id` from the
+        previous page's X-Next-After-Id header) to page through the catalog.
+        """
         try:
             chapter_id = request.args.get('chapter_id', type=int)
-            
-            query = Quizzes.query
-            
-            if chapter_id:
-                query = query.filter_by(chapter_id=chapter_id)
+            after_id = request.args.get('after_id', type=int)
+            limit = request.args.get('limit', type=int)
+            if limit is not None:
+                limit = max(1, min(limit, MAX_CATALOG_PAGE_SIZE))
             
             # Only show active quizzes to regular users
             claims = get_jwt()
-            if not claims.get('is_admin', False):
-                query = query.filter_by(is_active=True)
+            active_only = not claims.get('is_admin', False)
             
-            quizzes = query.all()
+            quiz_list = get_quiz_catalog(
+                chapter_id=chapter_id,
+                active_only=active_only,
+                after_id=after_id,
+                limit=limit
+            )
             
-            quiz_list = []
-            for quiz in quizzes:
-                quiz_data = quiz.serialize()
-                # Add chapter and subject information
-                if quiz.chapter:
-                    quiz_data['chapter_name'] = quiz.chapter.name
-                    if quiz.chapter.subject:
-                        quiz_data['subject_name'] = quiz.chapter.subject.name
-                # Add questions count
-                quiz_data['questions_count'] = len(quiz.questions)
-                quiz_list.append(quiz_data)
+            headers = {}
+            if limit is not None and len(quiz_list) == limit:
+                headers['X-Next-After-Id'] = str(quiz_list[-1]['id'])
             
-            return jsonify(quiz_list), 200
+            return jsonify(quiz_list), 200, headers
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -77,7 +129,7 @@ def create_quiz_routes(app):
                     quiz_data['subject_name'] = quiz.chapter.subject.name
             
             # Add questions count
-            quiz_data['questions_count'] = len(quiz.questions)
+            quiz_data['questions_count'] = quiz_data['total_questions']
             
             return jsonify(quiz_data), 200
             
@@ -118,7 +170,7 @@ def create_quiz_routes(app):
                 chapter_id=data['chapter_id'],
                 date_of_quiz=date_of_quiz,
                 time_duration=data.get('time_duration', 60),  # Default 60 minutes
-                total_questions=data.get('total_questions', 0),
+                total_questions=0,  # Maintained by the question endpoints
                 passing_score=data.get('passing_score', 60.0),  # Default 60%
                 remarks=data.get('remarks', ''),
                 is_active=data.get('is_active', True)
@@ -126,6 +178,8 @@ def create_quiz_routes(app):
             
             db.session.add(quiz)
             db.session.commit()
+            invalidate_catalog()
+            typeahead.upsert('quizzes', quiz.id, quiz.name, quiz.is_active)
             
             return jsonify({
                 'message': 'Quiz created successfully',
@@ -167,8 +221,6 @@ def create_quiz_routes(app):
                     quiz.date_of_quiz = None
             if 'time_duration' in data:
                 quiz.time_duration = data['time_duration']
-            if 'total_questions' in data:
-                quiz.total_questions = data['total_questions']
             if 'passing_score' in data:
                 quiz.passing_score = data['passing_score']
             if 'remarks' in data:
@@ -177,6 +229,8 @@ def create_quiz_routes(app):
                 quiz.is_active = data['is_active']
             
             db.session.commit()
+            invalidate_catalog(quiz.id)
+            typeahead.upsert('quizzes', quiz.id, quiz.name, quiz.is_active)
             
             return jsonify({
                 'message': 'Quiz updated successfully',
@@ -206,6 +260,8 @@ def create_quiz_routes(app):
             
             db.session.delete(quiz)
             db.session.commit()
+            invalidate_catalog(quiz_id)
+            typeahead.remove('quizzes', quiz_id)
             
             return jsonify({'message': 'Quiz deleted successfully'}), 200
             
@@ -249,46 +305,23 @@ def create_quiz_routes(app):
             
             print(f"🚀 Starting quiz attempt - User: {current_user_id}, Quiz ID: {quiz_id}")
             
-            quiz = Quizzes.query.get_or_404(quiz_id)
-            
-            print(f"📝 Found quiz: {quiz.name} (ID: {quiz.id})")
+            # Answer-free paper, rendered once per quiz version and shared by all attempts
+            paper = get_quiz_paper(quiz_id)
+            if paper is None:
+                return jsonify({'message': 'Quiz not found'}), 404
             
             # Check if quiz is active
-            if not quiz.is_active:
+            if not paper.is_active:
                 print(f"❌ Quiz {quiz_id} is not active")
                 return jsonify({'message': 'Quiz is not available'}), 400
             
             # Check if quiz has questions
-            if not quiz.questions:
+            if not paper.question_count:
                 print(f"❌ Quiz {quiz_id} has no questions")
                 return jsonify({'message': 'Quiz has no questions'}), 400
             
-            # Get questions for the quiz (without correct answers)
-            questions = Questions.query.filter_by(quiz_id=quiz_id).all()
-            print(f"📊 Found {len(questions)} questions for quiz {quiz_id}")
-            
-            questions_data = []
-            for question in questions:
-                q_data = question.serialize()
-                q_data.pop('correct_option', None)  # Remove correct answer
-                questions_data.append(q_data)
-            
-            quiz_data = quiz.serialize()
-            quiz_data['questions'] = questions_data
-            quiz_data['start_time'] = datetime.utcnow().isoformat()
-            
-            # Add chapter and subject information for verification
-            if quiz.chapter:
-                quiz_data['chapter_name'] = quiz.chapter.name
-                if quiz.chapter.subject:
-                    quiz_data['subject_name'] = quiz.chapter.subject.name
-            
-            print(f"✅ Successfully prepared quiz data for: {quiz.name}")
-            print(f"   Chapter: {quiz_data.get('chapter_name', 'N/A')}")
-            print(f"   Subject: {quiz_data.get('subject_name', 'N/A')}")
-            print(f"   Questions: {len(questions_data)}")
-            
-            return jsonify(quiz_data), 200
+            body = paper.render(start_time=datetime.utcnow().isoformat())
+            return current_app.response_class(body, status=200, mimetype='application/json')
             
         except Exception as e:
             print(f"❌ Error starting quiz {quiz_id}: {str(e)}")
@@ -302,9 +335,12 @@ def create_quiz_routes(app):
             current_user_id = get_jwt_identity()
             data = request.get_json()
             
-            quiz = Quizzes.query.get_or_404(quiz_id)
+            # Cached answer key: grading does not query the questions table
+            answer_key = get_answer_key(quiz_id)
+            if answer_key is None:
+                return jsonify({'message': 'Quiz not found'}), 404
             
-            if not quiz.is_active:
+            if not answer_key.is_active:
                 return jsonify({'message': 'Quiz is not available'}), 400
             
             answers = data.get('answers', {})  # {question_id: selected_option}
@@ -320,81 +356,70 @@ def create_quiz_routes(app):
                 except:
                     pass
             
-            # Get all questions for the quiz
-            questions = Questions.query.filter_by(quiz_id=quiz_id).all()
-            
-            if not questions:
+            if not len(answer_key):
                 return jsonify({'message': 'Quiz has no questions'}), 400
             
             # Calculate score
-            total_scored = 0
-            total_possible_score = 0
-            correct_answers = 0
-            incorrect_answers = 0
-            unanswered = 0
+            result = answer_key.grade(answers)
             
-            for question in questions:
-                question_score = question.marks if hasattr(question, 'marks') and question.marks else 1
-                total_possible_score += question_score
-                
-                user_answer = answers.get(str(question.id))
-                
-                # Convert user answer to int for comparison if it exists
-                if user_answer is not None:
-                    try:
-                        user_answer = int(user_answer)
-                        # Compare with correct_option (1-based index)
-                        if user_answer == question.correct_option:
-                            total_scored += question_score
-                            correct_answers += 1
-                        else:
-                            incorrect_answers += 1
-                    except (ValueError, TypeError):
-                        # If answer can't be converted to int, count as incorrect
-                        incorrect_answers += 1
-                else:
-                    unanswered += 1
-            
-            # Calculate percentage based on correct answers / total questions
-            total_questions = len(questions)
-            percentage = (correct_answers / total_questions * 100) if total_questions > 0 else 0
-            passed = percentage >= quiz.passing_score
-            
-            # Save score
+            # Save score (directly, or through the write-behind spool)
             score = Scores(
                 user_id=current_user_id,
                 quiz_id=quiz_id,
                 time_stamp_of_attempt=submit_time,
-                total_scored=total_scored,
-                total_possible_score=total_possible_score,
+                total_scored=result['total_scored'],
+                total_possible_score=result['total_possible_score'],
                 time_taken=time_taken,
-                percentage=percentage,
-                passed=passed
+                percentage=result['percentage'],
+                passed=result['passed'],
+                attempt_id=uuid.uuid4().hex
             )
+            score_data = score.serialize()
             
-            db.session.add(score)
-            db.session.commit()
-            
-            # Return the answers for verification
-            question_answers = {str(q.id): q.correct_option for q in questions}
+            persisted = submit_score(score)
+            if persisted:
+                score_data['id'] = score.id
             
             return jsonify({
                 'message': 'Quiz submitted successfully',
-                'score': score.serialize(),
-                'correct_answers': correct_answers,
-                'incorrect_answers': incorrect_answers,
-                'unanswered': unanswered,
-                'total_questions': total_questions,
-                'percentage': percentage,
-                'passed': passed,
+                'score': score_data,
+                'attempt_id': score.attempt_id,
+                'persisted': persisted,
+                'correct_answers': result['correct_answers'],
+                'incorrect_answers': result['incorrect_answers'],
+                'unanswered': result['unanswered'],
+                'total_questions': result['total_questions'],
+                'percentage': result['percentage'],
+                'passed': result['passed'],
                 'time_taken': time_taken,
-                'question_answers': question_answers  # Add this for debugging
+                'question_answers': answer_key.correct_option_map()  # Add this for debugging
             }), 200
             
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/quizzes/attempts/<attempt_id>', methods=['GET'])
+    @jwt_required()
+    def get_attempt_status(attempt_id):
+        """Check whether a submitted attempt has been persisted"""
+        try:
+            status = get_score_status(attempt_id)
+            
+            # Users can only poll their own attempts
+            claims = get_jwt()
+            if not status or (not claims.get('is_admin', False) and status['user_id'] != str(get_jwt_identity())):
+                return jsonify({'message': 'Attempt not found'}), 404
+            
+            return jsonify({
+                'attempt_id': attempt_id,
+                'status': status['status'],
+                'score_id': status['score_id']
+            }), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/quizzes/<int:quiz_id>/attempts', methods=['GET'])
     @jwt_required()
     def get_quiz_attempts(quiz_id):
@@ -436,27 +461,15 @@ def create_quiz_routes(app):
         try:
             current_user_id = get_jwt_identity()
             
-            # Get all active quizzes
-            active_quizzes = Quizzes.query.filter_by(is_active=True).all()
-            
-            if not active_quizzes:
-                return jsonify([]), 200
-            
-            # Get quizzes that user has already attempted
-            attempted_quiz_ids = db.session.query(Scores.quiz_id).filter_by(user_id=current_user_id).distinct().all()
-            attempted_quiz_ids = [quiz_id for (quiz_id,) in attempted_quiz_ids]
-            
-            # Filter out attempted quizzes
-            unattempted_quizzes = []
-            for quiz in active_quizzes:
-                if quiz.id not in attempted_quiz_ids:
-                    quiz_data = quiz.serialize()
-                    # Add chapter and subject information
-                    if quiz.chapter:
-                        quiz_data['chapter_name'] = quiz.chapter.name
-                        if quiz.chapter.subject:
-                            quiz_data['subject_name'] = quiz.chapter.subject.name
-                    unattempted_quizzes.append(quiz_data)
+            # Quizzes that user has already attempted
+            attempted_quiz_ids = db.session.query(Scores.quiz_id).filter_by(user_id=current_user_id)
+            
+            # Active quizzes minus the attempted ones, in a single query
+            unattempted_quizzes = get_quiz_catalog(
+                active_only=True,
+                exclude_quiz_ids=attempted_quiz_ids,
+                with_questions_count=False
+            )
             
             return jsonify(unattempted_quizzes), 200
             
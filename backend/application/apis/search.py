@@ -1,6 +1,10 @@
 from flask import Flask, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from application.models import Questions, Subjects, Chapters, Quizzes, Scores, Users
+from application import search_index, typeahead
+from application.search_index import KINDS
+from application.user_stats import get_user_stats
+from application.cache import cache_response, user_tag
 from sqlalchemy import or_, func
 import logging
 from datetime import datetime, timedelta
@@ -8,6 +12,8 @@ from datetime import datetime, timedelta
 # Configure logging
 logger = logging.getLogger(__name__)
 
+MODELS = {'questions': Questions, 'subjects': Subjects, 'chapters': Chapters, 'quizzes': Quizzes}
+
 def create_search_routes(app):
     """
     Create routes for search functionality
@@ -18,63 +24,54 @@ def create_search_routes(app):
     def search():
         """
         Search across questions, subjects, chapters, and quizzes
+        Query: q, types (comma-separated, default all), limit (per type,
+        default 10, max 50), offset (per type)
+        Results of each type are ranked by relevance and carry highlight
+        (matched name) and snippet (best matching fragment) fields with
+        <mark> tags around the matched terms.
         """
         try:
             # Get query param
             query = request.args.get('q', '')
             
-            if not query or len(query) < 2:
+            if not query or len(query.strip()) < 2:
                 return jsonify({
                     'message': 'Search query must be at least 2 characters'
                 }), 400
             
-            # Create search term with wildcards for SQL LIKE
-            search_term = f'%{query}%'
-            
-            # Search in questions
-            questions = Questions.query.filter(
-                or_(
-                    Questions.question_text.ilike(search_term),
-                    Questions.option1.ilike(search_term),
-                    Questions.option2.ilike(search_term),
-                    Questions.option3.ilike(search_term),
-                    Questions.option4.ilike(search_term)
-                )
-            ).all()
-            
-            # Search in subjects
-            subjects = Subjects.query.filter(
-                or_(
-                    Subjects.name.ilike(search_term),
-                    Subjects.description.ilike(search_term)
-                )
-            ).all()
-            
-            # Search in chapters
-            chapters = Chapters.query.filter(
-                or_(
-                    Chapters.name.ilike(search_term),
-                    Chapters.description.ilike(search_term)
-                )
-            ).all()
-            
-            # Search in quizzes
-            quizzes = Quizzes.query.filter(
-                or_(
-                    Quizzes.name.ilike(search_term),
-                    Quizzes.description.ilike(search_term),
-                    Quizzes.remarks.ilike(search_term)
-                )
-            ).all()
-            
-            # Prepare response
-            results = {
-                'questions': [q.serialize() for q in questions],
-                'subjects': [s.serialize() for s in subjects],
-                'chapters': [c.serialize() for c in chapters],
-                'quizzes': [q.serialize() for q in quizzes],
-                'total_count': len(questions) + len(subjects) + len(chapters) + len(quizzes)
-            }
+            types = [kind.strip() for kind in request.args.get('types', ','.join(KINDS)).split(',') if kind.strip()]
+            unknown = [kind for kind in types if kind not in KINDS]
+            if unknown:
+                return jsonify({
+                    'message': f"Unknown search types: {', '.join(unknown)}",
+                    'error': 'INVALID_TYPE'
+                }), 400
+            limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+            offset = max(0, request.args.get('offset', 0, type=int))
+            
+            found = search_index.search(query, types, limit, offset)
+            is_admin = get_jwt().get('is_admin', False)
+            
+            results = {'query': query, 'corrections': found['corrections'], 'totals': {},
+                       'limit': limit, 'offset': offset}
+            for kind in KINDS:
+                total, hits = found['results'].get(kind, (0, []))
+                rows = {row.id: row for row in MODELS[kind].query.filter(
+                    MODELS[kind].id.in_([hit['id'] for hit in hits])
+                )} if hits else {}
+                items = []
+                for hit in hits:
+                    row = rows.get(hit['id'])
+                    if row is None:
+                        continue
+                    item = row.serialize()
+                    if kind == 'questions' and not is_admin:
+                        item.pop('correct_option', None)  # Don't reveal answers to quiz takers
+                    item.update(score=hit['score'], highlight=hit['highlight'], snippet=hit['snippet'])
+                    items.append(item)
+                results[kind] = items
+                results['totals'][kind] = total
+            results['total_count'] = sum(results['totals'].values())
             
             return jsonify(results), 200
             
@@ -84,8 +81,39 @@ def create_search_routes(app):
                 'message': f'Search failed: {str(e)}'
             }), 500
 
+    @app.route('/api/search/typeahead', methods=['GET'])
+    @jwt_required()
+    def search_typeahead():
+        """
+        Name completions for the search box, served from memory
+        Query: q (prefix), types (comma-separated subjects, chapters,
+        quizzes; default all), limit (default 8, max 20)
+        """
+        try:
+            query = request.args.get('q', '')
+            types = [kind.strip() for kind in request.args.get('types', ','.join(typeahead.KINDS)).split(',')
+                     if kind.strip()]
+            unknown = [kind for kind in types if kind not in typeahead.KINDS]
+            if unknown:
+                return jsonify({
+                    'message': f"Unknown typeahead types: {', '.join(unknown)}",
+                    'error': 'INVALID_TYPE'
+                }), 400
+            limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+            
+            suggestions = typeahead.complete(query, limit, types,
+                                             include_inactive=get_jwt().get('is_admin', False))
+            return jsonify({'query': query, 'suggestions': suggestions}), 200
+            
+        except Exception as e:
+            logger.error(f"Typeahead error: {str(e)}")
+            return jsonify({
+                'message': f'Typeahead failed: {str(e)}'
+            }), 500
+
     @app.route('/api/dashboard/user/performance', methods=['GET'])
     @jwt_required()
+    @cache_response("user_performance", expiry_seconds=300, policy='user', tags=lambda: [user_tag()])
     def get_user_performance():
         """
         Get user performance statistics
@@ -102,36 +130,15 @@ def create_search_routes(app):
                     'error': 'USER_NOT_FOUND'
                 }), 404
                 
-            user_id = user.id
-            user_email = user.email  # Get email for alternative check
-            
-            # Get all scores for the user - check by ID or email
-            scores = Scores.query.filter(
-                (Scores.user_id == user_id) | 
-                (Scores.user_id == user_email)  # Check for email as user_id
-            ).all()
-            
-            # Log for debugging
-            print(f"User ID: {user_id}, Email: {user_email}")
-            print(f"Found {len(scores)} scores for this user")
-            
-            # Calculate statistics
-            total_quizzes = len(scores)
-            total_score = sum(score.percentage for score in scores) if scores else 0
-            passed_quizzes = len([score for score in scores if score.passed]) if scores else 0
-            total_time = sum(score.time_taken for score in scores if score.time_taken is not None) if scores else 0
-            
-            # Calculate averages
-            average_score = round(total_score / total_quizzes, 1) if total_quizzes > 0 else 0
-            pass_rate = round((passed_quizzes / total_quizzes) * 100, 1) if total_quizzes > 0 else 0
+            stats = get_user_stats(user.id)
             
             # Prepare response
             response = {
                 'stats': {
-                    'quizzes_taken': total_quizzes,
-                    'average_score': average_score,
-                    'pass_rate': pass_rate,
-                    'time_spent': total_time
+                    'quizzes_taken': stats.attempts,
+                    'average_score': round(stats.average_score, 1),
+                    'pass_rate': round(stats.pass_rate, 1),
+                    'time_spent': stats.time_spent
                 }
             }
             
@@ -145,6 +152,7 @@ def create_search_routes(app):
 
     @app.route('/api/dashboard/user/recent-scores', methods=['GET'])
     @jwt_required()
+    @cache_response("user_recent_scores", expiry_seconds=300, policy='user', tags=lambda: [user_tag()])
     def get_recent_scores():
         """
         Get user's recent quiz scores
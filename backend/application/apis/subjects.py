@@ -3,6 +3,8 @@ from application.database import db
 from application.models import Subjects
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from application.auth import admin_required
+from application.quiz_cache import invalidate_catalog, quiz_ids_in
+from application import typeahead
 from datetime import datetime
 import logging
 
@@ -117,6 +119,8 @@ def register_subject_routes(app):
             
             db.session.add(new_subject)
             db.session.commit()
+            invalidate_catalog()
+            typeahead.upsert('subjects', new_subject.id, new_subject.name, new_subject.is_active)
             
             logger.info(f"Subject created: {new_subject.name} by user {current_user.email}")
             
@@ -249,7 +253,11 @@ def register_subject_routes(app):
             if 'is_active' in data:
                 subject.is_active = data['is_active']
             
+            # Quiz papers show the subject name
+            quiz_ids = quiz_ids_in(subject_id=subject.id)
             db.session.commit()
+            invalidate_catalog(*quiz_ids)
+            typeahead.upsert('subjects', subject.id, subject.name, subject.is_active)
             
             logger.info(f"Subject updated: {subject.name}")
             
@@ -313,6 +321,8 @@ def register_subject_routes(app):
             # Delete the subject
             db.session.delete(subject)
             db.session.commit()
+            invalidate_catalog()
+            typeahead.remove('subjects', subject_id)
             
             logger.info(f"Subject deleted: {subject.name}")
             
@@ -8,6 +8,9 @@ from datetime import datetime, timedelta
 import traceback
 import json
 from application.models import Scores, Quizzes
+from application.user_stats import get_user_stats
+from application.rollups import record_registration
+from application.leaderboards import publish_new_user
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -249,7 +252,9 @@ def register_user_routes(app):
             )
 
             db.session.add(new_user)
+            record_registration(new_user)
             db.session.commit()
+            publish_new_user(new_user)
 
             logger.info(f"New user registered: {email}")
 
@@ -522,7 +527,9 @@ def register_user_routes(app):
             )
             
             db.session.add(new_user)
+            record_registration(new_user)
             db.session.commit()
+            publish_new_user(new_user)
             
             logger.info(f"New user created: {new_user.email}")
             
@@ -678,36 +685,20 @@ def register_user_routes(app):
         """
         try:
             # Get current user
-            user_id = get_jwt_identity()
-            
-            # Get all scores for the user
-            scores = Scores.query.filter_by(user_id=user_id).all()
+            user = Users.query.filter_by(email=get_jwt_identity()).first()
+            if not user:
+                return jsonify({
+                    'message': 'User not found',
+                    'error': 'USER_NOT_FOUND'
+                }), 404
             
-            # Calculate statistics
-            total_attempts = len(scores)
-            if total_attempts > 0:
-                total_score = sum(score.percentage for score in scores)
-                average_score = round(total_score / total_attempts, 1)
-                best_score = max(score.percentage for score in scores)
-                
-                # Get unique subjects attempted
-                subject_ids = set()
-                for score in scores:
-                    quiz = Quizzes.query.get(score.quiz_id)
-                    if quiz and quiz.chapter:
-                        subject_ids.add(quiz.chapter.subject_id)
-                
-                subjects_attempted = len(subject_ids)
-            else:
-                average_score = 0
-                best_score = 0
-                subjects_attempted = 0
+            stats = get_user_stats(user.id)
             
             return jsonify({
-                'totalAttempts': total_attempts,
-                'averageScore': average_score,
-                'bestScore': best_score,
-                'subjectsAttempted': subjects_attempted
+                'totalAttempts': stats.attempts,
+                'averageScore': round(stats.average_score, 1),
+                'bestScore': stats.best_percentage,
+                'subjectsAttempted': stats.subjects_attempted
             }), 200
             
         except Exception as e:
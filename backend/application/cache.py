@@ -1,12 +1,68 @@
 import redis
 from functools import wraps
+from collections import OrderedDict
+import base64
+import hashlib
 import json
+import math
+import random
+import threading
+import time
+import uuid
 from datetime import datetime
+from urllib.parse import urlencode
 import logging
+from flask import current_app, request
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from .cache_metrics import metrics, key_prefix as key_prefix_of
 
 logger = logging.getLogger(__name__)
 redis_client = None
 
+class LRUCache:
+    """
+    Small thread-safe, process-local LRU map.
+    Used as the in-memory tier in front of Redis.
+    """
+    def __init__(self, max_size=256, on_evict=None):
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                evicted, _ = self._data.popitem(last=False)
+                if self.on_evict:
+                    self.on_evict(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
 def init_redis(app):
     """Initialize Redis connection"""
     global redis_client
@@ -23,9 +79,165 @@ def init_redis(app):
         logger.warning(f"Redis connection failed: {str(e)}. Caching will be disabled.")
         redis_client = None
 
+# Two-tier lookup: a process-local LRU in front of Redis.
+#
+# Redis entries carry their logical expiry and how long they took to compute,
+# and are kept STALE_FACTOR x expiry longer than that so an expired entry can
+# still be served while one worker recomputes it. Recomputation is guarded by
+# a per-key lock (single flight); on a cold miss other workers wait for the
+# lock holder's result instead of querying the database themselves. Entries
+# are refreshed probabilistically shortly before they expire (XFetch), so
+# popular keys are usually recomputed before anyone sees them expire.
+LOCAL_CACHE_SECONDS = 10
+LOCAL_CACHE_SIZE = 1024
+STALE_FACTOR = 1.0
+XFETCH_BETA = 1.0
+LOCK_TIMEOUT_SECONDS = 30
+LOCK_WAIT_SECONDS = 5
+LOCK_POLL_SECONDS = 0.05
+
+_local_cache = LRUCache(max_size=LOCAL_CACHE_SIZE, on_evict=metrics.record_eviction)
+_tier_stats = {
+    'local': {'hits': 0, 'misses': 0},
+    'redis': {'hits': 0, 'misses': 0, 'stale_hits': 0},
+    'recomputes': 0,
+    'early_refreshes': 0,
+    'lock_waits': 0
+}
+_stats_lock = threading.Lock()
+
+def _count(tier, event=None):
+    with _stats_lock:
+        if event is None:
+            _tier_stats[tier] += 1
+        else:
+            _tier_stats[tier][event] += 1
+
+def _needs_refresh(entry, now):
+    """XFetch: true after expiry, and with rising probability shortly before it"""
+    return now - entry['delta'] * XFETCH_BETA * math.log(1.0 - random.random()) >= entry['expires_at']
+
+def _acquire_lock(cache_key):
+    token = uuid.uuid4().hex
+    if redis_client.set(f"lock:{cache_key}", token, nx=True, ex=LOCK_TIMEOUT_SECONDS):
+        return token
+    return None
+
+def _release_lock(cache_key, token):
+    lock_key = f"lock:{cache_key}"
+    if redis_client.get(lock_key) == token:
+        redis_client.delete(lock_key)
+
+def _keep_local(cache_key, entry, now):
+    _local_cache.set(cache_key, dict(entry, local_until=min(entry['expires_at'], now + LOCAL_CACHE_SECONDS)))
+
+def _recompute(cache_key, expiry_seconds, compute, endpoint):
+    """Run compute() and store its value in both tiers. Returns the result."""
+    started = time.time()
+    result, value = compute()
+    _count('recomputes')
+    if value is None:
+        return result
+    now = time.time()
+    entry = {'value': value, 'expires_at': now + expiry_seconds, 'delta': now - started}
+    try:
+        payload = json.dumps(entry)
+        redis_client.setex(cache_key, max(int(expiry_seconds * (1 + STALE_FACTOR)), 1), payload)
+        logger.debug(f"Cached result for key: {cache_key}")
+    except (redis.RedisError, TypeError, ValueError) as e:
+        logger.error(f"Failed to cache result: {str(e)}")
+        return result
+    metrics.record_set(key_prefix_of(cache_key), endpoint or '', len(payload))
+    _keep_local(cache_key, entry, now)
+    return result
+
+def _locked_recompute(cache_key, expiry_seconds, compute, endpoint, token):
+    try:
+        return _recompute(cache_key, expiry_seconds, compute, endpoint)
+    finally:
+        try:
+            _release_lock(cache_key, token)
+        except redis.RedisError:
+            pass  # expires on its own
+
+def _wait_for_entry(cache_key):
+    """Poll for the lock holder's result; None if it gave up or timed out"""
+    _count('lock_waits')
+    deadline = time.time() + LOCK_WAIT_SECONDS
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_SECONDS)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(cache_key)
+        pipe.exists(f"lock:{cache_key}")
+        cached, locked = pipe.execute()
+        if cached:
+            return json.loads(cached)
+        if not locked:
+            return None
+    return None
+
+def _lookup(cache_key, expiry_seconds, compute, load, endpoint):
+    """two_tier_get without metrics; returns (result, one of cache_metrics.RESULTS)"""
+    now = time.time()
+    entry = _local_cache.get(cache_key)
+    if entry is not None and now < entry['local_until'] and not _needs_refresh(entry, now):
+        _count('local', 'hits')
+        return load(entry['value']), 'local_hit'
+    _count('local', 'misses')
+
+    try:
+        cached = redis_client.get(cache_key)
+        entry = json.loads(cached) if cached else None
+        if entry is not None:
+            if not _needs_refresh(entry, now):
+                _count('redis', 'hits')
+                _keep_local(cache_key, entry, now)
+                return load(entry['value']), 'redis_hit'
+            # Expired or due for an early refresh: one worker recomputes,
+            # the others keep serving the current entry
+            token = _acquire_lock(cache_key)
+            if token is None:
+                _count('redis', 'stale_hits')
+                return load(entry['value']), 'stale'
+            if now < entry['expires_at']:
+                _count('early_refreshes')
+            return _locked_recompute(cache_key, expiry_seconds, compute, endpoint, token), 'miss'
+
+        _count('redis', 'misses')
+        token = _acquire_lock(cache_key)
+        if token is not None:
+            return _locked_recompute(cache_key, expiry_seconds, compute, endpoint, token), 'miss'
+        entry = _wait_for_entry(cache_key)
+        if entry is not None:
+            _keep_local(cache_key, entry, time.time())
+            return load(entry['value']), 'redis_hit'
+    except redis.RedisError as e:
+        logger.error(f"Cache lookup failed for {cache_key}: {str(e)}")
+        return compute()[0], 'miss'
+    return _recompute(cache_key, expiry_seconds, compute, endpoint), 'miss'
+
+_STATUS = {'local_hit': 'HIT', 'redis_hit': 'HIT', 'stale': 'STALE', 'miss': 'MISS'}
+
+def two_tier_get(cache_key, expiry_seconds, compute, load, endpoint=None):
+    """
+    Look up cache_key in the local tier, then Redis, computing it on a miss.
+    Args:
+        compute: Returns (result, value); value is the JSON-serializable form
+                 stored in the cache, or None if the result must not be cached
+        load: Turns a cached value back into a result
+        endpoint: Name the lookup is reported under in the cache metrics
+    Returns (result, status) where status is HIT, STALE or MISS.
+    """
+    started = time.perf_counter()
+    result, outcome = _lookup(cache_key, expiry_seconds, compute, load, endpoint)
+    metrics.record_lookup(key_prefix_of(cache_key), endpoint or '', cache_key, outcome,
+                          time.perf_counter() - started)
+    return result, _STATUS[outcome]
+
 def cache_with_expiry(expiry_seconds=300, key_prefix=''):
     """
-    Cache decorator with expiry time
+    Cache decorator with expiry time, for plain functions whose result is
+    JSON-serializable. Use cache_response for routes.
     Args:
         expiry_seconds: Time in seconds before cache expires
         key_prefix: Prefix for the cache key
@@ -38,43 +250,195 @@ def cache_with_expiry(expiry_seconds=300, key_prefix=''):
 
             # Create cache key from function arguments
             cache_key = f"{key_prefix}:{f.__name__}:{str(args)}:{str(kwargs)}"
-            
-            # Try to get cached result
-            cached_result = redis_client.get(cache_key)
-            if cached_result:
-                logger.debug(f"Cache hit for key: {cache_key}")
-                return json.loads(cached_result)
-            
-            # Get fresh result
-            result = f(*args, **kwargs)
-            
-            # Cache the result
-            try:
-                redis_client.setex(
-                    cache_key,
-                    expiry_seconds,
-                    json.dumps(result)
-                )
-                logger.debug(f"Cached result for key: {cache_key}")
-            except Exception as e:
-                logger.error(f"Failed to cache result: {str(e)}")
-            
-            return result
+
+            def compute():
+                result = f(*args, **kwargs)
+                return result, result
+
+            return two_tier_get(cache_key, expiry_seconds, compute, lambda value: value, f.__name__)[0]
+        return decorated_function
+    return decorator
+
+# Dependency tags of cached entries. Each tag has a version counter; cache
+# keys embed the versions of their tags, so bumping a counter makes every
+# entry tagged with it unreachable and the old entries simply expire.
+TAG_VERSION_PREFIX = 'tag_version'
+CATALOG_TAG = 'catalog'
+# Subject, chapter and quiz names only; question edits leave it alone
+CATALOG_NAMES_TAG = 'catalog_names'
+# Every committed batch of scores; platform-wide views of attempts depend on it
+SCORES_TAG = 'scores'
+
+_local_tag_versions = {}
+
+def quiz_tag(quiz_id):
+    """Tag of a quiz's content (the quiz and its questions)"""
+    return f"quiz:{quiz_id}"
+
+def user_tag(user_id=None):
+    """Tag of a user's own data (attempts, stats); defaults to the JWT user"""
+    if user_id is None:
+        user_id = get_jwt().get('user_id')
+    return f"user:{user_id}"
+
+def caller_tags():
+    """Tags of a route whose admin view is platform-wide and user view is personal"""
+    if get_jwt().get('is_admin', False):
+        return [CATALOG_TAG, SCORES_TAG]
+    return [user_tag()]
+
+def get_tag_versions(tags):
+    """Current version of each tag, in order"""
+    tags = list(tags)
+    if redis_client and tags:
+        try:
+            return [int(version or 0) for version in
+                    redis_client.mget([f"{TAG_VERSION_PREFIX}:{tag}" for tag in tags])]
+        except redis.RedisError as e:
+            logger.warning(f"Could not read tag versions from Redis: {str(e)}")
+    return [_local_tag_versions.get(tag, 0) for tag in tags]
+
+def invalidate_tags(*tags):
+    """
+    Invalidate every cached entry that depends on any of the tags.
+    Call after the change has been committed. Returns the new version of
+    each tag, or an empty dict if Redis could not be updated.
+    """
+    tags = sorted({tag for tag in tags if tag})
+    if not tags:
+        return {}
+    for tag in tags:
+        _local_tag_versions[tag] = _local_tag_versions.get(tag, 0) + 1
+    versions = {tag: _local_tag_versions[tag] for tag in tags}
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(f"{TAG_VERSION_PREFIX}:{tag}")
+            versions = dict(zip(tags, pipe.execute()))
+        except redis.RedisError as e:
+            logger.error(f"Failed to invalidate tags {tags}: {str(e)}")
+            versions = {}
+    logger.debug(f"Invalidated cache tags: {tags}")
+    return versions
+
+# Who shares a cached response:
+#   public        everyone
+#   role          all users with the same role (admin / user)
+#   user          only the same JWT identity
+#   admin_shared  admins share one entry, everyone else is cached per user
+CACHE_POLICIES = ('public', 'role', 'user', 'admin_shared')
+
+# Headers that describe one particular response rather than the resource
+_UNCACHED_HEADERS = {'content-length', 'set-cookie', 'date', 'x-cache'}
+
+def _cache_vary(policy):
+    """Part of the cache key that separates callers under the given policy"""
+    if policy == 'public':
+        return 'public'
+    role = 'admin' if get_jwt().get('is_admin', False) else 'user'
+    if policy == 'role' or (policy == 'admin_shared' and role == 'admin'):
+        return f"role={role}"
+    return f"user={get_jwt_identity()}"
+
+def _normalized_args():
+    """Path and query arguments in a stable order"""
+    view_args = sorted((key, str(value)) for key, value in (request.view_args or {}).items())
+    query_args = sorted((key, value) for key in request.args for value in request.args.getlist(key))
+    return urlencode(view_args + query_args)
+
+def response_cache_key(key_prefix, policy, tags=()):
+    """
+    Cache key of the current request: prefix, endpoint, caller, arguments
+    and the current versions of its tags
+    """
+    args_digest = hashlib.sha1(_normalized_args().encode()).hexdigest()[:16]
+    cache_key = f"{key_prefix}:{request.endpoint}:{_cache_vary(policy)}:{args_digest}"
+    if tags:
+        tags = sorted(tags)
+        versions = ','.join(f"{tag}={version}" for tag, version in zip(tags, get_tag_versions(tags)))
+        cache_key += f":t{hashlib.sha1(versions.encode()).hexdigest()[:12]}"
+    return cache_key
+
+def _response_entry(response):
+    """Cacheable form of a response: status, headers and body"""
+    body = response.get_data()
+    try:
+        encoded_body, encoding = body.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        encoded_body, encoding = base64.b64encode(body).decode('ascii'), 'base64'
+    return {
+        'status': response.status_code,
+        'headers': [[name, value] for name, value in response.headers.items()
+                    if name.lower() not in _UNCACHED_HEADERS],
+        'body': encoded_body,
+        'encoding': encoding
+    }
+
+def _response_from_entry(entry):
+    body = entry['body'].encode('utf-8') if entry['encoding'] == 'utf-8' else base64.b64decode(entry['body'])
+    return current_app.response_class(body, status=entry['status'], headers=entry['headers'])
+
+def cache_response(key_prefix, expiry_seconds=300, policy='user', tags=()):
+    """
+    Cache the HTTP response of a route in Redis
+    Args:
+        key_prefix: Prefix for the cache keys of this endpoint
+        expiry_seconds: Time in seconds before a cached response expires
+        policy: Who may share a cached response, one of CACHE_POLICIES
+        tags: Dependency tags of the response, or a function of the current
+              request returning them; invalidate_tags() on any of them
+              drops the entry
+    Apply below @jwt_required() so the caller's identity is known. Only 200
+    responses are stored (body, status and headers), in both cache tiers;
+    the X-Cache header reports HIT, STALE or MISS.
+    """
+    if policy not in CACHE_POLICIES:
+        raise ValueError(f"Unknown cache policy: {policy}")
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not redis_client:
+                return f(*args, **kwargs)
+
+            cache_key = response_cache_key(key_prefix, policy, tags() if callable(tags) else tags)
+
+            def compute():
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response, None
+                return response, _response_entry(response)
+
+            response, status = two_tier_get(cache_key, expiry_seconds, compute, _response_from_entry,
+                                             request.endpoint)
+            response.headers['X-Cache'] = status
+            return response
         return decorated_function
     return decorator
 
 def invalidate_cache_prefix(prefix):
     """
-    Invalidate all cache keys with given prefix
+    Invalidate all cache keys with given prefix.
+    Prefer invalidate_tags() for entries with dependency tags.
     """
     if not redis_client:
         return
     
     try:
-        keys = redis_client.keys(f"{prefix}:*")
-        if keys:
-            redis_client.delete(*keys)
-            logger.info(f"Invalidated {len(keys)} cache keys with prefix: {prefix}")
+        # SCAN in batches rather than KEYS, which blocks Redis (and the
+        # Celery broker sharing it) for the whole keyspace walk
+        deleted = 0
+        batch = []
+        for key in redis_client.scan_iter(match=f"{prefix}:*", count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += redis_client.unlink(*batch)
+        if deleted:
+            logger.info(f"Invalidated {deleted} cache keys with prefix: {prefix}")
     except Exception as e:
         logger.error(f"Failed to invalidate cache: {str(e)}")
 
@@ -91,6 +455,39 @@ def clear_all_cache():
     except Exception as e:
         logger.error(f"Failed to clear cache: {str(e)}")
 
+def largest_keys(prefix, limit=20, scan_limit=2000):
+    """
+    Largest Redis entries under a key prefix, by stored size.
+    Walks at most scan_limit keys with SCAN; returns (entries, keys scanned)
+    where entries carry key, bytes and ttl.
+    """
+    if not redis_client:
+        return [], 0
+    keys = []
+    for key in redis_client.scan_iter(match=f"{prefix}:*", count=500):
+        keys.append(key)
+        if len(keys) >= scan_limit:
+            break
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.strlen(key)
+        pipe.ttl(key)
+    results = pipe.execute(raise_on_error=False)
+    sizes = [
+        {'key': key, 'bytes': size, 'ttl': ttl}
+        for key, size, ttl in zip(keys, results[::2], results[1::2])
+        if isinstance(size, int)  # non-string values (e.g. sorted sets) fail STRLEN
+    ]
+    sizes.sort(key=lambda entry: entry['bytes'], reverse=True)
+    return sizes[:limit], len(keys)
+
+def get_tier_stats():
+    """Hit and miss counts of the local and Redis cache tiers in this process"""
+    with _stats_lock:
+        tiers = json.loads(json.dumps(_tier_stats))
+    tiers['local']['entries'] = len(_local_cache)
+    return tiers
+
 def get_cache_stats():
     """Get Redis cache statistics"""
     if not redis_client:
@@ -100,6 +497,7 @@ def get_cache_stats():
         info = redis_client.info()
         return {
             "status": "connected",
+            "tiers": get_tier_stats(),
             "used_memory": info.get('used_memory_human'),
             "connected_clients": info.get('connected_clients'),
             "total_commands_processed": info.get('total_commands_processed'),
@@ -113,4 +511,4 @@ def get_cache_stats():
         }
     except Exception as e:
         logger.error(f"Error getting cache stats: {str(e)}")
-        return {"status": "error", "error": str(e)}
\ No newline at end of file
+        return {"status": "error", "error": str(e), "tiers": get_tier_stats()}
@@ -0,0 +1,235 @@
+"""
+Per-prefix cache metrics.
+
+Every cached lookup is recorded under its key prefix (e.g. summary_charts)
+and endpoint: lookups by result (local_hit, redis_hit, stale, miss), writes
+and their size, local-tier evictions, and a latency histogram for hits and
+misses. The most frequently hit keys of each prefix are tracked with a
+bounded space-saving counter, so memory stays flat however many keys exist.
+
+Counters are process-local; each worker reports its own, the way a
+Prometheus scrape of several workers expects.
+"""
+import threading
+
+RESULTS = ('local_hit', 'redis_hit', 'stale', 'miss')
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Keys tracked per prefix for the hottest-keys list
+HOT_KEYS_TRACKED = 200
+
+
+def key_prefix(cache_key):
+    """Prefix of a cache key (the part before the first ':')"""
+    return str(cache_key).split(':', 1)[0]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs, ending with ('+Inf', count)"""
+        total = 0
+        result = []
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def serialize(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': {str(bound): count for bound, count in self.cumulative()}
+        }
+
+
+class HotKeys:
+    """Approximate top-k hit counts (space-saving algorithm)"""
+
+    def __init__(self, capacity=HOT_KEYS_TRACKED):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            return
+        # Replace the least hit key; its count bounds the newcomer's error
+        coldest = min(self.counts, key=self.counts.get)
+        self.counts[key] = self.counts.pop(coldest) + 1
+
+    def top(self, limit):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class CacheMetrics:
+    """Counters, histograms and hot keys per (prefix, endpoint)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._evictions = {}
+            self._hot_keys = {}
+
+    def _get_series(self, prefix, endpoint):
+        series = self._series.get((prefix, endpoint))
+        if series is None:
+            series = self._series[(prefix, endpoint)] = {
+                'results': dict.fromkeys(RESULTS, 0),
+                'sets': 0,
+                'set_bytes': 0,
+                'latency': {'hit': Histogram(), 'miss': Histogram()}
+            }
+        return series
+
+    def record_lookup(self, prefix, endpoint, cache_key, result, seconds):
+        with self._lock:
+            series = self._get_series(prefix, endpoint)
+            series['results'][result] += 1
+            series['latency']['miss' if result == 'miss' else 'hit'].observe(seconds)
+            if result != 'miss':
+                self._hot_keys.setdefault(prefix, HotKeys()).add(cache_key)
+
+    def record_set(self, prefix, endpoint, size):
+        with self._lock:
+            series = self._get_series(prefix, endpoint)
+            series['sets'] += 1
+            series['set_bytes'] += size
+
+    def record_eviction(self, cache_key):
+        if not isinstance(cache_key, str):
+            return
+        prefix = key_prefix(cache_key)
+        with self._lock:
+            self._evictions[prefix] = self._evictions.get(prefix, 0) + 1
+
+    def prefixes(self):
+        with self._lock:
+            return sorted({prefix for prefix, _ in self._series} | set(self._evictions))
+
+    def hot_keys(self, prefix, limit=20):
+        """Most hit keys of a prefix as (key, approximate hits) pairs"""
+        with self._lock:
+            hot = self._hot_keys.get(prefix)
+            return hot.top(limit) if hot else []
+
+    def snapshot(self):
+        """All counters grouped by prefix, then endpoint"""
+        with self._lock:
+            result = {}
+            for (prefix, endpoint), series in sorted(self._series.items()):
+                lookups = sum(series['results'].values())
+                hits = lookups - series['results']['miss']
+                result.setdefault(prefix, {'evictions': self._evictions.get(prefix, 0), 'endpoints': {}})
+                result[prefix]['endpoints'][endpoint] = {
+                    'lookups': lookups,
+                    **series['results'],
+                    'hit_rate': round(hits / lookups * 100, 2) if lookups else 0,
+                    'sets': series['sets'],
+                    'set_bytes': series['set_bytes'],
+                    'latency': {outcome: histogram.serialize()
+                                for outcome, histogram in series['latency'].items()}
+                }
+            for prefix, evictions in self._evictions.items():
+                result.setdefault(prefix, {'evictions': evictions, 'endpoints': {}})
+            return result
+
+    def series(self):
+        """Copy of the raw series for exporters: ((prefix, endpoint), series) pairs"""
+        with self._lock:
+            return [((prefix, endpoint), {
+                'results': dict(series['results']),
+                'sets': series['sets'],
+                'set_bytes': series['set_bytes'],
+                'latency': {outcome: (histogram.cumulative(), histogram.sum, histogram.count)
+                            for outcome, histogram in series['latency'].items()}
+            }) for (prefix, endpoint), series in sorted(self._series.items())], dict(self._evictions)
+
+
+metrics = CacheMetrics()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_prometheus(tier_stats=None, redis_info=None):
+    """Cache metrics in the Prometheus text exposition format (version 0.0.4)"""
+    series, evictions = metrics.series()
+    lines = []
+
+    def header(name, kind, text):
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    header('quizmaster_cache_requests_total', 'counter', 'Cache lookups by key prefix, endpoint and result')
+    for (prefix, endpoint), data in series:
+        for result, count in data['results'].items():
+            lines.append(f"quizmaster_cache_requests_total"
+                         f"{_labels(prefix=prefix, endpoint=endpoint, result=result)} {count}")
+
+    header('quizmaster_cache_sets_total', 'counter', 'Entries written to the cache')
+    for (prefix, endpoint), data in series:
+        lines.append(f"quizmaster_cache_sets_total{_labels(prefix=prefix, endpoint=endpoint)} {data['sets']}")
+
+    header('quizmaster_cache_set_bytes_total', 'counter', 'Bytes written to the cache')
+    for (prefix, endpoint), data in series:
+        lines.append(f"quizmaster_cache_set_bytes_total{_labels(prefix=prefix, endpoint=endpoint)} {data['set_bytes']}")
+
+    header('quizmaster_cache_evictions_total', 'counter', 'Entries evicted from the local tier')
+    for prefix, count in sorted(evictions.items()):
+        lines.append(f"quizmaster_cache_evictions_total{_labels(prefix=prefix, tier='local')} {count}")
+
+    header('quizmaster_cache_lookup_seconds', 'histogram', 'Cache lookup latency, including recomputation on a miss')
+    for (prefix, endpoint), data in series:
+        for outcome, (buckets, total, count) in data['latency'].items():
+            for bound, cumulative in buckets:
+                lines.append(f"quizmaster_cache_lookup_seconds_bucket"
+                             f"{_labels(prefix=prefix, endpoint=endpoint, outcome=outcome, le=bound)} {cumulative}")
+            labels = _labels(prefix=prefix, endpoint=endpoint, outcome=outcome)
+            lines.append(f"quizmaster_cache_lookup_seconds_sum{labels} {total}")
+            lines.append(f"quizmaster_cache_lookup_seconds_count{labels} {count}")
+
+    if tier_stats:
+        header('quizmaster_cache_tier_events_total', 'counter', 'Cache events per tier')
+        for tier in ('local', 'redis'):
+            for event, count in tier_stats[tier].items():
+                if event != 'entries':
+                    lines.append(f"quizmaster_cache_tier_events_total{_labels(tier=tier, event=event)} {count}")
+        for event in ('recomputes', 'early_refreshes', 'lock_waits'):
+            lines.append(f"quizmaster_cache_tier_events_total{_labels(tier='all', event=event)} {tier_stats[event]}")
+        header('quizmaster_cache_local_entries', 'gauge', 'Entries in the local tier')
+        lines.append(f"quizmaster_cache_local_entries {tier_stats['local']['entries']}")
+
+    if redis_info:
+        for field, kind in (('evicted_keys', 'counter'), ('expired_keys', 'counter'), ('used_memory', 'gauge')):
+            if field in redis_info:
+                name = f"quizmaster_redis_{field}" + ('_total' if kind == 'counter' else '')
+                header(name, kind, f"Redis INFO {field}")
+                lines.append(f"{name} {redis_info[field]}")
+
+    return '\n'.join(lines) + '\n'
@@ -1,152 +1,385 @@
 from main import app, celery, mail, db
+from application.database import create_tuned_engine
 from application.models import Users, Quizzes, Chapters, Subjects, Scores
 from flask_mail import Message
 from datetime import datetime, timedelta
 from sqlalchemy import desc, func, and_, or_
-import csv
 import os
 import logging
+import threading
+from celery.signals import worker_process_init, task_postrun
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy import create_engine
 
 logger = logging.getLogger(__name__)
 
-# Create a function to get a safe session for worker processes
-def get_safe_session():
-    # Get database URI from app config
+# One engine and session factory per worker process, shared by every task.
+# Built lazily (or at worker_process_init) and rebuilt in forked children,
+# which must not reuse connections inherited from the parent.
+_engine = None
+_Session = None
+_engine_pid = None
+_pool_lock = threading.Lock()
+
+pool_metrics = {
+    'connects': 0,
+    'checkouts': 0,
+    'checkins': 0,
+    'checked_out': 0,
+    'max_checked_out': 0,
+    'leaked': 0,
+    'tasks': 0
+}
+_outstanding_after_last_task = 0
+
+def _track_pool(engine):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool_metrics['connects'] += 1
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _pool_lock:
+            pool_metrics['checkouts'] += 1
+            pool_metrics['checked_out'] += 1
+            pool_metrics['max_checked_out'] = max(pool_metrics['max_checked_out'], pool_metrics['checked_out'])
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        with _pool_lock:
+            pool_metrics['checkins'] += 1
+            pool_metrics['checked_out'] -= 1
+
+def init_worker_engine():
+    """Create this process's engine and session factory"""
+    global _engine, _Session, _engine_pid, _outstanding_after_last_task
+    if _engine is not None and _engine_pid != os.getpid():
+        # Inherited from the parent: drop the pool without closing the parent's connections
+        _engine.dispose(close=False)
+    
     with app.app_context():
         db_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
     
-    # Create a new engine and session just for this worker task
-    engine = create_engine(db_uri, connect_args={'check_same_thread': False, 'timeout': 30})
-    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    Session = scoped_session(session_factory)
-    return Session()
+    _engine = create_tuned_engine(
+        db_uri,
+        app.config,
+        pool_size=app.config.get('CELERY_DB_POOL_SIZE', 5),
+        max_overflow=app.config.get('CELERY_DB_MAX_OVERFLOW', 5),
+        pool_pre_ping=True
+    )
+    _track_pool(_engine)
+    _Session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=_engine))
+    _engine_pid = os.getpid()
+    pool_metrics['checked_out'] = 0
+    _outstanding_after_last_task = 0
+    logger.info(f"Worker process {_engine_pid} database engine initialised")
+
+@worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    init_worker_engine()
+
+# Create a function to get a safe session for worker processes
+def get_safe_session():
+    """Session for the current task, bound to the process-wide engine"""
+    if _engine is None or _engine_pid != os.getpid():
+        init_worker_engine()
+    return _Session()
+
+@task_postrun.connect
+def on_task_postrun(task_id=None, task=None, **kwargs):
+    """End the task's session scope and record connections it failed to return"""
+    global _outstanding_after_last_task
+    if _Session is None:
+        return
+    _Session.remove()
+    pool_metrics['tasks'] += 1
+    new_leaks = pool_metrics['checked_out'] - _outstanding_after_last_task
+    if new_leaks > 0:
+        pool_metrics['leaked'] += new_leaks
+        logger.warning(
+            f"Task {task.name if task else task_id} left {new_leaks} "
+            f"database connection(s) checked out"
+        )
+    _outstanding_after_last_task = pool_metrics['checked_out']
+
+def get_pool_metrics():
+    """Snapshot of this worker process's connection pool counters"""
+    metrics = dict(pool_metrics)
+    metrics['pid'] = os.getpid()
+    metrics['pool_status'] = _engine.pool.status() if _engine is not None else None
+    return metrics
+
+@celery.task
+def report_pool_metrics():
+    """Return the connection pool counters of the worker that runs this task"""
+    return get_pool_metrics()
+
+@celery.task
+def rebuild_user_stats():
+    """Recompute UserStats and UserSubjectStats from the Scores table"""
+    from application.user_stats import rebuild_user_stats as rebuild
+    session = get_safe_session()
+    try:
+        return {'users': rebuild(session)}
+    except Exception:
+        session.rollback()
+        raise
+
+@celery.task
+def refresh_analytics_rollups(days=2):
+    """
+    Recompute the daily analytics rollups for the last `days` days (all days
+    if days is None), picking up scores and users written outside the API.
+    """
+    from application.rollups import rebuild_rollups
+    since = datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+    session = get_safe_session()
+    try:
+        return {'days': rebuild_rollups(session, since=since)}
+    except Exception:
+        session.rollback()
+        raise
+
+@celery.task
+def refresh_platform_averages():
+    """Publish fresh platform-wide averages for the performance comparison chart"""
+    from application.rollups import refresh_platform_averages as refresh
+    session = get_safe_session()
+    return refresh(session)
+
+@celery.task
+def rebuild_leaderboards():
+    """Recreate the Redis leaderboards from UserStats, UserSubjectStats and Scores"""
+    from application.leaderboards import rebuild_leaderboards as rebuild
+    session = get_safe_session()
+    return {'leaderboards': rebuild(session)}
 
 @celery.task(bind=True)
-def generate_user_quiz_export(self, user_id, filename):
+def generate_user_quiz_export(self, user_id, filename, export_format='csv'):
     """
-    Generate CSV export of user's quiz attempts
+    Generate an export of user's quiz attempts in export_format (see
+    export_writers), streamed from the database in chunks. Progress is
+    reported as the PROGRESS task state and published for the SSE status stream.
     """
+    if isinstance(export_format, bool):
+        # Tasks queued before formats existed passed a compress flag
+        export_format = 'csv.gz' if export_format else 'csv'
+    from application.exports import export_user_quizzes, release_export, progress_event, publish_progress
+    from application.export_store import register_export_file, touch_export_file
+    task_id = self.request.id
+
+    def report_progress(current, total):
+        if task_id:
+            self.update_state(state='PROGRESS', meta={
+                'current': current,
+                'total': total,
+                'status': f'Processing row {current} of {total}',
+                'user_id': user_id
+            })
+            publish_progress(task_id, progress_event('in_progress', user_id, current, total, filename))
+
+    def finish(result, rows=0):
+        # The owner lets the status endpoints check access without Redis
+        result['user_id'] = user_id
+        publish_progress(task_id, progress_event('completed', user_id, rows, rows, result['filename'],
+                                                 result['message']))
+        return result
+
     try:
         logger.info(f"Starting quiz export for user {user_id}")
-        
-        # Create a safe database session (like other tasks)
         session = get_safe_session()
-        
         try:
-            # First get the user's email - since Scores.user_id contains emails, not IDs
-            user = session.query(Users).filter(Users.id == user_id).first()
-            if not user:
+            with app.app_context():
+                export_dir = os.path.join(app.instance_path, 'exports')
+            os.makedirs(export_dir, exist_ok=True)
+            file_path = os.path.join(export_dir, filename)
+            if os.path.exists(file_path):
+                # Content-addressed: an identical export was already written
+                logger.info(f"Reusing existing export {filename} for user {user_id}")
+                if touch_export_file(session, filename) is None:
+                    register_export_file(session, file_path, owner_id=user_id, kind='user',
+                                         export_format=export_format, task_id=task_id,
+                                         retention=app.config.get('EXPORT_RETENTION_DAYS', 14))
+                return finish({
+                    'status': 'completed',
+                    'message': 'Export completed successfully',
+                    'filename': filename,
+                    'reused': True
+                })
+
+            rows = export_user_quizzes(session, user_id, file_path, export_format=export_format,
+                                       on_progress=report_progress)
+            if rows is None:
                 logger.error(f"User with ID {user_id} not found")
-                return {
+                return finish({
                     'status': 'completed',
                     'message': 'User not found',
                     'filename': None
-                }
-            
-            user_email = user.email
-            logger.info(f"Found user {user.username} with email {user_email}")
-            
-            # Get all quiz attempts by the user with related data
-            # NOTE: Scores.user_id contains email addresses, not user IDs
-            scores = session.query(Scores, Quizzes, Chapters, Subjects)\
-                .join(Quizzes, Scores.quiz_id == Quizzes.id)\
-                .join(Chapters, Quizzes.chapter_id == Chapters.id)\
-                .join(Subjects, Chapters.subject_id == Subjects.id)\
-                .filter(Scores.user_id == user_email)\
-                .order_by(Scores.time_stamp_of_attempt.desc())\
-                .all()
-            
-            if not scores:
-                logger.warning(f"No quiz attempts found for user {user_id} (email: {user_email})")
-                return {
+                })
+            if not rows:
+                logger.warning(f"No quiz attempts found for user {user_id}")
+                return finish({
                     'status': 'completed',
                     'message': 'No quiz attempts found',
                     'filename': None
-                }
-            
-            logger.info(f"Found {len(scores)} quiz attempts for user {user_id}")
-            
-            # Use consistent path with API (app.instance_path/exports)
-            with app.app_context():
-                export_dir = os.path.join(app.instance_path, 'exports')
-                os.makedirs(export_dir, exist_ok=True)
-                try:
-                    os.chmod(export_dir, 0o777)  # Make sure directory is writable
-                except:
-                    pass  # Ignore permission errors, just try to create
-
-                # Create CSV file
-                file_path = os.path.join(export_dir, filename)
-                with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile)
-                    
-                    # Write headers
-                    writer.writerow([
-                        'Quiz ID',
-                        'Quiz Name',
-                        'Chapter ID',
-                        'Chapter Name',
-                        'Subject ID',
-                        'Subject Name',
-                        'Date of Quiz',
-                        'Attempt Date',
-                        'Score',
-                        'Total Score',
-                        'Percentage',
-                        'Passed',
-                        'Time Taken (minutes)',
-                        'Time Taken (seconds)',
-                        'Remarks'
-                    ])
-                    
-                    # Write data rows
-                    total_rows = len(scores)
-                    for idx, (score, quiz, chapter, subject) in enumerate(scores, 1):
-                        writer.writerow([
-                            quiz.id,
-                            quiz.name,
-                            chapter.id,
-                            chapter.name,
-                            subject.id,
-                            subject.name,
-                            quiz.date_of_quiz.strftime('%Y-%m-%d') if quiz.date_of_quiz else 'N/A',
-                            score.time_stamp_of_attempt.strftime('%Y-%m-%d %H:%M:%S'),
-                            score.total_scored,
-                            score.total_possible_score,
-                            f"{score.percentage:.2f}%",
-                            'Yes' if score.passed else 'No',
-                            f"{score.time_taken / 60:.1f}" if score.time_taken else '0.0',
-                            score.time_taken if score.time_taken else 0,
-                            quiz.remarks or ''
-                        ])
-                        
-                        # Update progress (only if running in Celery context)
-                        if hasattr(self, 'request') and self.request.id:
-                            self.update_state(
-                                state='PROGRESS',
-                                meta={
-                                    'current': idx,
-                                    'total': total_rows,
-                                    'status': f'Processing row {idx} of {total_rows}'
-                                }
-                            )
-            
+                })
+
+            register_export_file(session, file_path, owner_id=user_id, kind='user', export_format=export_format,
+                                 rows=rows, task_id=task_id,
+                                 retention=app.config.get('EXPORT_RETENTION_DAYS', 14))
             logger.info(f"Export completed successfully for user {user_id}")
-                
-            return {
+            return finish({
                 'status': 'completed',
                 'message': 'Export completed successfully',
-                'filename': filename
-            }
+                'filename': filename,
+                'rows': rows
+            }, rows)
         finally:
-            # Always close the session
             session.close()
-            
+
     except Exception as e:
         logger.error(f"Export failed for user {user_id}: {str(e)}")
+        release_export(filename, task_id)
+        publish_progress(task_id, progress_event('failed', user_id, filename=filename, message=str(e)))
+        raise
+
+def _partition_dir(export_id):
+    with app.app_context():
+        return os.path.join(app.instance_path, 'exports', 'partitions', export_id)
+
+def _fail_platform_export(export_id, filename, user_id, error):
+    """
+    Report a failed platform export and remove its partitions, once per
+    export: the chord callback that would clean up will not run
+    """
+    import shutil
+    from application.exports import release_export, progress_event, publish_progress, mark_export_failed
+    if not mark_export_failed(export_id):
+        return
+    shutil.rmtree(_partition_dir(export_id), ignore_errors=True)
+    release_export(filename, export_id)
+    publish_progress(export_id, progress_event('failed', user_id, filename=filename, message=str(error)))
+
+@celery.task(bind=True)
+def export_platform_partition(self, export_id, filename, export_format, index, first_id, last_id, total,
+                              user_id=None):
+    """
+    Write the scores with ids in [first_id, last_id] as partition `index` of
+    the platform export `export_id`. Rows are added to the export's shared
+    counter, which is reported as the progress of the whole export. Stops
+    as soon as another partition of the export has failed.
+    """
+    import shutil
+    from application.export_writers import write_export
+    from application.exports import (PLATFORM_FIELDS, platform_rows, add_partition_rows, progress_event,
+                                     publish_progress, export_failed, ExportAborted)
+    reported = {'rows': 0}
+
+    def check_aborted():
+        if export_failed(export_id):
+            raise ExportAborted(f"Platform export {export_id} failed in another partition")
+
+    def report_progress(written):
+        check_aborted()
+        progress = add_partition_rows(export_id, written - reported['rows'])
+        reported['rows'] = written
+        if progress is None:
+            return
+        current, rate = progress
+        if self.request.id:
+            self.update_state(task_id=export_id, state='PROGRESS', meta={
+                'current': current,
+                'total': total,
+                'status': f'Processing row {current} of {total}'
+            })
+        publish_progress(export_id, progress_event('in_progress', user_id, current, total, filename,
+                                                   rows_per_second=rate))
+
+    session = get_safe_session()
+    directory = _partition_dir(export_id)
+    try:
+        check_aborted()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'part-{index:05d}')
+        rows = write_export(path, export_format, PLATFORM_FIELDS, platform_rows(session, first_id, last_id),
+                            report_progress, header=False)
+        if export_failed(export_id):
+            # Failed while this partition was being written: do not leave it behind
+            shutil.rmtree(directory, ignore_errors=True)
+            check_aborted()
+        logger.info(f"Platform export {export_id}: partition {index} wrote {rows} rows")
+        return {'index': index, 'path': path, 'rows': rows}
+    except ExportAborted:
+        logger.info(f"Platform export {export_id}: partition {index} stopped, the export failed")
+        raise
+    except Exception as e:
+        logger.error(f"Platform export {export_id}: partition {index} failed: {str(e)}")
+        _fail_platform_export(export_id, filename, user_id, e)
+        raise
+    finally:
+        session.close()
+
+@celery.task(bind=True)
+def merge_platform_export(self, partitions, export_id, filename, export_format, started_at, user_id=None):
+    """
+    Chord callback of the platform export: join the partitions in id order
+    into the downloadable file and remove them
+    """
+    import shutil
+    import time
+    from application.export_writers import merge_exports
+    from application.exports import PLATFORM_FIELDS, progress_event, publish_progress
+    from application.export_store import register_export_file
+    partitions = sorted(partitions, key=lambda partition: partition['index'])
+    rows = sum(partition['rows'] for partition in partitions)
+    session = get_safe_session()
+    try:
+        with app.app_context():
+            path = os.path.join(app.instance_path, 'exports', filename)
+        merge_exports(export_format, PLATFORM_FIELDS, [partition['path'] for partition in partitions], path)
+        register_export_file(session, path, owner_id=user_id, kind='platform', export_format=export_format,
+                             rows=rows, task_id=export_id, retention=app.config.get('EXPORT_RETENTION_DAYS', 14))
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Platform export {export_id}: merge failed: {str(e)}")
+        _fail_platform_export(export_id, filename, user_id, e)
+        raise
+    finally:
+        session.close()
+        shutil.rmtree(_partition_dir(export_id), ignore_errors=True)
+
+    elapsed = time.time() - started_at
+    rate = round(rows / elapsed) if elapsed > 0 else None
+    logger.info(f"Platform export {export_id}: {rows} rows from {len(partitions)} partitions "
+                f"in {elapsed:.1f}s ({rate} rows/s)")
+    publish_progress(export_id, progress_event('completed', user_id, rows, rows, filename, rows_per_second=rate))
+    return {
+        'status': 'completed',
+        'message': 'Export completed successfully',
+        'filename': filename,
+        'rows': rows,
+        'partitions': len(partitions),
+        'seconds': round(elapsed, 1),
+        'rows_per_second': rate
+    }
+
+@celery.task
+def clean_export_files():
+    """
+    Delete expired exports (auto_delete_days), the least recently used ones
+    above EXPORT_QUOTA_MB, and leftover partial or untracked files
+    """
+    from application.export_store import clean_exports
+    session = get_safe_session()
+    try:
+        with app.app_context():
+            export_dir = os.path.join(app.instance_path, 'exports')
+        return clean_exports(session, export_dir, quota_bytes=app.config.get('EXPORT_QUOTA_MB', 2048) * 2**20)
+    except Exception:
+        session.rollback()
         raise
+    finally:
+        session.close()
 
 @celery.task
 def send_daily_reminders():
@@ -8,6 +8,13 @@ DATABASE_DIR = os.path.join(BASE_DIR, 'instance')
 # Ensure the instance directory exists
 os.makedirs(DATABASE_DIR, exist_ok=True)
 
+def _optional_int(name, default):
+    """Integer setting from the environment; an empty value means unset (None)"""
+    value = os.environ.get(name, default)
+    if value is None or not str(value).strip():
+        return None
+    return int(value)
+
 class Config():
     DEBUG = False
     SQLITE_DB_DIR = DATABASE_DIR
@@ -18,6 +25,35 @@ class Config():
     REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+    
+    # SQLite tuning, applied to every connection of the app and Celery engines
+    # (see application/database.py). Set a value to an empty string to leave it at SQLite's default.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = _optional_int('SQLITE_BUSY_TIMEOUT_MS', 30000)
+    SQLITE_CACHE_SIZE_KB = _optional_int('SQLITE_CACHE_SIZE_KB', 65536)
+    SQLITE_MMAP_SIZE = _optional_int('SQLITE_MMAP_SIZE', 268435456)  # 256 MiB
+    
+    # Connection pool of the per-process engine used by Celery tasks
+    CELERY_DB_POOL_SIZE = int(os.environ.get('CELERY_DB_POOL_SIZE', 5))
+    CELERY_DB_MAX_OVERFLOW = int(os.environ.get('CELERY_DB_MAX_OVERFLOW', 5))
+    
+    # Write-behind score persistence (see application/score_writer.py)
+    # When enabled, graded submissions are spooled locally and inserted in batches
+    SCORE_WRITE_BEHIND = os.environ.get('SCORE_WRITE_BEHIND', 'false').lower() in ['true', '1', 'on']
+    SCORE_SPOOL_PATH = os.environ.get('SCORE_SPOOL_PATH', os.path.join(DATABASE_DIR, 'score_spool.sqlite3'))
+    SCORE_FLUSH_INTERVAL = float(os.environ.get('SCORE_FLUSH_INTERVAL', 0.25))  # seconds
+    SCORE_FLUSH_BATCH_SIZE = int(os.environ.get('SCORE_FLUSH_BATCH_SIZE', 500))
+    
+    # Export storage (see application/export_store.py)
+    # Retention when the owner has no usable auto_delete_days preference, and for platform exports
+    EXPORT_RETENTION_DAYS = int(os.environ.get('EXPORT_RETENTION_DAYS', 14))
+    # Total size of instance/exports; least recently downloaded files go first when exceeded
+    EXPORT_QUOTA_MB = int(os.environ.get('EXPORT_QUOTA_MB', 2048))
+    # Let the front server send export files: X-Sendfile (Apache, lighttpd) or,
+    # with a prefix set, X-Accel-Redirect to <prefix>/<filename> (nginx internal location)
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() in ['true', '1', 'on']
+    EXPORT_ACCEL_REDIRECT_PREFIX = os.environ.get('EXPORT_ACCEL_REDIRECT_PREFIX', '')
 
 class LocalDevelopmentConfig(Config):
     # Full path to the SQLite database file
@@ -28,6 +64,9 @@ class LocalDevelopmentConfig(Config):
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'dev-jwt-secret-key')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)  # Token expires in 24 hours
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)   # Refresh token expires in 30 days
+    # Access tokens are only read from headers; the export progress stream has its own
+    # short-lived, task-scoped token (see stream_export_status)
+    JWT_TOKEN_LOCATION = ['headers']
     
     # Email Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
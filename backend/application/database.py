@@ -1,6 +1,90 @@
+import logging
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+
+logger = logging.getLogger(__name__)
 
 # Create a single SQLAlchemy instance to be used across the app
 db = SQLAlchemy()
 
-# No need for separate Base or engine - they're already managed by Flask-SQLAlchemy
\ No newline at end of file
+# No need for separate Base or engine - they're already managed by Flask-SQLAlchemy
+
+# Accepted values of the text pragmas; anything else is skipped with a warning
+SQLITE_PRAGMA_CHOICES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+}
+
+def _pragma_value(name, value):
+    """Normalized PRAGMA value, or None to leave the setting at SQLite's default"""
+    if value is None:
+        return None
+    if name in SQLITE_PRAGMA_CHOICES:
+        value = str(value).strip().upper()
+        if not value:
+            return None
+        if value not in SQLITE_PRAGMA_CHOICES[name]:
+            logger.warning(f"Ignoring invalid SQLite {name} setting {value!r}")
+            return None
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid SQLite {name} setting {value!r}")
+            return None
+    return value
+
+def sqlite_pragmas(config):
+    """
+    Build the PRAGMA statements for new SQLite connections from app config.
+    Unset, empty and invalid values are left out so SQLite keeps its default.
+    Order matters: busy_timeout first so the journal_mode switch can wait for locks.
+    """
+    cache_size_kb = _pragma_value('cache_size', config.get('SQLITE_CACHE_SIZE_KB'))
+    pragmas = [
+        ('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS')),
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS')),
+        # Negative cache_size is in KiB rather than pages
+        ('cache_size', -cache_size_kb if cache_size_kb else None),
+        ('mmap_size', config.get('SQLITE_MMAP_SIZE')),
+    ]
+    pragmas = [(name, _pragma_value(name, value)) for name, value in pragmas]
+    return [(name, value) for name, value in pragmas if value is not None]
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the given PRAGMAs on every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+def create_tuned_engine(db_uri, config, **engine_options):
+    """Create an engine outside Flask-SQLAlchemy with the same SQLite tuning as the app"""
+    if db_uri.startswith('sqlite'):
+        connect_args = engine_options.setdefault('connect_args', {})
+        connect_args.setdefault('check_same_thread', False)
+        busy_timeout_ms = _pragma_value('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS'))
+        if busy_timeout_ms:
+            connect_args.setdefault('timeout', busy_timeout_ms / 1000)
+    engine = create_engine(db_uri, **engine_options)
+    apply_sqlite_pragmas(engine, sqlite_pragmas(config))
+    return engine
+
+def init_db(app):
+    """Bind db to the app and apply the SQLite tuning profile to its engine"""
+    db.init_app(app)
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, sqlite_pragmas(app.config))
@@ -0,0 +1,159 @@
+"""
+Bookkeeping for the files in instance/exports.
+
+Every finished export is recorded in ExportFiles with its owner, size and
+expiry. A user export expires after the owner's auto_delete_days preference
+(EXPORT_RETENTION_DAYS when it is missing or not a number, never when it is
+"never"); platform exports use EXPORT_RETENTION_DAYS. Downloads update
+last_accessed_at.
+
+clean_exports(), run periodically by the clean_export_files Celery task:
+- deletes expired files
+- deletes the least recently accessed files while the total size is above
+  EXPORT_QUOTA_MB
+- removes leftovers: partial (.part) files, partition directories and
+  untracked files older than ORPHAN_GRACE_SECONDS
+
+A deleted export also releases the Redis claim of the task that wrote it
+(see exports.claim_export), so the next identical request renders it again
+instead of attaching to that task. A claim held by a newer task that is
+rendering the same file again is kept.
+"""
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from .exports import release_export
+from .models import ExportFiles, UserPreferences
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 14
+DEFAULT_QUOTA_MB = 2048
+# Untracked files and partial writes younger than this may still be in progress
+ORPHAN_GRACE_SECONDS = 86400
+
+
+def retention_days(session, owner_id, default=DEFAULT_RETENTION_DAYS):
+    """Days a user's exports are kept (UserPreferences.auto_delete_days), None for never"""
+    if owner_id is None:
+        return default
+    preference = session.query(UserPreferences.auto_delete_days)\
+        .filter(UserPreferences.user_id == owner_id).scalar()
+    if preference is None:
+        return default
+    preference = str(preference).strip().lower()
+    if preference == 'never':
+        return None
+    try:
+        days = int(preference)
+    except ValueError:
+        return default
+    return days if days > 0 else default
+
+
+def register_export_file(session, path, owner_id=None, kind='user', export_format=None, rows=None,
+                         task_id=None, retention=DEFAULT_RETENTION_DAYS):
+    """Record (or refresh) a finished export file and commit"""
+    filename = os.path.basename(path)
+    now = datetime.utcnow()
+    days = retention_days(session, owner_id, retention) if kind == 'user' else retention
+    record = session.query(ExportFiles).filter(ExportFiles.filename == filename).first()
+    if record is None:
+        record = ExportFiles(filename=filename, created_at=now, downloads=0)
+        session.add(record)
+    record.owner_id = owner_id
+    record.kind = kind
+    record.export_format = export_format
+    record.size_bytes = os.path.getsize(path)
+    record.rows = rows if rows is not None else record.rows
+    record.task_id = task_id or record.task_id
+    record.last_accessed_at = now
+    record.expires_at = now + timedelta(days=days) if days else None
+    session.commit()
+    return record
+
+
+def touch_export_file(session, filename, download=False):
+    """Mark an export as used (reused by a request or downloaded) and commit"""
+    record = session.query(ExportFiles).filter(ExportFiles.filename == filename).first()
+    if record is None:
+        return None
+    record.last_accessed_at = datetime.utcnow()
+    if download:
+        record.downloads = (record.downloads or 0) + 1
+    session.commit()
+    return record
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def delete_export_file(session, export_dir, record):
+    """Delete an export's file and record (the caller commits)"""
+    _remove(os.path.join(export_dir, record.filename))
+    release_export(record.filename, record.task_id)
+    session.delete(record)
+
+
+def clean_exports(session, export_dir, quota_bytes=DEFAULT_QUOTA_MB * 2**20, now=None):
+    """
+    Enforce retention and the quota on export_dir.
+    Returns the number of files removed per reason, and the bytes in use after.
+    """
+    now = now or datetime.utcnow()
+    removed = {'expired': 0, 'over_quota': 0, 'missing': 0, 'orphaned': 0, 'freed_bytes': 0}
+
+    for record in session.query(ExportFiles).filter(ExportFiles.expires_at <= now).all():
+        removed['expired'] += 1
+        removed['freed_bytes'] += record.size_bytes or 0
+        delete_export_file(session, export_dir, record)
+    session.commit()
+
+    # Records whose file was removed by hand
+    records = []
+    for record in session.query(ExportFiles).order_by(ExportFiles.last_accessed_at):
+        if os.path.exists(os.path.join(export_dir, record.filename)):
+            records.append(record)
+        else:
+            removed['missing'] += 1
+            delete_export_file(session, export_dir, record)
+
+    used = sum(record.size_bytes or 0 for record in records)
+    for record in records:  # least recently accessed first
+        if used <= quota_bytes:
+            break
+        used -= record.size_bytes or 0
+        removed['over_quota'] += 1
+        removed['freed_bytes'] += record.size_bytes or 0
+        delete_export_file(session, export_dir, record)
+    session.commit()
+
+    # Leftovers: partial writes, abandoned partitions and files written before tracking
+    tracked = {filename for filename, in session.query(ExportFiles.filename)}
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    if os.path.isdir(export_dir):
+        for entry in os.scandir(export_dir):
+            if entry.is_dir():
+                if entry.name == 'partitions':
+                    for partition_dir in os.scandir(entry.path):
+                        if partition_dir.stat().st_mtime <= cutoff:
+                            shutil.rmtree(partition_dir.path, ignore_errors=True)
+                            removed['orphaned'] += 1
+                continue
+            if entry.name in tracked or entry.stat().st_mtime > cutoff:
+                continue
+            removed['freed_bytes'] += entry.stat().st_size
+            _remove(entry.path)
+            removed['orphaned'] += 1
+
+    removed['used_bytes'] = used
+    if any(removed[reason] for reason in ('expired', 'over_quota', 'missing', 'orphaned')):
+        logger.info(f"Cleaned exports: {removed}")
+    return removed
@@ -0,0 +1,287 @@
+"""
+File writers for exports, one per format, fed by the same row source.
+
+Row sources yield typed tuples in the order of a field list, where each
+field is (name, CSV header, kind). Writers receive the rows in batches of at
+most EXPORT_BATCH_ROWS, so memory stays bounded whatever the export size:
+
+- csv / csv.gz: the CSV layout users already get (headers as labels,
+  percentages as "50.00%", booleans as Yes/No), optionally gzip-compressed
+- jsonl / jsonl.gz: one JSON object per row, keyed by field name
+- parquet / arrow: columnar files (Parquet, Arrow IPC) with typed columns,
+  one row group / record batch per batch; only offered when pyarrow is
+  installed
+
+write_export() writes to a temporary file renamed into place once complete,
+so a reader never sees a partial export. Large exports can be written as
+several partitions (header=False) in parallel and joined with
+merge_exports(): text formats by appending the partition files byte for
+byte (gzip files may hold several members), columnar formats by copying
+their row groups / record batches one at a time.
+"""
+import csv
+import gzip
+import json
+import logging
+import os
+import shutil
+import uuid
+from itertools import islice
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Columnar formats are optional
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_ROWS = 1000
+
+
+def _csv_value(kind, value):
+    if kind == 'date':
+        return value.strftime('%Y-%m-%d') if value else 'N/A'
+    if kind == 'timestamp':
+        return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+    if kind == 'percent':
+        return f"{value or 0:.2f}%"
+    if kind == 'bool':
+        return 'Yes' if value else 'No'
+    if kind == 'minutes':
+        return f"{value or 0:.1f}"
+    return '' if value is None else value
+
+
+def _json_value(kind, value):
+    if kind in ('date', 'timestamp') and value is not None:
+        return value.isoformat()
+    return value
+
+
+def _append_files(writer_class, fields, paths, path):
+    """Header (if the format has one) followed by the bytes of each headerless partition"""
+    writer_class(path, fields).close()
+    with open(path, 'ab') as target:
+        for partition in paths:
+            with open(partition, 'rb') as source:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+class CsvWriter:
+    extension = 'csv'
+    mimetype = 'text/csv'
+    compress = False
+
+    def __init__(self, path, fields, header=True):
+        self.kinds = [kind for _, _, kind in fields]
+        if self.compress:
+            self.handle = gzip.open(path, 'wt', newline='', encoding='utf-8')
+        else:
+            self.handle = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.handle)
+        if header:
+            self.writer.writerow([label for _, label, _ in fields])
+
+    def write_batch(self, rows):
+        self.writer.writerows([_csv_value(kind, value) for kind, value in zip(self.kinds, row)] for row in rows)
+
+    def close(self):
+        self.handle.close()
+
+    @classmethod
+    def merge(cls, fields, paths, path):
+        _append_files(cls, fields, paths, path)
+
+
+class GzipCsvWriter(CsvWriter):
+    extension = 'csv.gz'
+    mimetype = 'application/gzip'
+    compress = True
+
+
+class JsonLinesWriter:
+    extension = 'jsonl'
+    mimetype = 'application/x-ndjson'
+    compress = False
+
+    def __init__(self, path, fields, header=True):
+        self.names = [name for name, _, _ in fields]
+        self.kinds = [kind for _, _, kind in fields]
+        if self.compress:
+            self.handle = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self.handle = open(path, 'w', encoding='utf-8')
+
+    def write_batch(self, rows):
+        self.handle.writelines(
+            json.dumps({name: _json_value(kind, value) for name, kind, value in zip(self.names, self.kinds, row)})
+            + '\n'
+            for row in rows
+        )
+
+    def close(self):
+        self.handle.close()
+
+    @classmethod
+    def merge(cls, fields, paths, path):
+        _append_files(cls, fields, paths, path)
+
+
+class GzipJsonLinesWriter(JsonLinesWriter):
+    extension = 'jsonl.gz'
+    mimetype = 'application/gzip'
+    compress = True
+
+
+def _arrow_schema(fields):
+    types = {
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'percent': pyarrow.float64(),
+        'minutes': pyarrow.float64(),
+        'str': pyarrow.string(),
+        'bool': pyarrow.bool_(),
+        'date': pyarrow.date32(),
+        'timestamp': pyarrow.timestamp('ms'),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, _, kind in fields])
+
+
+class _ArrowWriter:
+    """Typed columnar output; each batch becomes one row group / record batch"""
+
+    def __init__(self, path, fields, header=True):
+        self.schema = _arrow_schema(fields)
+        self.writer = self._open(path)
+
+    def write_batch(self, rows):
+        columns = list(zip(*rows)) or [[] for _ in self.schema]
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+class ParquetWriter(_ArrowWriter):
+    extension = 'parquet'
+    mimetype = 'application/vnd.apache.parquet'
+
+    def _open(self, path):
+        return pyarrow.parquet.ParquetWriter(path, self.schema, compression='snappy')
+
+    @classmethod
+    def merge(cls, fields, paths, path):
+        writer = cls(path, fields)
+        try:
+            for partition in paths:
+                source = pyarrow.parquet.ParquetFile(partition)
+                for group in range(source.num_row_groups):
+                    writer.writer.write_table(source.read_row_group(group))
+        finally:
+            writer.close()
+
+
+class ArrowWriter(_ArrowWriter):
+    extension = 'arrow'
+    mimetype = 'application/vnd.apache.arrow.file'
+
+    def _open(self, path):
+        self.sink = pyarrow.OSFile(path, 'wb')
+        return pyarrow.ipc.new_file(self.sink, self.schema)
+
+    @classmethod
+    def merge(cls, fields, paths, path):
+        writer = cls(path, fields)
+        try:
+            for partition in paths:
+                with pyarrow.OSFile(partition, 'rb') as handle:
+                    source = pyarrow.ipc.open_file(handle)
+                    for batch in range(source.num_record_batches):
+                        writer.writer.write_batch(source.get_batch(batch))
+        finally:
+            writer.close()
+
+    def close(self):
+        super().close()
+        self.sink.close()
+
+
+WRITERS = {writer.extension: writer for writer in (CsvWriter, GzipCsvWriter, JsonLinesWriter, GzipJsonLinesWriter)}
+if pyarrow is not None:
+    WRITERS.update({writer.extension: writer for writer in (ParquetWriter, ArrowWriter)})
+
+# Every format the code knows, including those that need optional packages
+ALL_FORMATS = ('csv', 'csv.gz', 'jsonl', 'jsonl.gz', 'parquet', 'arrow')
+DEFAULT_FORMAT = 'csv'
+
+
+def available_formats():
+    return list(WRITERS)
+
+
+def format_of(filename):
+    """Export format of a file name, by its longest matching extension"""
+    for extension in sorted(WRITERS, key=len, reverse=True):
+        if filename.endswith('.' + extension):
+            return extension
+    return None
+
+
+def mimetype_of(filename):
+    writer = WRITERS.get(format_of(filename))
+    return writer.mimetype if writer else 'application/octet-stream'
+
+
+def _writer_class(export_format):
+    writer_class = WRITERS.get(export_format)
+    if writer_class is None:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    return writer_class
+
+
+def write_export(path, export_format, fields, rows, on_progress=None, batch_rows=EXPORT_BATCH_ROWS, header=True):
+    """
+    Stream rows into path in the given format and return the number of rows
+    written. on_progress(rows_written) is called after every batch. Pass
+    header=False for partitions that merge_exports() will join.
+    """
+    writer_class = _writer_class(export_format)
+    partial_path = f'{path}.{uuid.uuid4().hex}.part'
+    written = 0
+    rows = iter(rows)
+    try:
+        writer = writer_class(partial_path, fields, header=header)
+        try:
+            while True:
+                batch = list(islice(rows, batch_rows))
+                if not batch:
+                    break
+                writer.write_batch(batch)
+                written += len(batch)
+                if on_progress:
+                    on_progress(written)
+        finally:
+            writer.close()
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return written
+
+
+def merge_exports(export_format, fields, paths, path):
+    """Join partitions written with header=False, in order, into one export file at path"""
+    partial_path = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        _writer_class(export_format).merge(fields, paths, partial_path)
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
@@ -0,0 +1,468 @@
+"""
+Streaming exports of quiz attempts.
+
+user_quiz_rows() reads a user's attempts with yield_per, so the ORM fetches
+EXPORT_CHUNK_SIZE rows at a time from the cursor instead of materializing
+every (Score, Quiz, Chapter, Subject) tuple. The rows are typed tuples
+matching USER_QUIZ_FIELDS; export_writers turns them into CSV, JSON Lines or
+columnar files batch by batch. Memory stays bounded by the chunk size
+whatever the number of attempts.
+
+Exports are content-addressed: the file name carries a digest of what the
+export contains (user, format, newest score id, number of scores and the
+catalog cache-tag version, which moves on any rename). Identical requests
+map to the same file, and claim_export() records in Redis which task
+produces it, so a repeat request attaches to that task instead of
+rendering the same file again.
+
+Export tasks publish their progress (rows written, percent, completion and
+the download URL) on the Redis channel export_progress:<task_id> and keep
+the latest event under the key of the same name. export_events() replays
+that snapshot and then follows the channel, which is what the server-sent
+events endpoint streams to the browser.
+
+The admin platform export covers every score. platform_partitions() splits
+the Scores id space into ranges of about EXPORT_PARTITION_ROWS rows; each
+range is written by its own Celery task (header-less, see export_writers)
+and a chord callback merges the partitions in id order. Partition tasks add
+their rows to a shared Redis counter, so progress and throughput are
+reported for the export as a whole. The first partition to fail marks the
+export failed and cleans up; the others see the mark and stop.
+"""
+import hashlib
+import json
+import logging
+import time
+
+import redis
+from sqlalchemy import String, cast, func
+from sqlalchemy.orm import aliased
+
+from . import cache
+from .export_writers import WRITERS, ALL_FORMATS, DEFAULT_FORMAT, mimetype_of, write_export
+from .models import Users, Quizzes, Chapters, Subjects, Scores
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_TASK_PREFIX = 'export_task'
+# How long the claim of a task answers repeat requests (Celery's default result lifetime);
+# after that, the ExportFiles record of the stored file does until it expires
+EXPORT_REUSE_SECONDS = 86400
+EXPORT_PROGRESS_PREFIX = 'export_progress'
+EXPORT_OWNER_PREFIX = 'export_owner'
+# Lifetime of the task-scoped token that authorizes a progress stream
+EXPORT_STREAM_TOKEN_SECONDS = 3600
+# Longest a progress stream stays open; EventSource reconnects after that
+EXPORT_STREAM_SECONDS = 600
+# Interval of keep-alive comments on an idle progress stream
+EXPORT_HEARTBEAT_SECONDS = 15
+TERMINAL_STATES = ('completed', 'failed')
+# Rows per partition task of the platform export
+EXPORT_PARTITION_ROWS = 100_000
+EXPORT_ROWS_PREFIX = 'export_rows'
+EXPORT_FAILED_PREFIX = 'export_failed'
+
+# (name, CSV header, kind), see export_writers
+USER_QUIZ_FIELDS = [
+    ('quiz_id', 'Quiz ID', 'int'),
+    ('quiz_name', 'Quiz Name', 'str'),
+    ('chapter_id', 'Chapter ID', 'int'),
+    ('chapter_name', 'Chapter Name', 'str'),
+    ('subject_id', 'Subject ID', 'int'),
+    ('subject_name', 'Subject Name', 'str'),
+    ('date_of_quiz', 'Date of Quiz', 'date'),
+    ('attempted_at', 'Attempt Date', 'timestamp'),
+    ('score', 'Score', 'float'),
+    ('total_score', 'Total Score', 'float'),
+    ('percentage', 'Percentage', 'percent'),
+    ('passed', 'Passed', 'bool'),
+    ('time_taken_minutes', 'Time Taken (minutes)', 'minutes'),
+    ('time_taken_seconds', 'Time Taken (seconds)', 'int'),
+    ('remarks', 'Remarks', 'str'),
+]
+
+
+class ExportFormatError(ValueError):
+    """Requested export format is unknown or needs a package that is not installed"""
+
+
+class ExportAborted(RuntimeError):
+    """Another partition of the same partitioned export has failed"""
+
+
+def resolve_format(requested=None, compress=False, preferred=None):
+    """
+    Export format for a request: the requested one, else the user's
+    preference (UserPreferences.default_export_format) if usable, else CSV.
+    compress=True asks for the gzip variant of a text format.
+    """
+    if requested:
+        export_format = requested.lower().lstrip('.')
+        if export_format not in ALL_FORMATS:
+            raise ExportFormatError(f"Unknown export format '{requested}'. Use one of: {', '.join(ALL_FORMATS)}")
+        if export_format not in WRITERS:
+            raise ExportFormatError(f"Export format '{export_format}' requires pyarrow, which is not installed")
+    elif preferred and preferred.lower() in WRITERS:
+        export_format = preferred.lower()
+    else:
+        export_format = DEFAULT_FORMAT
+    if compress and f'{export_format}.gz' in WRITERS:
+        export_format = f'{export_format}.gz'
+    return export_format
+
+
+def export_filename(prefix, key, export_format=DEFAULT_FORMAT):
+    return f'{prefix}_{key}.{WRITERS[export_format].extension}'
+
+
+def export_digest(*parts):
+    """Short stable digest of the values that determine an export's content"""
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+def export_mimetype(filename):
+    return mimetype_of(filename)
+
+
+def _user_scores_filter(user):
+    # Scores.user_id holds the JWT identity (email) for submissions, the id for older rows
+    return Scores.user_id.in_([user.id, user.email])
+
+
+def count_user_quiz_rows(session, user):
+    return session.query(Scores.id).filter(_user_scores_filter(user)).count()
+
+
+def user_quiz_fingerprint(session, user, export_format=DEFAULT_FORMAT):
+    """
+    Digest identifying the content of a user's export.
+    A new attempt moves the newest score id and the count; a renamed
+    subject, chapter or quiz moves the catalog tag version.
+    """
+    latest_id, rows = session.query(func.max(Scores.id), func.count(Scores.id))\
+        .filter(_user_scores_filter(user)).one()
+    catalog_version = cache.get_tag_versions([cache.CATALOG_TAG])[0]
+    return export_digest(user.id, export_format, latest_id or 0, rows, catalog_version)
+
+
+def _task_key(filename):
+    return f"{EXPORT_TASK_PREFIX}:{filename}"
+
+
+def claim_export(filename, task_id, owner_id=None):
+    """
+    Record task_id as the producer of filename, and owner_id as the user it
+    runs for, unless another task already is. Returns the task id that
+    produces the file: task_id if the caller should queue it, the existing
+    one otherwise. Without Redis every caller queues.
+    """
+    if not cache.redis_client:
+        return task_id
+    try:
+        if cache.redis_client.set(_task_key(filename), task_id, nx=True, ex=EXPORT_REUSE_SECONDS):
+            if owner_id is not None:
+                cache.redis_client.set(f"{EXPORT_OWNER_PREFIX}:{task_id}", owner_id, ex=EXPORT_REUSE_SECONDS)
+            return task_id
+        existing = cache.redis_client.get(_task_key(filename))
+        return existing or task_id
+    except redis.RedisError as e:
+        logger.warning(f"Could not coordinate export {filename} in Redis: {str(e)}")
+        return task_id
+
+
+def export_task_id(filename):
+    """Id of the task recorded as producing filename, if any"""
+    if not cache.redis_client:
+        return None
+    try:
+        return cache.redis_client.get(_task_key(filename))
+    except redis.RedisError:
+        return None
+
+
+def export_owner(task_id):
+    """Id of the user an export task was claimed for, if Redis knows it"""
+    if not cache.redis_client:
+        return None
+    try:
+        owner_id = cache.redis_client.get(f"{EXPORT_OWNER_PREFIX}:{task_id}")
+    except redis.RedisError:
+        return None
+    return int(owner_id) if owner_id else None
+
+
+def release_export(filename, task_id):
+    """
+    Forget task_id as the producer of filename so the next request queues a
+    new one (after a failure, or once the file is deleted). A claim taken by
+    another task since is left alone.
+    """
+    if not cache.redis_client:
+        return
+    key = _task_key(filename)
+    try:
+        with cache.redis_client.pipeline() as pipe:
+            pipe.watch(key)
+            if pipe.get(key) != task_id:
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.execute()
+    except redis.WatchError:
+        pass  # Claimed again in the meantime
+    except redis.RedisError as e:
+        logger.warning(f"Could not release export {filename} in Redis: {str(e)}")
+
+
+def download_url(filename):
+    return f'/api/exports/download/{filename}'
+
+
+def progress_event(state, user_id=None, current=0, total=0, filename=None, message=None, rows_per_second=None):
+    """Progress payload shared by the pub/sub channel and the SSE stream"""
+    return {
+        'state': state,
+        'status': message or {
+            'in_progress': f'Processing row {current} of {total}',
+            'completed': 'Export completed successfully',
+            'failed': 'Export failed'
+        }.get(state, 'Export is pending...'),
+        'user_id': user_id,
+        'current': current,
+        'total': total,
+        'percent': round(current * 100 / total, 1) if total else (100.0 if state == 'completed' else 0.0),
+        'filename': filename,
+        'download_url': download_url(filename) if state == 'completed' and filename else None,
+        'rows_per_second': rows_per_second
+    }
+
+
+def publish_progress(task_id, event):
+    """Store the latest progress event of a task and publish it to subscribers"""
+    if not cache.redis_client or not task_id:
+        return
+    key = f"{EXPORT_PROGRESS_PREFIX}:{task_id}"
+    payload = json.dumps(event)
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.set(key, payload, ex=EXPORT_REUSE_SECONDS)
+        pipe.publish(key, payload)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish progress of export task {task_id}: {str(e)}")
+
+
+def export_progress(task_id):
+    """Latest progress event of a task, or None"""
+    if not cache.redis_client:
+        return None
+    try:
+        payload = cache.redis_client.get(f"{EXPORT_PROGRESS_PREFIX}:{task_id}")
+    except redis.RedisError:
+        return None
+    return json.loads(payload) if payload else None
+
+
+def export_events(task_id, timeout=EXPORT_STREAM_SECONDS, heartbeat=EXPORT_HEARTBEAT_SECONDS):
+    """
+    Yield a task's progress events as they are published, starting with the
+    latest one, until it completes or fails or timeout seconds pass. Yields
+    None after heartbeat idle seconds so the caller can keep the connection
+    alive. Requires Redis.
+    """
+    key = f"{EXPORT_PROGRESS_PREFIX}:{task_id}"
+    pubsub = cache.redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribe before reading the snapshot so no event falls in between
+        pubsub.subscribe(key)
+        snapshot = export_progress(task_id)
+        if snapshot:
+            yield snapshot
+            if snapshot['state'] in TERMINAL_STATES:
+                return
+        deadline = time.monotonic() + timeout
+        idle_since = time.monotonic()
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=min(1.0, heartbeat))
+            if message is None:
+                if time.monotonic() - idle_since >= heartbeat:
+                    idle_since = time.monotonic()
+                    yield None
+                continue
+            idle_since = time.monotonic()
+            event = json.loads(message['data'])
+            yield event
+            if event['state'] in TERMINAL_STATES:
+                return
+    finally:
+        pubsub.close()
+
+
+def user_quiz_rows(session, user, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a user's attempts as USER_QUIZ_FIELDS tuples, newest first, chunk_size rows per fetch"""
+    # Outer joins, as in platform_rows: every attempt counted by count_user_quiz_rows
+    # is exported, with empty quiz, chapter or subject columns if those were deleted
+    query = session.query(
+        Scores.quiz_id, Quizzes.name, Chapters.id, Chapters.name, Subjects.id, Subjects.name,
+        Quizzes.date_of_quiz, Scores.time_stamp_of_attempt, Scores.total_scored, Scores.total_possible_score,
+        Scores.percentage, Scores.passed, Scores.time_taken, Quizzes.remarks
+    ).outerjoin(Quizzes, Scores.quiz_id == Quizzes.id)\
+        .outerjoin(Chapters, Quizzes.chapter_id == Chapters.id)\
+        .outerjoin(Subjects, Chapters.subject_id == Subjects.id)\
+        .filter(_user_scores_filter(user))\
+        .order_by(Scores.time_stamp_of_attempt.desc(), Scores.id.desc())\
+        .yield_per(chunk_size)
+
+    for row in query:
+        yield score_row(row)
+
+
+def score_row(row):
+    """USER_QUIZ_FIELDS tuple from the (quiz, chapter, subject, score) columns of an export query"""
+    (quiz_id, quiz_name, chapter_id, chapter_name, subject_id, subject_name, date_of_quiz,
+     attempted_at, total_scored, total_possible, percentage, passed, time_taken, remarks) = row
+    return (
+        quiz_id, quiz_name, chapter_id, chapter_name, subject_id, subject_name, date_of_quiz,
+        attempted_at, total_scored, total_possible, percentage or 0.0, bool(passed),
+        (time_taken or 0) / 60, time_taken or 0, remarks
+    )
+
+
+def export_user_quizzes(session, user_id, path, export_format=DEFAULT_FORMAT, on_progress=None):
+    """
+    Write a user's quiz attempts to path in export_format.
+    Returns the number of rows, or None if the user does not exist.
+    on_progress(current, total) is called as rows are written.
+    """
+    user = session.query(Users).filter(Users.id == user_id).first()
+    if user is None:
+        return None
+    total = count_user_quiz_rows(session, user)
+    if not total:
+        return 0
+    report = (lambda current: on_progress(current, total)) if on_progress else None
+    written = write_export(path, export_format, USER_QUIZ_FIELDS, user_quiz_rows(session, user), report)
+    logger.info(f"Exported {written} quiz attempts of user {user_id} to {path} ({export_format})")
+    return written
+
+
+# Platform export: every score with its user, quiz, chapter and subject
+PLATFORM_FIELDS = [
+    ('score_id', 'Score ID', 'int'),
+    ('user_id', 'User ID', 'int'),
+    ('username', 'Username', 'str'),
+] + USER_QUIZ_FIELDS
+
+
+def platform_fingerprint(session, export_format=DEFAULT_FORMAT):
+    """Digest identifying the content of the platform export, and its number of rows"""
+    latest_id, rows = session.query(func.max(Scores.id), func.count(Scores.id)).one()
+    catalog_version = cache.get_tag_versions([cache.CATALOG_TAG])[0]
+    return export_digest('platform', export_format, latest_id or 0, rows, catalog_version), rows
+
+
+def platform_partitions(session, partition_rows=EXPORT_PARTITION_ROWS):
+    """
+    Consecutive (first_id, last_id, rows) ranges of Scores ids, each holding
+    partition_rows rows except the last. Every boundary is found by a keyset
+    step from the previous one, so the whole split reads the id index once.
+    """
+    partitions = []
+    first_id = session.query(func.min(Scores.id)).scalar()
+    while first_id is not None:
+        last_id = session.query(Scores.id).filter(Scores.id >= first_id)\
+            .order_by(Scores.id).offset(partition_rows - 1).limit(1).scalar()
+        if last_id is None:
+            last_id = session.query(func.max(Scores.id)).scalar()
+            rows = session.query(func.count(Scores.id)).filter(Scores.id >= first_id).scalar()
+            partitions.append((first_id, last_id, rows))
+            break
+        partitions.append((first_id, last_id, partition_rows))
+        first_id = session.query(func.min(Scores.id)).filter(Scores.id > last_id).scalar()
+    return partitions
+
+
+def platform_rows(session, first_id, last_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield PLATFORM_FIELDS tuples for the scores with ids in [first_id, last_id], in id order"""
+    # Scores.user_id holds either Users.id or the user's email (JWT identity). The cast
+    # gives the email comparison text affinity, so it can use the Users.email index.
+    by_id = aliased(Users)
+    by_email = aliased(Users)
+    # Outer joins throughout: every score is exported (and counted in the total),
+    # with empty quiz, chapter or subject columns if those were deleted
+    query = session.query(
+        Scores.id, func.coalesce(by_id.id, by_email.id), func.coalesce(by_id.username, by_email.username),
+        Scores.quiz_id, Quizzes.name, Chapters.id, Chapters.name, Subjects.id, Subjects.name,
+        Quizzes.date_of_quiz, Scores.time_stamp_of_attempt, Scores.total_scored, Scores.total_possible_score,
+        Scores.percentage, Scores.passed, Scores.time_taken, Quizzes.remarks
+    ).outerjoin(Quizzes, Scores.quiz_id == Quizzes.id)\
+        .outerjoin(Chapters, Quizzes.chapter_id == Chapters.id)\
+        .outerjoin(Subjects, Chapters.subject_id == Subjects.id)\
+        .outerjoin(by_id, by_id.id == Scores.user_id)\
+        .outerjoin(by_email, by_email.email == cast(Scores.user_id, String))\
+        .filter(Scores.id.between(first_id, last_id))\
+        .order_by(Scores.id)\
+        .yield_per(chunk_size)
+
+    for row in query:
+        yield tuple(row[:3]) + score_row(row[3:])
+
+
+def start_partitioned_export(export_id):
+    """Reset the shared row counter of a partitioned export and record its start time"""
+    if not cache.redis_client:
+        return
+    key = f"{EXPORT_ROWS_PREFIX}:{export_id}"
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.hset(key, mapping={'rows': 0, 'started_at': time.time()})
+        pipe.expire(key, EXPORT_REUSE_SECONDS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not start progress tracking of export {export_id}: {str(e)}")
+
+
+def add_partition_rows(export_id, rows):
+    """
+    Add rows written by one partition to the export's shared counter.
+    Returns (rows written so far, rows per second), or None without Redis.
+    """
+    if not cache.redis_client:
+        return None
+    key = f"{EXPORT_ROWS_PREFIX}:{export_id}"
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.hincrby(key, 'rows', rows)
+        pipe.hget(key, 'started_at')
+        written, started_at = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not record progress of export {export_id}: {str(e)}")
+        return None
+    elapsed = time.time() - float(started_at or time.time())
+    return written, round(written / elapsed) if elapsed > 0 else None
+
+
+def mark_export_failed(export_id):
+    """
+    Record that a partitioned export failed. Returns True for the first
+    caller only, which cleans up after the export (always True without Redis).
+    """
+    if not cache.redis_client:
+        return True
+    try:
+        return bool(cache.redis_client.set(f"{EXPORT_FAILED_PREFIX}:{export_id}", 1, nx=True,
+                                           ex=EXPORT_REUSE_SECONDS))
+    except redis.RedisError as e:
+        logger.warning(f"Could not record the failure of export {export_id}: {str(e)}")
+        return True
+
+
+def export_failed(export_id):
+    """Whether a partition of the export has failed, so the others can stop"""
+    if not cache.redis_client:
+        return False
+    try:
+        return bool(cache.redis_client.exists(f"{EXPORT_FAILED_PREFIX}:{export_id}"))
+    except redis.RedisError:
+        return False
@@ -0,0 +1,211 @@
+"""
+Ranked leaderboards kept in Redis sorted sets.
+
+Three scopes are maintained, each holding non-admin user ids:
+
+    leaderboard:global          scored by the user's average percentage
+                                (every non-admin user, 0 before any attempt)
+    leaderboard:subject:<id>    scored by the user's average in that subject
+    leaderboard:quiz:<id>       scored by the user's best percentage on that quiz
+
+publish_scores() updates the affected members after each committed batch of
+scores (see score_writer), using the averages already maintained in
+UserStats and UserSubjectStats. Pages, a user's rank and their neighbours are
+then O(log n) sorted-set reads. publish_new_user() adds a new user to the
+global board. rebuild_leaderboards() recreates every set from the database;
+when Redis starts empty the first reader does it under a lock while the
+others, like every reader without Redis, compute the same answers from the
+stats tables.
+"""
+import logging
+import redis
+from sqlalchemy import func
+
+from . import cache
+from .database import db
+from .models import Users, Quizzes, Chapters, Scores, UserStats, UserSubjectStats
+from .user_stats import resolve_user_ids
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('global', 'subject', 'quiz')
+KEY_PREFIX = 'leaderboard'
+BUILT_MARKER = f'{KEY_PREFIX}:built'
+# Outside the leaderboard: namespace so a rebuild does not drop it as a stale set
+REBUILD_LOCK = f'{KEY_PREFIX}_rebuild_lock'
+REBUILD_LOCK_SECONDS = 300
+
+
+def leaderboard_key(scope, scope_id=None):
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown leaderboard scope: {scope}")
+    return f'{KEY_PREFIX}:global' if scope == 'global' else f'{KEY_PREFIX}:{scope}:{scope_id}'
+
+
+def _non_admin(query, user_column):
+    return query.join(Users, Users.id == user_column).filter(Users.is_admin == False)
+
+
+def _scope_scores(scope, scope_id=None, user_ids=None, session=None):
+    """(user_id, score) pairs of a scope, read from the database"""
+    session = session or db.session
+    if scope == 'global':
+        # Users without attempts are ranked too, with a score of 0
+        query = session.query(Users.id, UserStats.total_percentage / UserStats.attempts)\
+            .outerjoin(UserStats, UserStats.user_id == Users.id)\
+            .filter(Users.is_admin == False)
+        user_column = Users.id
+    elif scope == 'subject':
+        query = _non_admin(session.query(
+            UserSubjectStats.user_id, UserSubjectStats.total_percentage / UserSubjectStats.attempts
+        ), UserSubjectStats.user_id).filter(UserSubjectStats.subject_id == scope_id,
+                                            UserSubjectStats.attempts > 0)
+        user_column = UserSubjectStats.user_id
+    else:
+        query = session.query(Users.id, func.max(Scores.percentage))\
+            .join(Scores, (Scores.user_id == Users.id) | (Scores.user_id == Users.email))\
+            .filter(Users.is_admin == False, Scores.quiz_id == scope_id)\
+            .group_by(Users.id)
+        user_column = Users.id
+    if user_ids is not None:
+        query = query.filter(user_column.in_(list(user_ids)))
+    return [(user_id, float(score or 0)) for user_id, score in query]
+
+
+def publish_scores(attempts):
+    """
+    Push the new standings of the users in a committed batch of scores.
+    attempts: (Scores.user_id, Scores.quiz_id) pairs of the batch.
+    """
+    if not cache.redis_client or not attempts:
+        return
+    try:
+        if not cache.redis_client.exists(BUILT_MARKER):
+            return  # built from the database on first read
+        user_ids = set(resolve_user_ids(user_id for user_id, _ in attempts).values())
+        quiz_ids = {quiz_id for _, quiz_id in attempts}
+        subject_ids = {subject_id for _, subject_id in db.session.query(Quizzes.id, Chapters.subject_id)
+                       .join(Chapters, Quizzes.chapter_id == Chapters.id)
+                       .filter(Quizzes.id.in_(quiz_ids))}
+
+        pipe = cache.redis_client.pipeline()
+        for scope, scope_ids in (('global', [None]), ('subject', subject_ids), ('quiz', quiz_ids)):
+            for scope_id in scope_ids:
+                members = dict(_scope_scores(scope, scope_id, user_ids))
+                if members:
+                    pipe.zadd(leaderboard_key(scope, scope_id), members)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Leaderboard update failed, rebuild to resync: {str(e)}")
+
+
+def publish_new_user(user):
+    """Rank a newly registered (committed) user on the global board with a score of 0"""
+    if not cache.redis_client or user.is_admin:
+        return
+    try:
+        if cache.redis_client.exists(BUILT_MARKER):
+            cache.redis_client.zadd(leaderboard_key('global'), {user.id: 0}, nx=True)
+    except redis.RedisError as e:
+        logger.warning(f"Leaderboard update failed, rebuild to resync: {str(e)}")
+
+
+def rebuild_leaderboards(session=None):
+    """Recreate every leaderboard sorted set from the database"""
+    if not cache.redis_client:
+        return 0
+    session = session or db.session
+    boards = {leaderboard_key('global'): _scope_scores('global', session=session)}
+    for subject_id, in session.query(UserSubjectStats.subject_id).distinct():
+        boards[leaderboard_key('subject', subject_id)] = _scope_scores('subject', subject_id, session=session)
+    for quiz_id, in session.query(Scores.quiz_id).distinct():
+        boards[leaderboard_key('quiz', quiz_id)] = _scope_scores('quiz', quiz_id, session=session)
+
+    stale = set(cache.redis_client.scan_iter(match=f'{KEY_PREFIX}:*', count=500)) - set(boards)
+    pipe = cache.redis_client.pipeline()
+    for key, members in boards.items():
+        # Build under a temporary name and swap it in, so readers never see a partial set
+        if members:
+            pipe.delete(f'{key}:rebuild')
+            pipe.zadd(f'{key}:rebuild', dict(members))
+            pipe.rename(f'{key}:rebuild', key)
+        else:
+            pipe.delete(key)
+    stale.discard(BUILT_MARKER)
+    if stale:
+        pipe.delete(*stale)
+    pipe.set(BUILT_MARKER, 1)
+    pipe.execute()
+    logger.info(f"Rebuilt {len(boards)} leaderboards")
+    return len(boards)
+
+
+def _entries(ranked, offset):
+    return [{'user_id': int(user_id), 'score': round(score, 2), 'rank': offset + index + 1}
+            for index, (user_id, score) in enumerate(ranked)]
+
+
+def _ensure_built():
+    """
+    True once the sorted sets exist, building them if needed. Only the caller
+    holding REBUILD_LOCK rebuilds; the others get False and read the database.
+    """
+    client = cache.redis_client
+    if client.exists(BUILT_MARKER):
+        return True
+    if not client.set(REBUILD_LOCK, 1, nx=True, ex=REBUILD_LOCK_SECONDS):
+        return False
+    try:
+        rebuild_leaderboards()
+    finally:
+        client.delete(REBUILD_LOCK)
+    return True
+
+
+def _redis_board(key, offset, limit, user_id, neighbours):
+    client = cache.redis_client
+    pipe = client.pipeline()
+    pipe.zcard(key)
+    pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+    if user_id is not None:
+        pipe.zrevrank(key, user_id)
+        pipe.zscore(key, user_id)
+    results = pipe.execute()
+    board = {'total': results[0], 'entries': _entries(results[1], offset), 'me': None, 'neighbours': []}
+
+    if user_id is not None and results[2] is not None:
+        rank = results[2]
+        board['me'] = {'user_id': user_id, 'rank': rank + 1, 'score': round(results[3], 2)}
+        start = max(rank - neighbours, 0)
+        board['neighbours'] = _entries(client.zrevrange(key, start, rank + neighbours, withscores=True), start)
+    return board
+
+
+def _sql_board(scope, scope_id, offset, limit, user_id, neighbours):
+    # Same order as ZREVRANGE: score descending, then member string descending
+    ranked = sorted(_scope_scores(scope, scope_id), key=lambda member: (member[1], str(member[0])), reverse=True)
+    board = {'total': len(ranked), 'entries': _entries(ranked[offset:offset + limit], offset),
+             'me': None, 'neighbours': []}
+    position = next((index for index, (member, _) in enumerate(ranked) if member == user_id), None)
+    if position is not None:
+        board['me'] = {'user_id': user_id, 'rank': position + 1, 'score': round(ranked[position][1], 2)}
+        start = max(position - neighbours, 0)
+        board['neighbours'] = _entries(ranked[start:position + neighbours + 1], start)
+    return board
+
+
+def get_leaderboard(scope='global', scope_id=None, offset=0, limit=20, user_id=None, neighbours=2):
+    """
+    One page of a leaderboard plus, if user_id is given, that user's rank and
+    the members ranked around them.
+    Returns a dict with total, entries, me and neighbours; entries carry
+    user_id, score and 1-based rank.
+    """
+    key = leaderboard_key(scope, scope_id)
+    if cache.redis_client:
+        try:
+            if _ensure_built():
+                return _redis_board(key, offset, limit, user_id, neighbours)
+        except redis.RedisError as e:
+            logger.warning(f"Leaderboard read from Redis failed, using the database: {str(e)}")
+    return _sql_board(scope, scope_id, offset, limit, user_id, neighbours)
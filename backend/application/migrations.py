@@ -0,0 +1,74 @@
+"""
+Lightweight schema upgrades for existing databases.
+
+db.create_all() only creates missing tables. upgrade_schema() additionally
+adds columns and indexes that were introduced after a table was first
+created, and the full-text search tables (see search_index), so an older
+instance/database.sqlite3 keeps working without a separate migration tool.
+Only additive changes are handled here: new columns must be nullable or
+carry a server default. Renamed indexes are the exception: the index under
+its old name is dropped once the new one exists.
+"""
+import logging
+from sqlalchemy import inspect, text
+
+from .database import db
+from .search_index import ensure_search_index
+
+logger = logging.getLogger(__name__)
+
+# Old index name -> current name in models.py
+RENAMED_INDEXES = {
+    'ix_scores_quiz_id_user_id': 'ix_scores_quiz_id_user_id_time',
+}
+
+
+def _add_missing_columns(connection, table):
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        connection.execute(text(ddl))
+        logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _create_missing_indexes(connection, table):
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    created = 0
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(connection)
+            created += 1
+            logger.info(f"Created index {index.name} on {table.name}")
+    return created
+
+
+def _drop_renamed_indexes(connection, table):
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    for old_name, new_name in RENAMED_INDEXES.items():
+        if old_name in existing and new_name in existing:
+            connection.execute(text(f'DROP INDEX "{old_name}"'))
+            logger.info(f"Dropped index {old_name} on {table.name}, renamed to {new_name}")
+
+
+def upgrade_schema():
+    """Bring the tables of an existing database up to the current models"""
+    with db.engine.begin() as connection:
+        created_indexes = 0
+        for table in db.metadata.sorted_tables:
+            if not inspect(connection).has_table(table.name):
+                continue
+            _add_missing_columns(connection, table)
+            created_indexes += _create_missing_indexes(connection, table)
+            _drop_renamed_indexes(connection, table)
+
+        # Full-text search tables and the triggers that keep them in sync
+        created_indexes += ensure_search_index(connection)
+
+        if created_indexes and connection.dialect.name == 'sqlite':
+            # Give the query planner statistics for the new indexes
+            connection.execute(text('ANALYZE'))
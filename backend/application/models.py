@@ -1,7 +1,7 @@
 from .database import db
 from datetime import datetime
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Float, Text, JSON, Time
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Float, Text, JSON, Time, func
 import re
 
 class Users(db.Model):
@@ -231,6 +231,11 @@ class Chapters(db.Model):
     order = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Chapters of a subject, listed by order
+        db.Index('ix_chapters_subject_id_order', 'subject_id', 'order'),
+    )
+
     # Relationships
     subject = relationship("Subjects", back_populates="chapters")
     quizzes = relationship("Quizzes", back_populates="chapter")
@@ -256,16 +261,52 @@ class Quizzes(db.Model):
     description = db.Column(db.String)
     date_of_quiz = db.Column(db.Date)
     time_duration = db.Column(db.Integer)  # in minutes
-    total_questions = db.Column(db.Integer)
+    total_questions = db.Column(db.Integer, default=0)  # maintained by question writes, see adjust_question_count
     passing_score = db.Column(db.Float)
     remarks = db.Column(db.String)
     is_active = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        # Quizzes of a chapter (catalog filter, reminder and report joins)
+        db.Index('ix_quizzes_chapter_id', 'chapter_id'),
+    )
+
     # Relationships
     chapter = relationship("Chapters", back_populates="quizzes")
     questions = relationship("Questions", back_populates="quiz")
     scores = relationship("Scores", back_populates="quiz")
 
+    @classmethod
+    def adjust_question_count(cls, quiz_id, delta):
+        """
+        Shift the stored question count of a quiz by delta.
+        Runs as a single UPDATE in the caller's transaction, so concurrent
+        question writes cannot lose increments.
+        """
+        db.session.query(cls).filter(cls.id == quiz_id).update(
+            {cls.total_questions: func.coalesce(cls.total_questions, 0) + delta},
+            synchronize_session=False
+        )
+
+    @classmethod
+    def resync_question_counts(cls):
+        """
+        Fix stored question counts that differ from the Questions table.
+        Returns the number of quizzes updated; commits only if there were any.
+        """
+        actual_count = db.session.query(func.count(Questions.id))\
+            .filter(Questions.quiz_id == cls.id)\
+            .correlate(cls)\
+            .scalar_subquery()
+        fixed = db.session.query(cls)\
+            .filter(cls.total_questions.is_distinct_from(actual_count))\
+            .update({cls.total_questions: actual_count}, synchronize_session=False)
+        if fixed:
+            db.session.commit()
+        else:
+            db.session.rollback()
+        return fixed
+
     def serialize(self):
         return {
             'id': self.id,
@@ -274,7 +315,7 @@ class Quizzes(db.Model):
             'description': self.description,
             'date_of_quiz': str(self.date_of_quiz) if self.date_of_quiz else None,
             'time_duration': self.time_duration,
-            'total_questions': len(self.questions),  # Use actual count instead of stored value
+            'total_questions': self.total_questions or 0,
             'passing_score': self.passing_score,
             'remarks': self.remarks,
             'is_active': self.is_active
@@ -296,6 +337,11 @@ class Questions(db.Model):
     difficulty_level = db.Column(db.String)
     marks = db.Column(db.Float, default=1.0)
 
+    __table_args__ = (
+        # Questions of a quiz (quiz paper, answer key, question counts)
+        db.Index('ix_questions_quiz_id', 'quiz_id'),
+    )
+
     # Relationships
     quiz = relationship("Quizzes", back_populates="questions")
 
@@ -329,6 +375,17 @@ class Scores(db.Model):
     time_taken = db.Column(db.Integer)  # in seconds
     percentage = db.Column(db.Float)
     passed = db.Column(db.Boolean)
+    attempt_id = db.Column(db.String, nullable=True)  # client-visible id of the submission
+
+    __table_args__ = (
+        db.Index('ix_scores_attempt_id', 'attempt_id', unique=True),
+        # A user's attempts by date: recent scores, activity, monthly reports, exports
+        db.Index('ix_scores_user_id_time_stamp', 'user_id', 'time_stamp_of_attempt'),
+        # Attempts of a quiz, optionally for one user, by date
+        db.Index('ix_scores_quiz_id_user_id_time', 'quiz_id', 'user_id', 'time_stamp_of_attempt'),
+        # Platform-wide date ranges in analytics
+        db.Index('ix_scores_time_stamp', 'time_stamp_of_attempt'),
+    )
 
     # Relationships
     user = relationship("Users", back_populates="scores")
@@ -344,9 +401,143 @@ class Scores(db.Model):
             'total_possible_score': self.total_possible_score,
             'time_taken': self.time_taken,
             'percentage': self.percentage,
-            'passed': self.passed
+            'passed': self.passed,
+            'attempt_id': self.attempt_id
         }
 
     def __repr__(self):
         return f'<Score {self.id}>'
 
+
+class UserStats(db.Model):
+    """Running totals of a user's attempts, maintained on every score insert"""
+    __tablename__ = "UserStats"
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    total_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    best_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    time_spent = db.Column(db.Integer, nullable=False, default=0)  # in seconds
+    subjects_attempted = db.Column(db.Integer, nullable=False, default=0)
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def average_score(self):
+        return self.total_percentage / self.attempts if self.attempts else 0
+
+    @property
+    def pass_rate(self):
+        return self.passed * 100 / self.attempts if self.attempts else 0
+
+    def serialize(self):
+        return {
+            'user_id': self.user_id,
+            'attempts': self.attempts,
+            'passed': self.passed,
+            'average_score': self.average_score,
+            'pass_rate': self.pass_rate,
+            'best_score': self.best_percentage,
+            'time_spent': self.time_spent,
+            'subjects_attempted': self.subjects_attempted,
+            'last_attempt_at': self.last_attempt_at.isoformat() if self.last_attempt_at else None
+        }
+
+    def __repr__(self):
+        return f'<UserStats {self.user_id}>'
+
+class UserSubjectStats(db.Model):
+    """Running totals of a user's attempts within one subject"""
+    __tablename__ = "UserSubjectStats"
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('Subjects.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    total_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    best_percentage = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<UserSubjectStats {self.user_id}:{self.subject_id}>'
+
+class DailyQuizActivity(db.Model):
+    """Attempts of one quiz on one day, maintained on every score insert"""
+    __tablename__ = "DailyQuizActivity"
+    activity_date = db.Column(db.Date, primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('Subjects.id'), primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('Quizzes.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    total_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    time_spent = db.Column(db.Integer, nullable=False, default=0)  # in seconds
+    timed_attempts = db.Column(db.Integer, nullable=False, default=0)  # attempts with time_taken
+    user_sketch = db.Column(db.LargeBinary)  # HyperLogLog of the users who attempted
+
+    __table_args__ = (
+        db.Index('ix_daily_quiz_activity_quiz_id', 'quiz_id', 'activity_date'),
+    )
+
+    def __repr__(self):
+        return f'<DailyQuizActivity {self.activity_date} {self.quiz_id}>'
+
+class DailyActivity(db.Model):
+    """Platform-wide attempts on one day, maintained on every score insert"""
+    __tablename__ = "DailyActivity"
+    activity_date = db.Column(db.Date, primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    total_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    time_spent = db.Column(db.Integer, nullable=False, default=0)  # in seconds
+    timed_attempts = db.Column(db.Integer, nullable=False, default=0)
+    user_sketch = db.Column(db.LargeBinary)
+
+    def __repr__(self):
+        return f'<DailyActivity {self.activity_date}>'
+
+class DailyRegistrations(db.Model):
+    """Number of (non-admin) users registered on one day"""
+    __tablename__ = "DailyRegistrations"
+    registration_date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyRegistrations {self.registration_date}>'
+
+class ExportFiles(db.Model):
+    """An export file in instance/exports, tracked for retention and the disk quota"""
+    __tablename__ = "ExportFiles"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    filename = db.Column(db.String, unique=True, nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('Users.id'), nullable=True)
+    kind = db.Column(db.String, nullable=False, default='user')  # 'user' or 'platform'
+    export_format = db.Column(db.String, nullable=True)
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(db.Integer, nullable=True)
+    task_id = db.Column(db.String, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=True)  # None: kept until the quota needs the space
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Retention sweep and least-recently-used eviction
+        db.Index('ix_export_files_expires_at', 'expires_at'),
+        db.Index('ix_export_files_last_accessed_at', 'last_accessed_at'),
+        # A user's exports, newest first
+        db.Index('ix_export_files_owner_id', 'owner_id', 'created_at'),
+    )
+
+    def serialize(self):
+        return {
+            'filename': self.filename,
+            'kind': self.kind,
+            'format': self.export_format,
+            'size_bytes': self.size_bytes,
+            'rows': self.rows,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_accessed_at': self.last_accessed_at.isoformat() if self.last_accessed_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'downloads': self.downloads,
+            'download_url': f'/api/exports/download/{self.filename}'
+        }
+
+    def __repr__(self):
+        return f'<ExportFiles {self.filename}>'
@@ -0,0 +1,297 @@
+"""
+Versioned, pre-rendered quiz data shared by the quiz-taking endpoints.
+
+Two artifacts are kept per quiz: the answer-free paper served by /start and
+the answer key used to grade /submit.
+
+A quiz's version is the version of its cache tag (quiz:<id>, see
+cache.invalidate_tags), bumped whenever the quiz, one of its questions or the
+chapter and subject it is shown under changes. Cached artifacts are keyed by
+(quiz id, version), so an edit makes old entries unreachable and they simply
+age out.
+
+Entries live in a process-local LRU in front of Redis. A local entry is only
+trusted for LOCAL_ARTIFACT_SECONDS, which bounds how long another process
+keeps serving it if a version bump is lost. When Redis is not available the
+version counters fall back to process memory, which other processes never
+see, so the local tier is skipped and artifacts are built per request.
+"""
+import json
+import logging
+import time
+import redis
+from array import array
+
+from . import cache
+from .cache import LRUCache
+from .database import db
+from .models import Quizzes, Chapters, Subjects, Questions
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_EXPIRY_SECONDS = 3600
+# How long a process reuses an artifact from its local LRU without asking Redis
+LOCAL_ARTIFACT_SECONDS = 10
+# Stored for a question without a usable correct_option; no answer matches it
+NO_CORRECT_OPTION = -1
+
+_local = LRUCache(max_size=512)
+
+
+def get_quiz_version(quiz_id):
+    """Current content version of a quiz"""
+    return cache.get_tag_versions([cache.quiz_tag(quiz_id)])[0]
+
+
+def bump_quiz_version(*quiz_ids):
+    """
+    Invalidate everything cached for the given quizzes.
+    Call after the edit has been committed.
+    """
+    cache.invalidate_tags(*_quiz_tags(quiz_ids))
+
+
+def invalidate_catalog(*quiz_ids):
+    """
+    Invalidate cached catalog data (subjects, chapters, quiz listings) and
+    everything cached for the given quizzes.
+    Call after the edit has been committed.
+    """
+    cache.invalidate_tags(cache.CATALOG_TAG, *_quiz_tags(quiz_ids))
+
+
+def _quiz_tags(quiz_ids):
+    quiz_ids = [quiz_id for quiz_id in quiz_ids if quiz_id is not None]
+    for quiz_id in quiz_ids:
+        _local.discard_where(lambda key: key[0] == quiz_id)
+    return [cache.quiz_tag(quiz_id) for quiz_id in quiz_ids]
+
+
+def quiz_ids_in(subject_id=None, chapter_id=None):
+    """Ids of the quizzes of a chapter, or of every chapter of a subject"""
+    query = db.session.query(Quizzes.id)
+    if chapter_id is not None:
+        query = query.filter(Quizzes.chapter_id == chapter_id)
+    else:
+        query = query.join(Chapters, Quizzes.chapter_id == Chapters.id).filter(Chapters.subject_id == subject_id)
+    return [quiz_id for quiz_id, in query]
+
+
+class QuizPaper:
+    """Answer-free question set of a quiz, pre-rendered to a JSON object"""
+
+    def __init__(self, is_active, question_count, body):
+        self.is_active = is_active
+        self.question_count = question_count
+        self.body = body
+
+    def render(self, **extra):
+        """Return the JSON body with extra top-level fields appended"""
+        if not extra:
+            return self.body
+        extra_json = json.dumps(extra)
+        return f"{self.body[:-1]}, {extra_json[1:]}"
+
+    def dumps(self):
+        return json.dumps([self.is_active, self.question_count, self.body])
+
+    @classmethod
+    def loads(cls, data):
+        return cls(*json.loads(data))
+
+
+class AnswerKey:
+    """
+    Grading data of a quiz held as parallel arrays:
+    question_ids[i] -> (correct_options[i], marks[i])
+    A missing (NULL) correct option is stored as NO_CORRECT_OPTION and
+    grades every answer to that question as incorrect.
+    """
+    __slots__ = ('question_ids', 'correct_options', 'marks', 'passing_score',
+                 'is_active', 'total_possible_score', '_positions')
+
+    def __init__(self, question_ids, correct_options, marks, passing_score, is_active):
+        self.question_ids = array('q', question_ids)
+        self.correct_options = array('b', (
+            option if isinstance(option, int) and 0 < option < 128 else NO_CORRECT_OPTION
+            for option in correct_options
+        ))
+        self.marks = array('d', marks)
+        self.passing_score = passing_score
+        self.is_active = is_active
+        self.total_possible_score = sum(self.marks)
+        self._positions = {str(question_id): i for i, question_id in enumerate(self.question_ids)}
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def grade(self, answers):
+        """
+        Grade {question_id: selected_option} answers in O(len(answers)).
+        Answers for questions outside the quiz are ignored and answers that
+        are not valid integers count as incorrect.
+        """
+        total_scored = 0
+        correct_answers = 0
+        incorrect_answers = 0
+
+        for question_id, user_answer in answers.items():
+            position = self._positions.get(str(question_id))
+            if position is None or user_answer is None:
+                continue
+            try:
+                # Compare with correct_option (1-based index)
+                correct_option = self.correct_options[position]
+                if int(user_answer) == correct_option and correct_option != NO_CORRECT_OPTION:
+                    total_scored += self.marks[position]
+                    correct_answers += 1
+                else:
+                    incorrect_answers += 1
+            except (ValueError, TypeError):
+                incorrect_answers += 1
+
+        total_questions = len(self)
+        # Percentage is based on correct answers / total questions
+        percentage = (correct_answers / total_questions * 100) if total_questions > 0 else 0
+
+        return {
+            'total_scored': total_scored,
+            'total_possible_score': self.total_possible_score,
+            'correct_answers': correct_answers,
+            'incorrect_answers': incorrect_answers,
+            'unanswered': total_questions - correct_answers - incorrect_answers,
+            'total_questions': total_questions,
+            'percentage': percentage,
+            'passed': percentage >= self.passing_score
+        }
+
+    def correct_option_map(self):
+        return {str(question_id): None if option == NO_CORRECT_OPTION else option
+                for question_id, option in zip(self.question_ids, self.correct_options)}
+
+    def dumps(self):
+        return json.dumps([
+            self.question_ids.tolist(),
+            self.correct_options.tolist(),
+            self.marks.tolist(),
+            self.passing_score,
+            self.is_active
+        ])
+
+    @classmethod
+    def loads(cls, data):
+        return cls(*json.loads(data))
+
+
+def _build_quiz_paper(quiz_id):
+    row = db.session.query(
+        Quizzes,
+        Chapters.name.label('chapter_name'),
+        Subjects.name.label('subject_name')
+    ).outerjoin(Chapters, Quizzes.chapter_id == Chapters.id)\
+     .outerjoin(Subjects, Chapters.subject_id == Subjects.id)\
+     .filter(Quizzes.id == quiz_id)\
+     .first()
+
+    if not row:
+        return None
+
+    quiz, chapter_name, subject_name = row
+    questions = Questions.query.filter_by(quiz_id=quiz_id).order_by(Questions.id).all()
+
+    questions_data = []
+    for question in questions:
+        q_data = question.serialize()
+        q_data.pop('correct_option', None)  # Remove correct answer
+        questions_data.append(q_data)
+
+    quiz_data = quiz.serialize()
+    quiz_data['questions'] = questions_data
+    if chapter_name is not None:
+        quiz_data['chapter_name'] = chapter_name
+        if subject_name is not None:
+            quiz_data['subject_name'] = subject_name
+
+    return QuizPaper(bool(quiz.is_active), len(questions_data), json.dumps(quiz_data))
+
+
+def _build_answer_key(quiz_id):
+    quiz = db.session.query(Quizzes.passing_score, Quizzes.is_active)\
+        .filter(Quizzes.id == quiz_id).first()
+    if not quiz:
+        return None
+
+    rows = db.session.query(Questions.id, Questions.correct_option, Questions.marks)\
+        .filter(Questions.quiz_id == quiz_id)\
+        .order_by(Questions.id).all()
+
+    return AnswerKey(
+        [row.id for row in rows],
+        [row.correct_option for row in rows],
+        [row.marks if row.marks else 1 for row in rows],
+        quiz.passing_score if quiz.passing_score is not None else 0,
+        bool(quiz.is_active)
+    )
+
+
+def _get_versioned(kind, quiz_id, build, loads):
+    """
+    Look up a per-quiz artifact in the local LRU, then Redis, then build it.
+    Local entries expire after LOCAL_ARTIFACT_SECONDS, and the local tier is
+    not used at all without Redis.
+    """
+    version = get_quiz_version(quiz_id)
+    local_key = (quiz_id, kind, version)
+    use_local = cache.redis_client is not None
+    now = time.monotonic()
+
+    if use_local:
+        entry = _local.get(local_key)
+        if entry is not None:
+            value, local_until = entry
+            if now < local_until:
+                return value
+
+    def keep_local(value):
+        if use_local:
+            _local.set(local_key, (value, now + LOCAL_ARTIFACT_SECONDS))
+
+    redis_key = f"{kind}:{quiz_id}:v{version}"
+    if cache.redis_client:
+        try:
+            cached = cache.redis_client.get(redis_key)
+            if cached:
+                value = loads(cached)
+                keep_local(value)
+                return value
+        except redis.RedisError as e:
+            logger.warning(f"Could not read {kind} from Redis: {str(e)}")
+
+    value = build(quiz_id)
+    if value is None:
+        return None
+
+    keep_local(value)
+    if cache.redis_client:
+        try:
+            cache.redis_client.setex(redis_key, ARTIFACT_EXPIRY_SECONDS, value.dumps())
+        except redis.RedisError as e:
+            logger.error(f"Failed to cache {kind}: {str(e)}")
+
+    return value
+
+
+def get_quiz_paper(quiz_id):
+    """
+    Get the cached paper for a quiz, building it on a miss.
+    Returns None if the quiz does not exist.
+    """
+    return _get_versioned('quiz_paper', quiz_id, _build_quiz_paper, QuizPaper.loads)
+
+
+def get_answer_key(quiz_id):
+    """
+    Get the cached answer key for a quiz, building it on a miss.
+    Returns None if the quiz does not exist.
+    """
+    return _get_versioned('answer_key', quiz_id, _build_answer_key, AnswerKey.loads)
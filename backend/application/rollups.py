@@ -0,0 +1,272 @@
+"""
+Materialized per-day rollups for the analytics charts.
+
+DailyQuizActivity holds, per (day, subject, quiz), the attempt count, passes,
+sum of percentages, time spent and a HyperLogLog sketch of the users who
+attempted. DailyActivity holds the same per day across the platform and
+DailyRegistrations the number of sign-ups per day. Charts read these tables,
+so their cost grows with the number of days shown rather than the number of
+attempts.
+
+record_activity() updates the rollups in the transaction that inserts the
+scores (see score_writer.persist_scores) and record_registration() in the one
+that creates a user. rebuild_rollups() recomputes a date range from Scores and
+Users; the refresh_analytics_rollups Celery task runs it for recent days to
+pick up rows written outside the API.
+
+Platform-wide averages (overall and per subject) are the same for every
+user, so get_platform_averages() serves them from a shared Redis entry (with
+a short-lived process-local copy) that refresh_platform_averages() rebuilds
+from the rollups on a schedule or when it expires.
+"""
+import json
+import logging
+import time
+from datetime import date, datetime
+import redis
+from sqlalchemy import case, func
+
+from . import cache
+from .database import db
+from .models import (Users, Quizzes, Chapters, Scores, DailyQuizActivity, DailyActivity,
+                     DailyRegistrations)
+from .sketches import HyperLogLog
+from .user_stats import resolve_user_ids
+
+logger = logging.getLogger(__name__)
+
+PLATFORM_AVERAGES_KEY = 'platform_averages'
+PLATFORM_AVERAGES_EXPIRY_SECONDS = 600
+# How long a process reuses its copy before re-reading the shared one
+PLATFORM_AVERAGES_LOCAL_SECONDS = 60
+
+_platform_averages = {'value': None, 'expires_at': 0.0}
+
+
+def _new_row(model, **keys):
+    return model(attempts=0, passed=0, total_percentage=0.0, time_spent=0, timed_attempts=0, **keys)
+
+
+def _add_attempt(row, passed, percentage, time_taken, attempts=1, timed_attempts=None):
+    row.attempts += attempts
+    row.passed += passed
+    row.total_percentage += percentage or 0
+    row.time_spent += time_taken or 0
+    if timed_attempts is None:
+        timed_attempts = 1 if time_taken is not None else 0
+    row.timed_attempts += timed_attempts
+
+
+def _to_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def record_activity(scores):
+    """
+    Add freshly inserted scores to the daily rollups.
+    Runs in the caller's transaction; scores must already be flushed.
+    """
+    if not scores:
+        return
+
+    user_ids = resolve_user_ids(score.user_id for score in scores)
+    subject_ids = dict(
+        db.session.query(Quizzes.id, Chapters.subject_id)
+        .join(Chapters, Quizzes.chapter_id == Chapters.id)
+        .filter(Quizzes.id.in_({score.quiz_id for score in scores}))
+    )
+    days = {score.time_stamp_of_attempt.date() for score in scores}
+
+    quiz_rows = {
+        (row.activity_date, row.subject_id, row.quiz_id): row
+        for row in DailyQuizActivity.query.filter(
+            DailyQuizActivity.activity_date.in_(days),
+            DailyQuizActivity.quiz_id.in_(list(subject_ids))
+        )
+    }
+    day_rows = {row.activity_date: row for row in DailyActivity.query.filter(DailyActivity.activity_date.in_(days))}
+    sketches = {}
+
+    def touch(rows, key, build):
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = build()
+            db.session.add(row)
+        return row
+
+    for score in scores:
+        day = score.time_stamp_of_attempt.date()
+        rows = [touch(day_rows, day, lambda: _new_row(DailyActivity, activity_date=day))]
+        subject_id = subject_ids.get(score.quiz_id)
+        if subject_id is not None:
+            rows.append(touch(quiz_rows, (day, subject_id, score.quiz_id), lambda: _new_row(
+                DailyQuizActivity, activity_date=day, subject_id=subject_id, quiz_id=score.quiz_id
+            )))
+
+        user_id = user_ids.get(score.user_id)
+        for row in rows:
+            _add_attempt(row, 1 if score.passed else 0, score.percentage, score.time_taken)
+            if user_id is not None:
+                if id(row) not in sketches:
+                    sketches[id(row)] = (row, HyperLogLog(row.user_sketch))
+                sketches[id(row)][1].add(user_id)
+
+    for row, sketch in sketches.values():
+        row.user_sketch = sketch.to_bytes()
+
+
+def record_registration(user):
+    """Count a newly created user in DailyRegistrations (caller commits)"""
+    if user.is_admin:
+        return
+    day = (user.registration_date or datetime.utcnow()).date()
+    row = db.session.get(DailyRegistrations, day)
+    if row is None:
+        db.session.add(DailyRegistrations(registration_date=day, count=1))
+    else:
+        row.count += 1
+
+
+def rebuild_rollups(session=None, since=None):
+    """
+    Recompute the daily rollups from Scores and Users, for every day or for
+    days on or after the date `since`.
+    Commits and returns the number of days rebuilt.
+    """
+    session = session or db.session
+    day = func.date(Scores.time_stamp_of_attempt)
+    attempts = (
+        session.query(
+            day, Chapters.subject_id, Scores.quiz_id, Users.id,
+            func.count(Scores.id),
+            func.sum(case((Scores.passed == True, 1), else_=0)),
+            func.coalesce(func.sum(Scores.percentage), 0.0),
+            func.coalesce(func.sum(Scores.time_taken), 0),
+            func.count(Scores.time_taken)
+        )
+        .select_from(Scores)
+        .outerjoin(Quizzes, Scores.quiz_id == Quizzes.id)
+        .outerjoin(Chapters, Quizzes.chapter_id == Chapters.id)
+        .outerjoin(Users, (Scores.user_id == Users.id) | (Scores.user_id == Users.email))
+        .group_by(day, Chapters.subject_id, Scores.quiz_id, Users.id)
+    )
+    registrations = (
+        session.query(func.date(Users.registration_date), func.count(Users.id))
+        .filter(Users.is_admin == False)
+        .group_by(func.date(Users.registration_date))
+    )
+    if since is not None:
+        attempts = attempts.filter(Scores.time_stamp_of_attempt >= since)
+        registrations = registrations.filter(Users.registration_date >= since)
+
+    quiz_rows = {}
+    day_rows = {}
+    sketches = {}
+    for activity_date, subject_id, quiz_id, user_id, count, passed, percentage, time_spent, timed in attempts:
+        activity_date = _to_date(activity_date)
+        rows = [day_rows.setdefault(activity_date, _new_row(DailyActivity, activity_date=activity_date))]
+        if subject_id is not None:
+            key = (activity_date, subject_id, quiz_id)
+            rows.append(quiz_rows.setdefault(key, _new_row(
+                DailyQuizActivity, activity_date=activity_date, subject_id=subject_id, quiz_id=quiz_id
+            )))
+        for row in rows:
+            _add_attempt(row, passed, percentage, time_spent, attempts=count, timed_attempts=timed)
+            if user_id is not None:
+                sketches.setdefault(id(row), (row, HyperLogLog()))[1].add(user_id)
+    for row, sketch in sketches.values():
+        row.user_sketch = sketch.to_bytes()
+
+    for model, column in ((DailyQuizActivity, DailyQuizActivity.activity_date),
+                          (DailyActivity, DailyActivity.activity_date),
+                          (DailyRegistrations, DailyRegistrations.registration_date)):
+        stale = session.query(model)
+        if since is not None:
+            stale = stale.filter(column >= since)
+        stale.delete(synchronize_session=False)
+
+    session.add_all(quiz_rows.values())
+    session.add_all(day_rows.values())
+    session.add_all(
+        DailyRegistrations(registration_date=_to_date(registration_date), count=count)
+        for registration_date, count in registrations
+    )
+    session.commit()
+    logger.info(f"Rebuilt analytics rollups for {len(day_rows)} days" + (f" since {since}" if since else ""))
+    return len(day_rows)
+
+
+def rollups_need_backfill():
+    """True if there are scores or users but the rollup tables are empty"""
+    return (
+        (not DailyActivity.query.first() and Scores.query.first() is not None)
+        or (not DailyRegistrations.query.first() and Users.query.filter_by(is_admin=False).first() is not None)
+    )
+
+
+def active_users(start_date, end_date=None):
+    """Estimated distinct users who attempted a quiz between the two dates"""
+    query = db.session.query(DailyActivity.user_sketch).filter(DailyActivity.activity_date >= start_date)
+    if end_date is not None:
+        query = query.filter(DailyActivity.activity_date < end_date)
+    return HyperLogLog.union(sketch for sketch, in query).count()
+
+
+def compute_platform_averages(session=None):
+    """
+    Average percentage across the platform, overall and per subject id.
+    Subject ids are string keys so the result round-trips through JSON.
+    """
+    session = session or db.session
+    total_percentage, attempts = session.query(
+        func.coalesce(func.sum(DailyActivity.total_percentage), 0.0),
+        func.coalesce(func.sum(DailyActivity.attempts), 0)
+    ).one()
+    subjects = session.query(
+        DailyQuizActivity.subject_id,
+        func.sum(DailyQuizActivity.total_percentage),
+        func.sum(DailyQuizActivity.attempts)
+    ).group_by(DailyQuizActivity.subject_id).all()
+    return {
+        'overall': total_percentage / attempts if attempts else 0,
+        'subjects': {
+            str(subject_id): subject_total / subject_attempts
+            for subject_id, subject_total, subject_attempts in subjects if subject_attempts
+        },
+        'computed_at': datetime.utcnow().isoformat()
+    }
+
+
+def _keep_local(value):
+    _platform_averages['value'] = value
+    _platform_averages['expires_at'] = time.monotonic() + PLATFORM_AVERAGES_LOCAL_SECONDS
+
+
+def refresh_platform_averages(session=None):
+    """Recompute the platform averages and publish them to the shared cache"""
+    value = compute_platform_averages(session)
+    if cache.redis_client:
+        try:
+            cache.redis_client.setex(PLATFORM_AVERAGES_KEY, PLATFORM_AVERAGES_EXPIRY_SECONDS, json.dumps(value))
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish platform averages: {str(e)}")
+    _keep_local(value)
+    return value
+
+
+def get_platform_averages():
+    """Shared platform averages; recomputed only when every cached copy has expired"""
+    if _platform_averages['value'] is not None and time.monotonic() < _platform_averages['expires_at']:
+        return _platform_averages['value']
+
+    if cache.redis_client:
+        try:
+            cached = cache.redis_client.get(PLATFORM_AVERAGES_KEY)
+            if cached:
+                value = json.loads(cached)
+                _keep_local(value)
+                return value
+        except redis.RedisError as e:
+            logger.warning(f"Could not read platform averages: {str(e)}")
+
+    return refresh_platform_averages()
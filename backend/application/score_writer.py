@@ -0,0 +1,359 @@
+"""
+Persistence of graded quiz attempts.
+
+persist_scores() is the single place where Scores rows are inserted, so
+anything that has to happen alongside a score insert lives there. Side
+effects outside the database (leaderboards, cache invalidation) run after
+the commit.
+
+With SCORE_WRITE_BEHIND enabled, /submit does not write to the main database
+at all. The graded row is appended to a local SQLite spool file (durable,
+separate from the main database so it never waits on its writer lock) and a
+background flusher inserts spooled rows in batches, one commit per batch.
+Each submission carries an attempt id that can be polled until it has been
+persisted. Scores.attempt_id is unique, so replaying a batch after a crash
+cannot create duplicate attempts. When a batch cannot be inserted, its rows
+are retried one at a time; a row that keeps failing is marked failed in the
+spool instead of blocking every later submission.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import atexit
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+
+from .cache import invalidate_tags, user_tag, SCORES_TAG
+from .database import db
+from .models import Scores
+from .user_stats import record_scores, resolve_user_ids
+from .rollups import record_activity
+from .leaderboards import publish_scores
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_PERSISTED = 'persisted'
+STATUS_FAILED = 'failed'
+
+# Attempts at inserting a spooled row on its own before it is marked failed
+MAX_ROW_ATTEMPTS = 3
+
+# Persisted spool rows are kept this long so clients can still poll them
+SPOOL_RETENTION_SECONDS = 3600
+
+_writer = None
+
+
+def persist_scores(scores):
+    """
+    Insert graded Scores rows in the current transaction, together with the
+    aggregates derived from them. The caller commits.
+    """
+    db.session.add_all(scores)
+    db.session.flush()
+    record_scores(scores)
+    record_activity(scores)
+    return scores
+
+
+def _after_commit(attempts):
+    """
+    Side effects of a committed batch outside the database.
+    attempts: (Scores.user_id, Scores.quiz_id) pairs of the batch.
+    """
+    if not attempts:
+        return
+    user_ids = set(resolve_user_ids(user_id for user_id, _ in attempts).values())
+    invalidate_tags(SCORES_TAG, *(user_tag(user_id) for user_id in user_ids))
+    publish_scores(attempts)
+
+
+def _score_to_payload(score):
+    return json.dumps({
+        'user_id': score.user_id,
+        'quiz_id': score.quiz_id,
+        'time_stamp_of_attempt': score.time_stamp_of_attempt.isoformat(),
+        'total_scored': score.total_scored,
+        'total_possible_score': score.total_possible_score,
+        'time_taken': score.time_taken,
+        'percentage': score.percentage,
+        'passed': score.passed,
+        'attempt_id': score.attempt_id
+    })
+
+
+def _score_from_payload(payload):
+    fields = json.loads(payload)
+    fields['time_stamp_of_attempt'] = datetime.fromisoformat(fields['time_stamp_of_attempt'])
+    return Scores(**fields)
+
+
+class ScoreSpool:
+    """Durable local queue of graded attempts waiting to be inserted"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS spool ('
+                ' attempt_id TEXT PRIMARY KEY,'
+                ' user_id TEXT NOT NULL,'
+                ' payload TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' score_id INTEGER,'
+                ' created_at REAL NOT NULL,'
+                ' persisted_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_spool_status ON spool (status, created_at)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=FULL')
+        return conn
+
+    def enqueue(self, score):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO spool (attempt_id, user_id, payload, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                (score.attempt_id, str(score.user_id), _score_to_payload(score), STATUS_PENDING,
+                 datetime.utcnow().timestamp())
+            )
+        finally:
+            conn.close()
+
+    def pending(self, limit):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT attempt_id, payload FROM spool WHERE status = ? ORDER BY created_at LIMIT ?',
+                (STATUS_PENDING, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def has_pending(self):
+        return bool(self.pending(1))
+
+    def mark_persisted(self, score_ids):
+        """score_ids: {attempt_id: Scores.id}"""
+        now = datetime.utcnow().timestamp()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'UPDATE spool SET status = ?, score_id = ?, persisted_at = ? WHERE attempt_id = ?',
+                [(STATUS_PERSISTED, score_id, now, attempt_id) for attempt_id, score_id in score_ids.items()]
+            )
+            conn.execute(
+                'DELETE FROM spool WHERE status = ? AND persisted_at < ?',
+                (STATUS_PERSISTED, now - SPOOL_RETENTION_SECONDS)
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def mark_failed(self, attempt_ids):
+        conn = self._connect()
+        try:
+            conn.executemany('UPDATE spool SET status = ? WHERE attempt_id = ?',
+                             [(STATUS_FAILED, attempt_id) for attempt_id in attempt_ids])
+        finally:
+            conn.close()
+
+    def lookup(self, attempt_id):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT user_id, status, score_id FROM spool WHERE attempt_id = ?', (attempt_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+
+class WriteBehindScoreWriter:
+    """Spools submissions and flushes them to the main database in batches"""
+
+    def __init__(self, app):
+        self.app = app
+        self.spool = ScoreSpool(app.config['SCORE_SPOOL_PATH'])
+        self.interval = app.config.get('SCORE_FLUSH_INTERVAL', 0.25)
+        self.batch_size = app.config.get('SCORE_FLUSH_BATCH_SIZE', 500)
+        self._wakeup = threading.Event()
+        self._enqueued = 0
+        self._enqueued_lock = threading.Lock()
+        # attempt_id -> failed single-row inserts, for rows of failed batches
+        self._row_failures = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, score):
+        self.spool.enqueue(score)
+        self.ensure_started()
+        with self._enqueued_lock:
+            self._enqueued += 1
+            batch_full = self._enqueued >= self.batch_size
+        if batch_full:
+            # A full batch is waiting, flush without waiting for the interval
+            self._wakeup.set()
+
+    def ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='score-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._enqueued_lock:
+                self._enqueued = 0
+            try:
+                while self.flush() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Score flush failed: {str(e)}")
+
+    def flush(self):
+        """Insert one batch of spooled attempts. Returns the batch size."""
+        rows = self.spool.pending(self.batch_size)
+        if not rows:
+            return 0
+
+        try:
+            score_ids = self._insert(rows)
+        except OperationalError:
+            # The database is unavailable or locked: keep the batch for the next flush
+            raise
+        except Exception as e:
+            logger.warning(f"Flushing a batch of {len(rows)} spooled quiz attempts failed, "
+                           f"retrying them one at a time: {str(e)}")
+            score_ids = self._insert_each(rows)
+
+        self.spool.mark_persisted(score_ids)
+        logger.info(f"Flushed {len(score_ids)} spooled quiz attempts")
+        return len(rows)
+
+    def _insert(self, rows):
+        """Insert rows in one transaction. Returns {attempt_id: Scores.id}."""
+        with self.app.app_context():
+            try:
+                attempt_ids = [attempt_id for attempt_id, _ in rows]
+                # Attempts inserted by an earlier, interrupted flush
+                score_ids = dict(
+                    db.session.query(Scores.attempt_id, Scores.id)
+                    .filter(Scores.attempt_id.in_(attempt_ids)).all()
+                )
+                new_scores = [_score_from_payload(payload) for attempt_id, payload in rows
+                              if attempt_id not in score_ids]
+                persist_scores(new_scores)
+                score_ids.update({score.attempt_id: score.id for score in new_scores})
+                attempts = [(score.user_id, score.quiz_id) for score in new_scores]
+                db.session.commit()
+                _after_commit(attempts)
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+        return score_ids
+
+    def _insert_each(self, rows):
+        """
+        Insert rows one transaction each, after their batch failed. Rows that
+        fail MAX_ROW_ATTEMPTS times are marked failed. Returns {attempt_id: Scores.id}
+        of the rows inserted.
+        """
+        score_ids = {}
+        failed = []
+        for row in rows:
+            attempt_id = row[0]
+            try:
+                score_ids.update(self._insert([row]))
+            except OperationalError:
+                raise
+            except Exception as e:
+                attempts = self._row_failures.get(attempt_id, 0) + 1
+                if attempts < MAX_ROW_ATTEMPTS:
+                    self._row_failures[attempt_id] = attempts
+                    continue
+                self._row_failures.pop(attempt_id, None)
+                logger.error(f"Spooled quiz attempt {attempt_id} could not be persisted: {str(e)}")
+                failed.append(attempt_id)
+            else:
+                self._row_failures.pop(attempt_id, None)
+        if failed:
+            self.spool.mark_failed(failed)
+        return score_ids
+
+    def drain(self):
+        """Flush until the spool has no pending attempts (at shutdown)"""
+        try:
+            while self.flush():
+                pass
+        except Exception as e:
+            logger.error(f"Draining the score spool failed: {str(e)}")
+
+    def status(self, attempt_id):
+        row = self.spool.lookup(attempt_id)
+        if not row:
+            return None
+        user_id, status, score_id = row
+        return {'user_id': user_id, 'status': status, 'score_id': score_id}
+
+
+def init_score_writer(app):
+    """Set up write-behind persistence if SCORE_WRITE_BEHIND is enabled"""
+    global _writer
+    if not app.config.get('SCORE_WRITE_BEHIND'):
+        _writer = None
+        return
+
+    _writer = WriteBehindScoreWriter(app)
+    # Drain attempts left behind by a previous process
+    if _writer.spool.has_pending():
+        _writer.ensure_started()
+    atexit.register(_writer.drain)
+    logger.info(f"Write-behind score persistence enabled (spool: {_writer.spool.path})")
+
+
+def submit_score(score):
+    """
+    Persist a graded attempt, directly or through the write-behind spool.
+    Returns True if the row is already in the database.
+    """
+    if _writer is None:
+        persist_scores([score])
+        attempts = [(score.user_id, score.quiz_id)]
+        db.session.commit()
+        _after_commit(attempts)
+        return True
+
+    _writer.submit(score)
+    return False
+
+
+def get_attempt_status(attempt_id):
+    """
+    Persistence status of a submitted attempt, or None if unknown.
+    Returns a dict with user_id, status and score_id.
+    """
+    if _writer is not None:
+        status = _writer.status(attempt_id)
+        if status:
+            return status
+
+    score = db.session.query(Scores.id, Scores.user_id).filter(Scores.attempt_id == attempt_id).first()
+    if not score:
+        return None
+    return {'user_id': str(score.user_id), 'status': STATUS_PERSISTED, 'score_id': score.id}
@@ -0,0 +1,247 @@
+"""
+Full-text search over questions, quizzes, chapters and subjects.
+
+Each searchable table has an FTS5 index stored as an external-content table
+(<kind>_fts, holding only the inverted index; the text stays in the source
+table). Triggers on the source table keep the index in step with every
+insert, update and delete, whichever code path writes the row.
+ensure_search_index() creates the tables and triggers and rebuilds an index
+whenever any of them was missing (see migrations.upgrade_schema).
+
+Queries are tokenized the same way as the index and every term must match;
+the last term also matches as a prefix while the user is still typing.
+Terms that appear nowhere in the index are widened to the closest
+indexed terms (difflib over the fts5vocab term list, restricted to terms
+with the same first letter and a similar length), so small typos still
+find results. Matches are ranked with bm25, with names weighted above
+descriptions.
+"""
+import difflib
+import html
+import logging
+import re
+from sqlalchemy import or_, text
+from sqlalchemy.exc import OperationalError
+
+from .database import db
+from .models import Questions, Quizzes, Chapters, Subjects
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER = 'unicode61 remove_diacritics 2'
+
+# kind -> (source table, indexed columns, bm25 column weights)
+INDEXES = {
+    'questions': ('Questions', ('question_statement', 'option1', 'option2', 'option3', 'option4'),
+                  (4.0, 1.0, 1.0, 1.0, 1.0)),
+    'quizzes': ('Quizzes', ('name', 'description', 'remarks'), (4.0, 1.0, 0.5)),
+    'chapters': ('Chapters', ('name', 'description'), (4.0, 1.0)),
+    'subjects': ('Subjects', ('name', 'description'), (4.0, 1.0)),
+}
+KINDS = tuple(INDEXES)
+_MODELS = {'questions': Questions, 'quizzes': Quizzes, 'chapters': Chapters, 'subjects': Subjects}
+
+SNIPPET_TOKENS = 12
+MAX_CORRECTIONS = 3
+CORRECTION_CUTOFF = 0.75
+MIN_CORRECTION_LENGTH = 3
+
+# Highlight markers, swapped for <mark> after the text is HTML-escaped
+_OPEN, _CLOSE = '\x02', '\x03'
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts(kind):
+    return f'{kind}_fts'
+
+
+def _index_ddl(kind):
+    source, columns, _ = INDEXES[kind]
+    fts = _fts(kind)
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert_new = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, "
+        f"content='{source}', content_rowid='id', tokenize='{TOKENIZER}')",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts}_vocab USING fts5vocab({fts}, 'row')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON "{source}" '
+        f'BEGIN {delete_old} {insert_new} END',
+    ]
+
+
+def ensure_search_index(connection):
+    """
+    Create missing search tables and triggers, rebuilding the affected
+    indexes from their source tables. Returns the number of rebuilt indexes.
+    """
+    if connection.dialect.name != 'sqlite':
+        return 0
+    existing = {name for name, in connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+    )}
+    rebuilt = 0
+    for kind in KINDS:
+        fts = _fts(kind)
+        wanted = {fts, f'{fts}_vocab', f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+        if wanted <= existing:
+            continue
+        try:
+            for statement in _index_ddl(kind):
+                connection.execute(text(statement))
+        except OperationalError as e:
+            logger.warning(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+            return rebuilt
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        rebuilt += 1
+        logger.info(f"Built search index {fts}")
+    return rebuilt
+
+
+def search_available():
+    """True if the FTS5 tables exist in the current database"""
+    names = {name for name, in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    return all(_fts(kind) in names for kind in KINDS)
+
+
+def tokenize(query):
+    """Lower-cased word tokens of a query, as the index tokenizer sees them"""
+    return [token.lower() for token in _TOKEN.findall(query)]
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _term_known(term, prefix=False):
+    """True if any index contains the term (or, with prefix, a term starting with it)"""
+    for kind in KINDS:
+        if prefix:
+            found = db.session.execute(text(
+                f"SELECT 1 FROM {_fts(kind)}_vocab WHERE term >= :term AND term < :upper LIMIT 1"
+            ), {'term': term, 'upper': term + '\uffff'}).first()
+        else:
+            found = db.session.execute(text(
+                f"SELECT 1 FROM {_fts(kind)}_vocab WHERE term = :term"
+            ), {'term': term}).first()
+        if found:
+            return True
+    return False
+
+
+def close_terms(term):
+    """Indexed terms most similar to a misspelled one"""
+    first = term[0]
+    candidates = set()
+    for kind in KINDS:
+        candidates.update(
+            candidate for candidate, in db.session.execute(text(
+                f"SELECT term FROM {_fts(kind)}_vocab WHERE term >= :low AND term < :high"
+            ), {'low': first, 'high': first + '\uffff'})
+            if abs(len(candidate) - len(term)) <= 2
+        )
+    return difflib.get_close_matches(term, candidates, n=MAX_CORRECTIONS, cutoff=CORRECTION_CUTOFF)
+
+
+def build_match(query):
+    """
+    FTS5 MATCH expression for a user query, plus the typo corrections used:
+    (expression or None, {term: [replacements]})
+    """
+    terms = tokenize(query)
+    if not terms:
+        return None, {}
+    typing = not query[-1:].isspace()
+    corrections = {}
+    parts = []
+    for position, term in enumerate(terms):
+        prefix = typing and position == len(terms) - 1
+        alternatives = []
+        if len(term) >= MIN_CORRECTION_LENGTH and not _term_known(term, prefix):
+            alternatives = close_terms(term)
+            if alternatives:
+                corrections[term] = alternatives
+        quoted = _quote(term) + ('*' if prefix else '')
+        if alternatives:
+            parts.append('(' + ' OR '.join([quoted] + [_quote(alternative) for alternative in alternatives]) + ')')
+        else:
+            parts.append(quoted)
+    return ' AND '.join(parts), corrections
+
+
+def _marked(value):
+    """HTML-escape highlighted text and turn the markers into <mark> tags"""
+    if value is None:
+        return None
+    return html.escape(value).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def search_kind(kind, match, limit=10, offset=0):
+    """
+    One page of ranked matches of a kind.
+    Returns (total, hits) where hits are dicts with id, score, highlight
+    (the first indexed column, e.g. the name) and snippet (best fragment).
+    """
+    fts = _fts(kind)
+    weights = ', '.join(str(weight) for weight in INDEXES[kind][2])
+    total = db.session.execute(text(f"SELECT count(*) FROM {fts} WHERE {fts} MATCH :match"),
+                               {'match': match}).scalar()
+    if not total or offset >= total:
+        return total or 0, []
+    rows = db.session.execute(text(
+        f"SELECT rowid, bm25({fts}, {weights}) AS rank, "
+        f"highlight({fts}, 0, :open, :close), "
+        f"snippet({fts}, -1, :open, :close, '…', {SNIPPET_TOKENS}) "
+        f"FROM {fts} WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+    ), {'match': match, 'open': _OPEN, 'close': _CLOSE, 'limit': limit, 'offset': offset})
+    return total, [{
+        'id': row_id,
+        'score': round(-rank, 4),
+        'highlight': _marked(highlighted),
+        'snippet': _marked(snippet)
+    } for row_id, rank, highlighted, snippet in rows]
+
+
+def _like_search_kind(kind, terms, limit, offset):
+    """Unranked substring search, for databases without FTS5"""
+    model = _MODELS[kind]
+    columns = [getattr(model, column) for column in INDEXES[kind][1]]
+    query = model.query.filter(*(or_(*(column.ilike(f'%{term}%') for column in columns)) for term in terms))
+    total = query.count()
+    rows = query.order_by(model.id).offset(offset).limit(limit).all()
+    return total, [{
+        'id': row.id,
+        'score': None,
+        'highlight': html.escape(getattr(row, INDEXES[kind][1][0]) or ''),
+        'snippet': None
+    } for row in rows]
+
+
+def search(query, kinds=KINDS, limit=10, offset=0):
+    """
+    Ranked matches per kind.
+    Returns {'corrections': {...}, 'results': {kind: (total, hits)}}
+    """
+    if not search_available():
+        terms = tokenize(query)
+        return {'corrections': {}, 'results': {
+            kind: _like_search_kind(kind, terms, limit, offset) if terms else (0, []) for kind in kinds
+        }}
+
+    match, corrections = build_match(query)
+    results = {}
+    for kind in kinds:
+        results[kind] = search_kind(kind, match, limit, offset) if match else (0, [])
+    return {'corrections': corrections, 'results': results}
+
+
+def rebuild_search_index():
+    """Rebuild every search index from its source table"""
+    for kind in KINDS:
+        db.session.execute(text(f"INSERT INTO {_fts(kind)}({_fts(kind)}) VALUES ('rebuild')"))
+    db.session.commit()
+    logger.info("Rebuilt search indexes")
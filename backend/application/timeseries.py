@@ -0,0 +1,134 @@
+"""
+Bucketed, gap-filled time series for the analytics charts.
+
+A series covers [start, end] in day, week (starting Monday) or month buckets
+and has one entry per bucket, including buckets without activity. Platform
+series are folded from the daily rollups. Per-user series come from a single
+grouped query over the user's Scores rows, served by the
+(user_id, time_stamp_of_attempt) index.
+"""
+from datetime import date, timedelta
+from sqlalchemy import case, func
+
+from .database import db
+from .models import Scores, DailyActivity, DailyRegistrations
+from .sketches import HyperLogLog
+from .user_stats import scores_owned_by
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_start(day, granularity):
+    """First day of the bucket that contains `day`"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def buckets(start, end, granularity):
+    """Start dates of every bucket overlapping [start, end]"""
+    current = bucket_start(start, granularity)
+    result = []
+    while current <= end:
+        result.append(current)
+        if granularity == 'day':
+            current += timedelta(days=1)
+        elif granularity == 'week':
+            current += timedelta(days=7)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+    return result
+
+
+def _sql_bucket(column, granularity):
+    """SQLite expression for the bucket start of a datetime column, as 'YYYY-MM-DD'"""
+    if granularity == 'day':
+        return func.date(column)
+    if granularity == 'week':
+        return func.date(column, 'weekday 0', '-6 days')
+    if granularity == 'month':
+        return func.strftime('%Y-%m-01', column)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _average(total, count):
+    return round(total / count, 2) if count else 0
+
+
+def user_series(user_id, start, end=None, granularity='day'):
+    """
+    Attempts, passes, average score and time spent of one user per bucket.
+    Entries: period, attempts, passed, avg_score, time_spent, timed_attempts.
+    """
+    end = end or date.today()
+    bucket = _sql_bucket(Scores.time_stamp_of_attempt, granularity)
+    rows = db.session.query(
+        bucket,
+        func.count(Scores.id),
+        func.sum(case((Scores.passed == True, 1), else_=0)),
+        func.coalesce(func.sum(Scores.percentage), 0.0),
+        func.coalesce(func.sum(Scores.time_taken), 0),
+        func.count(Scores.time_taken)
+    ).filter(
+        scores_owned_by(user_id),
+        Scores.time_stamp_of_attempt >= start,
+        Scores.time_stamp_of_attempt < end + timedelta(days=1)
+    ).group_by(bucket).all()
+    by_bucket = {date.fromisoformat(row[0]): row for row in rows}
+
+    series = []
+    for period in buckets(start, end, granularity):
+        _, attempts, passed, total_percentage, time_spent, timed = by_bucket.get(period, (None, 0, 0, 0.0, 0, 0))
+        series.append({
+            'period': period,
+            'attempts': attempts,
+            'passed': passed,
+            'avg_score': _average(total_percentage, attempts),
+            'time_spent': time_spent,
+            'timed_attempts': timed
+        })
+    return series
+
+
+def platform_series(start, end=None, granularity='month'):
+    """
+    Platform-wide activity per bucket, read from the daily rollups.
+    Entries: period, attempts, passed, avg_score, time_spent, active_users,
+    new_users.
+    """
+    end = end or date.today()
+    days = DailyActivity.query.filter(
+        DailyActivity.activity_date >= start, DailyActivity.activity_date <= end
+    ).all()
+    registrations = DailyRegistrations.query.filter(
+        DailyRegistrations.registration_date >= start, DailyRegistrations.registration_date <= end
+    ).all()
+
+    totals = {
+        period: {'attempts': 0, 'passed': 0, 'total_percentage': 0.0, 'time_spent': 0,
+                 'sketch': HyperLogLog(), 'new_users': 0}
+        for period in buckets(start, end, granularity)
+    }
+    for day in days:
+        bucket = totals[bucket_start(day.activity_date, granularity)]
+        bucket['attempts'] += day.attempts
+        bucket['passed'] += day.passed
+        bucket['total_percentage'] += day.total_percentage
+        bucket['time_spent'] += day.time_spent
+        bucket['sketch'].merge(day.user_sketch)
+    for registration in registrations:
+        totals[bucket_start(registration.registration_date, granularity)]['new_users'] += registration.count
+
+    return [{
+        'period': period,
+        'attempts': bucket['attempts'],
+        'passed': bucket['passed'],
+        'avg_score': _average(bucket['total_percentage'], bucket['attempts']),
+        'time_spent': bucket['time_spent'],
+        'active_users': bucket['sketch'].count(),
+        'new_users': bucket['new_users']
+    } for period, bucket in totals.items()]
@@ -0,0 +1,186 @@
+"""
+In-memory typeahead over subject, chapter and quiz names.
+
+Every name is indexed under its normalized form (case-folded, accents
+removed) and under each of its word suffixes, so "alg" completes both
+"Algebra" and "Linear Algebra". The keys live in one sorted list; a lookup
+is a bisect to the first key with the prefix followed by a short forward
+walk, so completions never touch the database.
+
+build() loads the names at startup. The subject, chapter and quiz write
+routes apply their changes with upsert() and remove() after committing, so
+the worker that handled the write answers with the new names right away.
+Those calls also bump the catalog_names cache tag, which nothing else
+touches (question edits only move the broader catalog tag). Every worker
+remembers the tag version its index was built from and rebuilds it, at
+most every SYNC_SECONDS, once the tag has moved, which picks up writes
+made elsewhere. A worker's own upsert() or remove() records the version
+it produced, so the writer does not rebuild for its own change.
+"""
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+
+from . import cache
+from .database import db
+from .models import Subjects, Chapters, Quizzes
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('subjects', 'chapters', 'quizzes')
+SYNC_SECONDS = 5
+# Matching keys examined per lookup before ranking
+MAX_CANDIDATES = 100
+
+
+def normalize(name):
+    """Case-folded name without accents and with single spaces between words"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(''.join(char if char.isalnum() else ' ' for char in stripped.casefold()).split())
+
+
+def _keys(normalized):
+    """The normalized name and each of its word suffixes"""
+    words = normalized.split()
+    return {' '.join(words[start:]) for start in range(len(words))}
+
+
+class TypeaheadIndex:
+    """Sorted (key, kind, id) list plus the display data of each entry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self.catalog_version = None
+        self.synced_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, kind, entry_id):
+        entry = self._entries.pop((kind, entry_id), None)
+        if entry is None:
+            return
+        for key in _keys(entry['normalized']):
+            position = bisect.bisect_left(self._keys, (key, kind, entry_id))
+            if position < len(self._keys) and self._keys[position] == (key, kind, entry_id):
+                del self._keys[position]
+
+    def upsert(self, kind, entry_id, name, active=True):
+        with self._lock:
+            self._remove(kind, entry_id)
+            normalized = normalize(name)
+            self._entries[(kind, entry_id)] = {'name': name, 'normalized': normalized, 'active': bool(active)}
+            for key in _keys(normalized):
+                bisect.insort(self._keys, (key, kind, entry_id))
+
+    def remove(self, kind, entry_id):
+        with self._lock:
+            self._remove(kind, entry_id)
+
+    def replace(self, entries, catalog_version):
+        """Swap in a freshly loaded set of (kind, id, name, active) entries"""
+        keys = []
+        data = {}
+        for kind, entry_id, name, active in entries:
+            normalized = normalize(name)
+            data[(kind, entry_id)] = {'name': name, 'normalized': normalized, 'active': bool(active)}
+            keys.extend((key, kind, entry_id) for key in _keys(normalized))
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._entries = data
+            self.catalog_version = catalog_version
+            self.synced_at = time.monotonic()
+
+    def complete(self, prefix, limit=8, kinds=KINDS, include_inactive=False):
+        """
+        Top completions of a prefix, names starting with it first, then
+        shorter names. Returns dicts with type, id and name.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            candidates = {}
+            position = bisect.bisect_left(self._keys, (prefix,))
+            examined = 0
+            while position < len(self._keys) and examined < MAX_CANDIDATES:
+                key, kind, entry_id = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                examined += 1
+                entry = self._entries[(kind, entry_id)]
+                if kind not in kinds or not (entry['active'] or include_inactive):
+                    continue
+                starts_name = key == entry['normalized']
+                if (kind, entry_id) not in candidates or starts_name:
+                    candidates[(kind, entry_id)] = (not starts_name, len(entry['name']), entry['normalized'],
+                                                    entry['name'])
+
+        ranked = sorted(candidates.items(), key=lambda item: item[1])[:limit]
+        return [{'type': kind, 'id': entry_id, 'name': rank[-1]} for (kind, entry_id), rank in ranked]
+
+
+index = TypeaheadIndex()
+
+
+def _catalog_version():
+    return cache.get_tag_versions([cache.CATALOG_NAMES_TAG])[0]
+
+
+def _names_changed():
+    """Tell other workers about a local change and keep this index in sync"""
+    previous = index.catalog_version
+    version = cache.invalidate_tags(cache.CATALOG_NAMES_TAG).get(cache.CATALOG_NAMES_TAG)
+    # Only a bump straight from our own version means no other worker's
+    # change is still missing from this index
+    if previous is not None and version == previous + 1:
+        index.catalog_version = version
+
+
+def build():
+    """(Re)load every subject, chapter and quiz name from the database"""
+    version = _catalog_version()
+    entries = [('subjects', row.id, row.name, row.is_active is not False)
+               for row in db.session.query(Subjects.id, Subjects.name, Subjects.is_active)]
+    entries += [('chapters', row.id, row.name, True)
+                for row in db.session.query(Chapters.id, Chapters.name)]
+    entries += [('quizzes', row.id, row.name, row.is_active is not False)
+                for row in db.session.query(Quizzes.id, Quizzes.name, Quizzes.is_active)]
+    index.replace(entries, version)
+    logger.info(f"Built typeahead index with {len(entries)} names")
+
+
+def _sync():
+    """Rebuild if another process changed the catalog since the last check"""
+    if time.monotonic() - index.synced_at < SYNC_SECONDS:
+        return
+    version = _catalog_version()
+    if version != index.catalog_version:
+        build()
+    else:
+        index.synced_at = time.monotonic()
+
+
+def complete(prefix, limit=8, kinds=KINDS, include_inactive=False):
+    """Top completions of a prefix, see TypeaheadIndex.complete"""
+    _sync()
+    return index.complete(prefix, limit, kinds, include_inactive)
+
+
+def upsert(kind, entry_id, name, active=True):
+    """Index a created or renamed name. Call after the write has been committed."""
+    index.upsert(kind, entry_id, name, active)
+    _names_changed()
+
+
+def remove(kind, entry_id):
+    """Drop a deleted entry. Call after the delete has been committed."""
+    index.remove(kind, entry_id)
+    _names_changed()
@@ -0,0 +1,190 @@
+"""
+Per-user aggregates over Scores.
+
+UserStats holds each user's running totals (attempts, passes, sum and best of
+percentages, time spent) and UserSubjectStats the same per subject, so the
+dashboard and profile endpoints read one row instead of summing every attempt.
+record_scores() updates both inside the transaction that inserts the scores
+(see score_writer.persist_scores). rebuild_user_stats() recomputes them from
+Scores for backfills (`flask --app main rebuild-user-stats`).
+"""
+import logging
+from sqlalchemy import case, func
+from sqlalchemy.dialects.sqlite import insert
+
+from .database import db
+from .models import Users, Quizzes, Chapters, Scores, UserStats, UserSubjectStats
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_user_ids(identities, session=None):
+    """
+    Map Scores.user_id values to Users.id.
+    Submissions store the JWT identity (the user's email), older rows the id.
+    """
+    session = session or db.session
+    user_ids = {}
+    emails = []
+    for identity in set(identities):
+        if isinstance(identity, int) or str(identity).isdigit():
+            user_ids[identity] = int(identity)
+        else:
+            emails.append(identity)
+    if emails:
+        for user_id, email in session.query(Users.id, Users.email).filter(Users.email.in_(emails)):
+            user_ids[email] = user_id
+    return user_ids
+
+
+def scores_owned_by(user_id):
+    """
+    Filter matching a user's Scores rows, whichever identity they were stored
+    under (Users.id or the email JWT identity).
+    """
+    email = db.session.query(Users.email).filter(Users.id == user_id).scalar()
+    if email is None:
+        return Scores.user_id == user_id
+    return Scores.user_id.in_([user_id, email])
+
+
+def _add(totals, score):
+    totals['attempts'] += 1
+    totals['passed'] += 1 if score.passed else 0
+    totals['total_percentage'] += score.percentage or 0
+    totals['best_percentage'] = max(totals['best_percentage'], score.percentage or 0)
+
+
+def _new_totals(**keys):
+    return dict(keys, attempts=0, passed=0, total_percentage=0.0, best_percentage=0.0)
+
+
+def _upsert(table, key_columns, rows, extra_updates=None):
+    """Add rows onto existing totals with INSERT ... ON CONFLICT DO UPDATE"""
+    stmt = insert(table)
+    updates = {
+        'attempts': table.c.attempts + stmt.excluded.attempts,
+        'passed': table.c.passed + stmt.excluded.passed,
+        'total_percentage': table.c.total_percentage + stmt.excluded.total_percentage,
+        'best_percentage': func.max(table.c.best_percentage, stmt.excluded.best_percentage),
+    }
+    for column, build in (extra_updates or {}).items():
+        updates[column] = build(table.c[column], stmt.excluded[column])
+    db.session.execute(stmt.on_conflict_do_update(index_elements=key_columns, set_=updates), rows)
+
+
+def record_scores(scores):
+    """
+    Add freshly inserted scores to UserStats and UserSubjectStats.
+    Runs in the caller's transaction; scores must already be flushed.
+    """
+    if not scores:
+        return
+
+    user_ids = resolve_user_ids(score.user_id for score in scores)
+    subject_ids = dict(
+        db.session.query(Quizzes.id, Chapters.subject_id)
+        .join(Chapters, Quizzes.chapter_id == Chapters.id)
+        .filter(Quizzes.id.in_({score.quiz_id for score in scores}))
+    )
+
+    user_totals = {}
+    subject_totals = {}
+    for score in scores:
+        user_id = user_ids.get(score.user_id)
+        if user_id is None:
+            logger.warning(f"Score {score.id} has unknown user {score.user_id}, not counted in stats")
+            continue
+
+        totals = user_totals.setdefault(
+            user_id, _new_totals(user_id=user_id, time_spent=0, subjects_attempted=0, last_attempt_at=None)
+        )
+        _add(totals, score)
+        totals['time_spent'] += score.time_taken or 0
+        if score.time_stamp_of_attempt and (
+                totals['last_attempt_at'] is None or score.time_stamp_of_attempt > totals['last_attempt_at']):
+            totals['last_attempt_at'] = score.time_stamp_of_attempt
+
+        subject_id = subject_ids.get(score.quiz_id)
+        if subject_id is not None:
+            _add(subject_totals.setdefault(
+                (user_id, subject_id), _new_totals(user_id=user_id, subject_id=subject_id)
+            ), score)
+
+    # Subjects these users had not attempted before this batch
+    if subject_totals:
+        known = set(
+            db.session.query(UserSubjectStats.user_id, UserSubjectStats.subject_id)
+            .filter(UserSubjectStats.user_id.in_(user_totals.keys()))
+        )
+        for user_id, subject_id in subject_totals:
+            if (user_id, subject_id) not in known:
+                user_totals[user_id]['subjects_attempted'] += 1
+        _upsert(UserSubjectStats.__table__, ['user_id', 'subject_id'], list(subject_totals.values()))
+
+    _upsert(UserStats.__table__, ['user_id'], list(user_totals.values()), {
+        'time_spent': lambda current, new: current + new,
+        'subjects_attempted': lambda current, new: current + new,
+        'last_attempt_at': lambda current, new: func.coalesce(func.max(current, new), new),
+    })
+
+
+def get_user_stats(user_id):
+    """UserStats of a user; an empty, unsaved row if they have no attempts"""
+    return db.session.get(UserStats, user_id) or UserStats(
+        user_id=user_id, attempts=0, passed=0, total_percentage=0.0, best_percentage=0.0,
+        time_spent=0, subjects_attempted=0
+    )
+
+
+def rebuild_user_stats(session=None):
+    """
+    Recompute UserStats and UserSubjectStats from the Scores table.
+    Commits and returns the number of users with stats.
+    """
+    session = session or db.session
+    owner = (Scores.user_id == Users.id) | (Scores.user_id == Users.email)
+    totals = (
+        func.count(Scores.id),
+        func.sum(case((Scores.passed == True, 1), else_=0)),
+        func.coalesce(func.sum(Scores.percentage), 0.0),
+        func.coalesce(func.max(Scores.percentage), 0.0),
+    )
+
+    subject_rows = (
+        session.query(Users.id, Chapters.subject_id, *totals)
+        .join(Scores, owner)
+        .join(Quizzes, Scores.quiz_id == Quizzes.id)
+        .join(Chapters, Quizzes.chapter_id == Chapters.id)
+        .group_by(Users.id, Chapters.subject_id)
+        .all()
+    )
+    user_rows = (
+        session.query(Users.id, *totals,
+                      func.coalesce(func.sum(Scores.time_taken), 0),
+                      func.max(Scores.time_stamp_of_attempt))
+        .join(Scores, owner)
+        .group_by(Users.id)
+        .all()
+    )
+
+    subjects_attempted = {}
+    for row in subject_rows:
+        subjects_attempted[row[0]] = subjects_attempted.get(row[0], 0) + 1
+
+    session.query(UserSubjectStats).delete(synchronize_session=False)
+    session.query(UserStats).delete(synchronize_session=False)
+    session.add_all(
+        UserSubjectStats(user_id=user_id, subject_id=subject_id, attempts=attempts, passed=passed,
+                         total_percentage=total, best_percentage=best)
+        for user_id, subject_id, attempts, passed, total, best in subject_rows
+    )
+    session.add_all(
+        UserStats(user_id=user_id, attempts=attempts, passed=passed, total_percentage=total,
+                  best_percentage=best, time_spent=time_spent, last_attempt_at=last_attempt_at,
+                  subjects_attempted=subjects_attempted.get(user_id, 0))
+        for user_id, attempts, passed, total, best, time_spent, last_attempt_at in user_rows
+    )
+    session.commit()
+    logger.info(f"Rebuilt stats for {len(user_rows)} users")
+    return len(user_rows)
@@ -0,0 +1,56 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+The scripts build a throwaway Flask app bound to a scratch SQLite database so
+they never touch instance/database.sqlite3.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Make the `application` package importable when run as `python benchmarks/x.py`
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import event
+from application.database import db
+
+
+def make_app(db_uri='sqlite://', **config):
+    """Create a minimal app with the models registered and tables created"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config)
+    db.init_app(app)
+    with app.app_context():
+        from application import models  # noqa: F401  (registers the tables)
+        db.create_all()
+    return app
+
+
+class QueryCounter:
+    """Count statements sent to the database while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+@contextmanager
+def timed(label, results):
+    """Record the wall-clock time of the block in results[label] (ms)"""
+    start = time.perf_counter()
+    yield
+    results[label] = (time.perf_counter() - start) * 1000
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory, time and size of the user quiz export.
+
+Seeds one user with many attempts and compares the previous export (every
+(Score, Quiz, Chapter, Subject) tuple loaded with .all() before writing)
+with the streaming export from application.exports in every available
+format (parquet and arrow need pyarrow). Peak memory is measured with
+tracemalloc.
+
+Usage:
+    python benchmarks/bench_export.py [num_attempts]
+"""
+import csv
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from _support import make_app, timed
+from application.database import db
+from application.models import Users, Subjects, Chapters, Quizzes, Scores
+from application import exports
+from application.export_writers import available_formats
+
+
+def seed(num_attempts):
+    user = Users(email='bench@example.com', username='bench', password='x', dob=date(2000, 1, 1),
+                 qualification='Benchmark')
+    subject = Subjects(name='Benchmark Subject')
+    db.session.add_all([user, subject])
+    db.session.flush()
+    chapter = Chapters(subject_id=subject.id, name='Benchmark Chapter')
+    db.session.add(chapter)
+    db.session.flush()
+    quizzes = [Quizzes(chapter_id=chapter.id, name=f'Quiz {i}', remarks='Benchmark quiz') for i in range(50)]
+    db.session.add_all(quizzes)
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    db.session.execute(Scores.__table__.insert(), [{
+        'user_id': user.email,
+        'quiz_id': quizzes[i % 50].id,
+        'time_stamp_of_attempt': start + timedelta(minutes=i),
+        'total_scored': i % 10,
+        'total_possible_score': 10,
+        'percentage': (i % 10) * 10.0,
+        'passed': i % 10 >= 6,
+        'time_taken': 60 + i % 300
+    } for i in range(num_attempts)])
+    db.session.commit()
+    return user.id
+
+
+def legacy_export(user_id, path):
+    """The export before streaming: load everything, then write"""
+    user = db.session.query(Users).filter(Users.id == user_id).first()
+    scores = db.session.query(Scores, Quizzes, Chapters, Subjects)\
+        .join(Quizzes, Scores.quiz_id == Quizzes.id)\
+        .join(Chapters, Quizzes.chapter_id == Chapters.id)\
+        .join(Subjects, Chapters.subject_id == Subjects.id)\
+        .filter(Scores.user_id == user.email)\
+        .order_by(Scores.time_stamp_of_attempt.desc())\
+        .all()
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow([label for _, label, _ in exports.USER_QUIZ_FIELDS])
+        for score, quiz, chapter, subject in scores:
+            writer.writerow([quiz.id, quiz.name, chapter.id, chapter.name, subject.id, subject.name,
+                             quiz.date_of_quiz, score.time_stamp_of_attempt, score.total_scored,
+                             score.total_possible_score, score.percentage, score.passed,
+                             score.time_taken, score.time_taken, quiz.remarks])
+    return len(scores)
+
+
+def measure(label, function, path):
+    results = {}
+    db.session.expire_all()
+    tracemalloc.start()
+    with timed(label, results):
+        rows = function(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    size = os.path.getsize(path)
+    print(f"{label:<12} | {rows:>8} rows | {results[label]:>8.0f} ms | peak {peak / 2**20:>7.1f} MiB | "
+          f"file {size / 2**20:>6.1f} MiB")
+
+
+def run(num_attempts):
+    app = make_app()
+    with app.app_context(), tempfile.TemporaryDirectory() as directory:
+        user_id = seed(num_attempts)
+        measure('legacy', lambda path: legacy_export(user_id, path), os.path.join(directory, 'legacy.csv'))
+        for export_format in available_formats():
+            measure(export_format,
+                    lambda path: exports.export_user_quizzes(db.session, user_id, path, export_format),
+                    os.path.join(directory, f'stream.{export_format}'))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
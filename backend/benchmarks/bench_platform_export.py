@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: platform export throughput, one writer vs. parallel partitions.
+
+Seeds a scratch SQLite file with many scores and writes the platform export
+(application.exports.PLATFORM_FIELDS) once as a single partition and once
+split into id ranges written by a pool of processes, standing in for Celery
+workers, followed by the merge step.
+
+Usage:
+    python benchmarks/bench_platform_export.py [num_scores] [workers] [format]
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from _support import make_app
+from application.database import db
+from application.models import Users, Subjects, Chapters, Quizzes, Scores
+from application import exports
+from application.export_writers import write_export, merge_exports
+
+USERS = 2000
+
+
+def seed(num_scores):
+    rng = random.Random(7)
+    users = [Users(email=f'user{i}@example.com', username=f'user{i}', password='x', dob=date(2000, 1, 1),
+                   qualification='Benchmark') for i in range(USERS)]
+    subjects = [Subjects(name=f'Subject {i}') for i in range(10)]
+    db.session.add_all(users + subjects)
+    db.session.flush()
+    chapters = [Chapters(subject_id=subjects[i % 10].id, name=f'Chapter {i}') for i in range(50)]
+    db.session.add_all(chapters)
+    db.session.flush()
+    quizzes = [Quizzes(chapter_id=chapters[i % 50].id, name=f'Quiz {i}') for i in range(500)]
+    db.session.add_all(quizzes)
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    batch = 50_000
+    for offset in range(0, num_scores, batch):
+        db.session.execute(Scores.__table__.insert(), [{
+            # Half the rows store the email identity, half the id, as in production data
+            'user_id': users[i % USERS].email if i % 2 else users[i % USERS].id,
+            'quiz_id': quizzes[rng.randrange(500)].id,
+            'time_stamp_of_attempt': start + timedelta(seconds=i),
+            'total_scored': i % 10,
+            'total_possible_score': 10,
+            'percentage': (i % 10) * 10.0,
+            'passed': i % 10 >= 6,
+            'time_taken': 60 + i % 300
+        } for i in range(offset, min(offset + batch, num_scores))])
+    db.session.commit()
+
+
+def write_partition(args):
+    db_uri, export_format, index, first_id, last_id, directory = args
+    app = make_app(db_uri)
+    with app.app_context():
+        path = os.path.join(directory, f'part-{index:05d}')
+        rows = write_export(path, export_format, exports.PLATFORM_FIELDS,
+                            exports.platform_rows(db.session, first_id, last_id), header=False)
+        db.session.remove()
+    return path, rows
+
+
+def run(num_scores, workers, export_format):
+    with tempfile.TemporaryDirectory() as directory:
+        db_uri = f"sqlite:///{os.path.join(directory, 'bench.sqlite3')}"
+        app = make_app(db_uri)
+        with app.app_context():
+            started = time.perf_counter()
+            seed(num_scores)
+            print(f"{num_scores} scores seeded in {time.perf_counter() - started:.1f}s, format {export_format}")
+            single = exports.platform_partitions(db.session, num_scores)
+            split = exports.platform_partitions(db.session, -(-num_scores // (workers * 2)))
+            db.session.remove()
+
+        for label, partitions, processes in (('1 writer', single, 1), (f'{workers} workers', split, workers)):
+            started = time.perf_counter()
+            jobs = [(db_uri, export_format, index, first_id, last_id, directory)
+                    for index, (first_id, last_id, _) in enumerate(partitions)]
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                written = pool.map(write_partition, jobs)
+            partitioned = time.perf_counter() - started
+            target = os.path.join(directory, f'export-{processes}.{export_format}')
+            merge_exports(export_format, exports.PLATFORM_FIELDS, [path for path, _ in written], target)
+            total = time.perf_counter() - started
+            rows = sum(count for _, count in written)
+            for path, _ in written:
+                os.remove(path)
+            print(f"{label:<10} | {len(partitions):>3} partitions | {rows} rows | write {partitioned:6.1f}s | "
+                  f"with merge {total:6.1f}s | {rows / total:>9,.0f} rows/s | "
+                  f"{os.path.getsize(target) / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else max(2, min(8, os.cpu_count() or 2)),
+        sys.argv[3] if len(sys.argv) > 3 else 'csv.gz')
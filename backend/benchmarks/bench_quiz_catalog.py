@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: quiz catalog query count as the catalog grows.
+
+Compares the old per-quiz lazy-loading loop of GET /api/quizzes with
+get_quiz_catalog(), which should issue a constant number of SELECTs.
+
+Usage:
+    python benchmarks/bench_quiz_catalog.py [sizes...]
+"""
+import sys
+
+from _support import make_app, QueryCounter, timed
+from application.database import db
+from application.models import Subjects, Chapters, Quizzes, Questions
+from application.apis.quizzes import get_quiz_catalog
+
+
+def seed(num_quizzes, questions_per_quiz=5):
+    subject = Subjects(name='Benchmark Subject')
+    db.session.add(subject)
+    db.session.flush()
+    chapters = [Chapters(subject_id=subject.id, name=f'Chapter {i}') for i in range(20)]
+    db.session.add_all(chapters)
+    db.session.flush()
+    for i in range(num_quizzes):
+        quiz = Quizzes(chapter_id=chapters[i % len(chapters)].id, name=f'Quiz {i}',
+                       passing_score=60.0, total_questions=questions_per_quiz)
+        db.session.add(quiz)
+        db.session.flush()
+        db.session.add_all([
+            Questions(quiz_id=quiz.id, question_statement=f'Q{j}', option1='a', option2='b',
+                      option3='c', option4='d', correct_option=1)
+            for j in range(questions_per_quiz)
+        ])
+    db.session.commit()
+
+
+def legacy_catalog():
+    """The pre-optimisation loop from GET /api/quizzes"""
+    quiz_list = []
+    for quiz in Quizzes.query.all():
+        quiz_data = quiz.serialize()
+        if quiz.chapter:
+            quiz_data['chapter_name'] = quiz.chapter.name
+            if quiz.chapter.subject:
+                quiz_data['subject_name'] = quiz.chapter.subject.name
+        quiz_data['questions_count'] = len(quiz.questions)
+        quiz_list.append(quiz_data)
+    return quiz_list
+
+
+def run(size):
+    app = make_app()
+    with app.app_context():
+        seed(size)
+        results = {}
+        db.session.expire_all()
+        with QueryCounter(db.engine) as legacy_queries, timed('legacy', results):
+            legacy = legacy_catalog()
+        db.session.expire_all()
+        with QueryCounter(db.engine) as catalog_queries, timed('catalog', results):
+            catalog = get_quiz_catalog()
+        with QueryCounter(db.engine) as page_queries, timed('page', results):
+            get_quiz_catalog(after_id=size // 2, limit=50)
+        assert legacy == catalog, 'catalog payload differs from the legacy payload'
+        print(f"{size:>6} quizzes | legacy: {legacy_queries.count:>6} queries {results['legacy']:8.1f} ms"
+              f" | catalog: {catalog_queries.count:>2} queries {results['catalog']:8.1f} ms"
+              f" | keyset page: {page_queries.count:>2} queries {results['page']:6.1f} ms")
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 500, 2000]
+    for size in sizes:
+        run(size)
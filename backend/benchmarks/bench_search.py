@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/search against a large question bank.
+
+Seeds a synthetic bank (default 100k questions) and compares the old
+substring search (ILIKE '%term%' over every text column, no limit) with the
+FTS5 index from search_index, for common, rare, prefix, multi-term and
+misspelled queries.
+
+Usage:
+    python benchmarks/bench_search.py [num_questions]
+"""
+import random
+import sys
+from itertools import accumulate
+
+from _support import make_app, timed
+from sqlalchemy import or_
+from application.database import db
+from application.models import Subjects, Chapters, Quizzes, Questions
+from application import search_index
+
+WORDS = 5000
+QUESTIONS_PER_QUIZ = 20
+
+
+def vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def seed(num_questions, words, rng):
+    subject = Subjects(name='Benchmark Subject')
+    db.session.add(subject)
+    db.session.flush()
+    chapters = [Chapters(subject_id=subject.id, name=f'Chapter {" ".join(rng.sample(words, 2))}')
+                for _ in range(50)]
+    db.session.add_all(chapters)
+    db.session.flush()
+    quizzes = [Quizzes(chapter_id=chapters[i % len(chapters)].id, name=f'Quiz {" ".join(rng.sample(words, 2))}',
+                       passing_score=60.0)
+               for i in range(num_questions // QUESTIONS_PER_QUIZ)]
+    db.session.add_all(quizzes)
+    db.session.flush()
+
+    # Zipf-like word frequencies, so some terms are common and most are rare
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+    def sentence(length):
+        return ' '.join(rng.choices(words, cum_weights=cum_weights, k=length))
+
+    db.session.execute(Questions.__table__.insert(), [{
+        'quiz_id': quizzes[i // QUESTIONS_PER_QUIZ].id,
+        'question_statement': sentence(12),
+        'option1': sentence(3), 'option2': sentence(3), 'option3': sentence(3), 'option4': sentence(3),
+        'correct_option': 1
+    } for i in range(num_questions)])
+    db.session.commit()
+
+
+def legacy_search(query):
+    """The pre-index /api/search queries"""
+    term = f'%{query}%'
+    return (
+        Questions.query.filter(or_(Questions.question_statement.ilike(term), Questions.option1.ilike(term),
+                                   Questions.option2.ilike(term), Questions.option3.ilike(term),
+                                   Questions.option4.ilike(term))).all(),
+        Subjects.query.filter(or_(Subjects.name.ilike(term), Subjects.description.ilike(term))).all(),
+        Chapters.query.filter(or_(Chapters.name.ilike(term), Chapters.description.ilike(term))).all(),
+        Quizzes.query.filter(or_(Quizzes.name.ilike(term), Quizzes.description.ilike(term),
+                                 Quizzes.remarks.ilike(term))).all(),
+    )
+
+
+def run(num_questions):
+    rng = random.Random(42)
+    words = vocabulary(WORDS, rng)
+    app = make_app()
+    with app.app_context():
+        results = {}
+        with timed('seed', results):
+            seed(num_questions, words, rng)
+        with timed('index', results):
+            with db.engine.begin() as connection:
+                search_index.ensure_search_index(connection)
+        print(f"{num_questions} questions: seeded in {results['seed']:.0f} ms, indexed in {results['index']:.0f} ms")
+
+        common, rare = words[0], words[-1]
+        typo = rare[:2] + rare[3] + rare[2] + rare[4:]  # swap two letters
+        queries = {
+            'common term': common,
+            'rare term': rare,
+            'prefix': rare[:4],
+            'two terms': f'{common} {words[1]} ',
+            'misspelled': typo,
+        }
+        print(f"{'query':<12} | {'legacy rows':>11} {'legacy ms':>10} | {'fts total':>9} {'fts ms':>8}")
+        for label, query in queries.items():
+            db.session.expire_all()
+            with timed('legacy', results):
+                legacy_rows = sum(len(rows) for rows in legacy_search(query))
+            with timed('fts', results):
+                found = search_index.search(query, limit=10)
+            total = sum(total for total, _ in found['results'].values())
+            print(f"{label:<12} | {legacy_rows:>11} {results['legacy']:>10.1f} | {total:>9} {results['fts']:>8.1f}")
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
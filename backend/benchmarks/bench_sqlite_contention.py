@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent quiz submissions alongside analytics reads on SQLite.
+
+Runs the same workload against a database file twice: once with a plain
+engine (rollback journal, pysqlite's 5 s default timeout) and once with the
+tuning profile from application/config.py (WAL, synchronous=NORMAL, cache,
+mmap and busy timeout). Reports committed submissions, completed reads and
+"database is locked" errors for each profile.
+
+Usage:
+    python benchmarks/bench_sqlite_contention.py [--writers 16] [--readers 4] [--seconds 10]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from _support import make_app
+from application.config import Config
+from application.database import db, create_tuned_engine
+from application.models import Subjects, Chapters, Quizzes, Scores
+
+
+def seed(db_uri, num_quizzes=50, num_scores=20000):
+    app = make_app(db_uri)
+    with app.app_context():
+        subject = Subjects(name='Benchmark Subject')
+        db.session.add(subject)
+        db.session.flush()
+        chapter = Chapters(subject_id=subject.id, name='Chapter')
+        db.session.add(chapter)
+        db.session.flush()
+        db.session.add_all([Quizzes(chapter_id=chapter.id, name=f'Quiz {i}', passing_score=60.0)
+                            for i in range(num_quizzes)])
+        db.session.flush()
+        db.session.bulk_insert_mappings(Scores, [{
+            'user_id': random.randint(1, 500),
+            'quiz_id': random.randint(1, num_quizzes),
+            'time_stamp_of_attempt': datetime.utcnow(),
+            'total_scored': 5, 'total_possible_score': 10, 'time_taken': 60,
+            'percentage': random.uniform(0, 100), 'passed': True
+        } for _ in range(num_scores)])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def run_profile(name, engine, writers, readers, seconds):
+    Session = sessionmaker(bind=engine)
+    stop = threading.Event()
+    counts = {'submits': 0, 'reads': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        while not stop.is_set():
+            session = Session()
+            try:
+                session.add(Scores(user_id=random.randint(1, 500), quiz_id=random.randint(1, 50),
+                                   time_stamp_of_attempt=datetime.utcnow(), total_scored=5,
+                                   total_possible_score=10, time_taken=60, percentage=50.0, passed=False))
+                session.commit()
+                bump('submits')
+            except OperationalError:
+                session.rollback()
+                bump('locked')
+            finally:
+                session.close()
+
+    def reader():
+        while not stop.is_set():
+            session = Session()
+            try:
+                session.query(func.date(Scores.time_stamp_of_attempt), func.count(Scores.id),
+                              func.avg(Scores.percentage))\
+                    .group_by(func.date(Scores.time_stamp_of_attempt)).all()
+                bump('reads')
+            except OperationalError:
+                bump('locked')
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)] + \
+              [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    print(f"{name:>8}: {counts['submits'] / seconds:8.1f} submits/s  {counts['reads'] / seconds:6.1f} reads/s"
+          f"  {counts['locked']:5d} lock errors")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    config = {key: getattr(Config, key) for key in dir(Config) if key.startswith('SQLITE_')}
+    pool_options = {'pool_size': args.writers + args.readers, 'max_overflow': 0}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ('baseline', 'tuned'):
+            db_uri = f"sqlite:///{os.path.join(tmp, name + '.sqlite3')}"
+            seed(db_uri)
+            if name == 'baseline':
+                engine = create_engine(db_uri, connect_args={'check_same_thread': False}, **pool_options)
+            else:
+                engine = create_tuned_engine(db_uri, config, **pool_options)
+            run_profile(name, engine, args.writers, args.readers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
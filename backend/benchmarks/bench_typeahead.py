@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark: typeahead completion latency as the catalog grows.
+
+Builds the in-memory index from a scratch catalog and times top-8
+completions for short (many matches) and longer (few matches) prefixes.
+
+Usage:
+    python benchmarks/bench_typeahead.py [sizes...]
+"""
+import sys
+import time
+
+from _support import make_app, timed
+from application.database import db
+from application.models import Subjects, Chapters, Quizzes
+from application import typeahead
+
+LOOKUPS = 2000
+TOPICS = ['Algebra', 'Geometry', 'Calculus', 'Statistics', 'Probability', 'Trigonometry',
+          'Mechanics', 'Optics', 'Thermodynamics', 'Organic Chemistry', 'Genetics', 'Ecology']
+
+
+def seed(num_quizzes):
+    subjects = [Subjects(name=f'Subject {i}') for i in range(10)]
+    db.session.add_all(subjects)
+    db.session.flush()
+    chapters = [Chapters(subject_id=subjects[i % 10].id, name=f'{TOPICS[i % len(TOPICS)]} part {i}')
+                for i in range(100)]
+    db.session.add_all(chapters)
+    db.session.flush()
+    db.session.execute(Quizzes.__table__.insert(), [{
+        'chapter_id': chapters[i % 100].id,
+        'name': f'{TOPICS[i % len(TOPICS)]} practice quiz {i}',
+        'is_active': True
+    } for i in range(num_quizzes)])
+    db.session.commit()
+
+
+def run(size):
+    app = make_app()
+    with app.app_context():
+        seed(size)
+        results = {}
+        with timed('build', results):
+            typeahead.build()
+        timings = []
+        for prefix in ('a', 'alg', 'algebra practice quiz 1', 'quiz 99'):
+            start = time.perf_counter()
+            for _ in range(LOOKUPS):
+                typeahead.index.complete(prefix, 8)
+            timings.append(f"'{prefix}' {(time.perf_counter() - start) / LOOKUPS * 1000:.3f} ms")
+        print(f"{size:>7} quizzes | build {results['build']:7.1f} ms | " + ' | '.join(timings))
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,107 @@
+"""
+Regression check: hot queries must be served by an index.
+
+Runs EXPLAIN QUERY PLAN for the query shapes used by the dashboard, quiz,
+analytics and export code and exits non-zero if any of them falls back to a
+full scan of Scores, Questions, Quizzes or Chapters.
+
+    python benchmarks/check_query_plans.py
+"""
+import sys
+from datetime import datetime, timedelta
+
+from _support import make_app
+from sqlalchemy import func, select
+from application.database import db
+from application.models import Chapters, Questions, Quizzes, Scores
+
+HOT_TABLES = ('Scores', 'Questions', 'Quizzes', 'Chapters')
+
+
+def hot_queries():
+    """(label, statement) pairs mirroring the queries issued by the API"""
+    since = datetime.utcnow() - timedelta(days=30)
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_end = month_start + timedelta(days=31)
+
+    return [
+        ('recent scores of a user',
+         select(Scores).where(Scores.user_id == 1)
+         .order_by(Scores.time_stamp_of_attempt.desc()).limit(5)),
+        ('recent scores by id or email',
+         select(Scores).where((Scores.user_id == 1) | (Scores.user_id == 'user@example.com'))
+         .order_by(Scores.time_stamp_of_attempt.desc()).limit(5)),
+        ('monthly report of a user',
+         select(Scores).where(Scores.user_id == 1,
+                              Scores.time_stamp_of_attempt >= month_start,
+                              Scores.time_stamp_of_attempt < month_end)),
+        ('attempts of a user on a quiz',
+         select(Scores).where(Scores.quiz_id == 1, Scores.user_id == 1)
+         .order_by(Scores.time_stamp_of_attempt.desc())),
+        ('attempts of a quiz',
+         select(Scores).where(Scores.quiz_id == 1)),
+        ('quizzes attempted by a user',
+         select(Scores.quiz_id).where(Scores.user_id == 1).distinct()),
+        ('platform activity since a date',
+         select(func.date(Scores.time_stamp_of_attempt), func.count(Scores.id))
+         .where(Scores.time_stamp_of_attempt >= since)
+         .group_by(func.date(Scores.time_stamp_of_attempt))),
+        ('questions of a quiz',
+         select(Questions).where(Questions.quiz_id == 1).order_by(Questions.id)),
+        ('question count of a quiz',
+         select(func.count(Questions.id)).where(Questions.quiz_id == 1)),
+        ('quizzes of a chapter',
+         select(Quizzes).where(Quizzes.chapter_id == 1)),
+        ('chapters of a subject',
+         select(Chapters).where(Chapters.subject_id == 1).order_by(Chapters.order)),
+        ('attempt lookup',
+         select(Scores.id).where(Scores.attempt_id == 'abc')),
+    ]
+
+
+def explain(connection, statement):
+    """Plan detail lines for a statement, bound with its own parameters"""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def full_scans(plan):
+    """Plan lines that read a hot table without any index"""
+    return [
+        line for line in plan
+        if any(line == f'SCAN {table}'
+               or (line.startswith(f'SCAN {table} ') and 'INDEX' not in line)
+               for table in HOT_TABLES)
+    ]
+
+
+def main():
+    app = make_app()
+    failures = 0
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            for label, statement in hot_queries():
+                plan = explain(connection, statement)
+                scans = full_scans(plan)
+                status = 'FULL SCAN' if scans else 'ok'
+                print(f"{status:>9}  {label}: {'; '.join(plan)}")
+                failures += bool(scans)
+        finally:
+            connection.close()
+
+    if failures:
+        print(f"\n{failures} hot queries fall back to a full table scan")
+        return 1
+    print('\nAll hot queries use an index')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
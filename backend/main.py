@@ -1,7 +1,8 @@
 from flask import Flask, jsonify, request
 from application.config import LocalDevelopmentConfig
-from application.database import db
+from application.database import db, init_db
 from application.cache import init_redis
+from application.score_writer import init_score_writer
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
@@ -65,8 +66,8 @@ def create_app():
     bcrypt = Bcrypt(app)
     jwt = JWTManager(app)
     
-    # Database initialization
-    db.init_app(app)
+    # Database initialization (applies the SQLite tuning profile)
+    init_db(app)
     
     # Initialize Redis (will gracefully handle if Redis is not running)
     init_redis(app)
@@ -84,6 +85,22 @@ def create_app():
             'task': 'application.celery_tasks.send_monthly_reports',
             'schedule': 10,  # Every 3 minutes for testing
             # 'schedule': crontab(day_of_month=1, hour=0, minute=0),  # 1st of month at midnight (original)
+        },
+        'refresh-analytics-rollups': {
+            'task': 'application.celery_tasks.refresh_analytics_rollups',
+            'schedule': crontab(minute=5),  # Hourly, re-derives today and yesterday
+        },
+        'refresh-platform-averages': {
+            'task': 'application.celery_tasks.refresh_platform_averages',
+            'schedule': 300,  # Shared by every user's performance comparison
+        },
+        'rebuild-leaderboards': {
+            'task': 'application.celery_tasks.rebuild_leaderboards',
+            'schedule': crontab(hour=3, minute=30),  # Nightly resync of the Redis sorted sets
+        },
+        'clean-export-files': {
+            'task': 'application.celery_tasks.clean_export_files',
+            'schedule': crontab(minute=15),  # Hourly retention and quota sweep of instance/exports
         }
     }
     
@@ -95,6 +112,30 @@ def create_app():
         # Create all database tables
         db.create_all()
         
+        # Add columns and indexes introduced after the tables were created
+        from application.migrations import upgrade_schema
+        upgrade_schema()
+        
+        # Bring denormalized question counters in line with the Questions table
+        if Quizzes.resync_question_counts():
+            from application.quiz_cache import invalidate_catalog
+            invalidate_catalog()
+        
+        # Backfill per-user statistics for databases that predate UserStats
+        from application.models import UserStats
+        from application.user_stats import rebuild_user_stats
+        if not UserStats.query.first() and Scores.query.first():
+            rebuild_user_stats()
+        
+        # Same for the daily analytics rollups
+        from application.rollups import rebuild_rollups, rollups_need_backfill
+        if rollups_need_backfill():
+            rebuild_rollups()
+        
+        # In-memory name index for /api/search/typeahead
+        from application import typeahead
+        typeahead.build()
+        
         # Create default admin user if it doesn't exist
         admin_user = Users.query.filter_by(email='admin@email.com').first()
         if not admin_user:
@@ -105,6 +146,9 @@ def create_app():
             )
             logger.info("Default admin user created: admin@email.com / admin")
     
+    # Optional write-behind persistence for quiz submissions
+    init_score_writer(app)
+    
     # Push app context as per documentation pattern
     app.app_context().push()
     
@@ -123,6 +167,7 @@ from application.apis.analytics import create_analytics_routes
 from application.apis.search import create_search_routes
 from application.apis.exports import register_export_routes
 from application.apis.dashboard import create_dashboard_routes
+from application.apis.cache_admin import register_cache_admin_routes
 
 register_user_routes(app)
 register_subject_routes(app)
@@ -133,6 +178,7 @@ create_analytics_routes(app)
 create_search_routes(app)
 register_export_routes(app)
 create_dashboard_routes(app)
+register_cache_admin_routes(app)
 
 @app.route('/api/test', methods=['GET'])
 def test_route():
@@ -141,6 +187,27 @@ def test_route():
         'timestamp': datetime.utcnow().isoformat()
     })
 
+@app.cli.command('rebuild-user-stats')
+def rebuild_user_stats_command():
+    """Recompute per-user statistics from the Scores table"""
+    from application.user_stats import rebuild_user_stats
+    count = rebuild_user_stats()
+    print(f"Rebuilt statistics for {count} users")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the daily analytics rollups from Scores and Users"""
+    from application.rollups import rebuild_rollups
+    days = rebuild_rollups()
+    print(f"Rebuilt analytics rollups for {days} days")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text search indexes from their source tables"""
+    from application.search_index import rebuild_search_index
+    rebuild_search_index()
+    print("Rebuilt search indexes")
+
 if __name__ == '__main__':
     # CRITICAL FIX: Update celery configuration with app config HERE
     # This matches the pattern used by the working implementation
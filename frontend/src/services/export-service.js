@@ -104,6 +104,42 @@ class ExportService {
     }
   }
 
+  /**
+   * Follow the progress of an export task as server-sent events
+   * @param {string} taskId - The ID of the export task
+   * @param {string} streamToken - The task-scoped stream token returned with the task ID
+   * @param {Function} onEvent - Called with each progress payload
+   * @param {Function} onError - Called if the stream cannot be used
+   * @returns {EventSource|null} The open stream, or null if unsupported
+   */
+  streamStatus(taskId, streamToken, onEvent, onError) {
+    if (!streamToken || typeof EventSource === 'undefined') {
+      return null
+    }
+
+    // EventSource cannot send an Authorization header, so pass the short-lived
+    // stream token (never the session token) in the query string
+    const url = `${api.defaults.baseURL}/api/exports/stream/${taskId}?token=${encodeURIComponent(streamToken)}`
+    const source = new EventSource(url)
+    const handle = (event) => {
+      const data = JSON.parse(event.data)
+      onEvent(data)
+      if (['completed', 'failed'].includes(data.state)) {
+        source.close()
+      }
+    }
+    ;['pending', 'in_progress', 'completed', 'failed'].forEach(state => {
+      source.addEventListener(state, handle)
+    })
+    source.onerror = (error) => {
+      // EventSource reconnects on its own unless the server refused the stream
+      if (source.readyState === EventSource.CLOSED) {
+        onError(error)
+      }
+    }
+    return source
+  }
+
   /**
    * Download a completed export file
    * @param {string} filename - The name of the export file